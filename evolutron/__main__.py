@@ -1,4 +1,4 @@
-import pyximport; pyximport.install()
+import extensions; extensions.install()
 
 import os
 import sys
@@ -10,13 +10,6 @@ import traceback
 import random
 random.seed(102)
 
-import pygame
-from pygame.locals import *
-
-import tiles
-import characters
-import window as _window
-
 def main():
     parser = argparse.ArgumentParser(description='An evolution simulator')
     parser.add_argument(
@@ -33,9 +26,182 @@ def main():
     parser.add_argument(
         '--inspect', metavar='f', dest='inspect', action='store', default=None,
         help='Run inspector for the given file')
+    parser.add_argument(
+        '--batch', metavar='f', dest='batch', nargs='+', default=None,
+        help='Evaluate the brains in the given dump files (or directories of '
+             'active-*.json files) over a grid of inputs, headless')
+    parser.add_argument(
+        '--batch-sweep', metavar='spec', dest='batch_sweep', action='append',
+        default=[],
+        help='Input values for --batch, as name=start:stop:steps or '
+             'name=v1,v2,...; may be repeated')
+    parser.add_argument(
+        '--batch-out', metavar='f', dest='batch_out', default='-',
+        help='CSV file for --batch results (default: stdout)')
+    parser.add_argument(
+        '--batch-summary', dest='batch_summary', action='store_true',
+        default=False,
+        help='Write per-brain output statistics instead of the full table')
+    parser.add_argument(
+        '--batch-heatmap', metavar='f', dest='batch_heatmap', default=None,
+        help='Also save a heatmap image of one output for --batch')
+    parser.add_argument(
+        '--batch-heatmap-output', dest='batch_heatmap_output',
+        default='impulse', choices=('angle_change', 'impulse', 'spawn'),
+        help='Output shown by --batch-heatmap')
+    parser.add_argument(
+        '--headless', dest='headless', action='store_true', default=False,
+        help='Run without a display or rendering')
+    parser.add_argument(
+        '--control', metavar='address', dest='control', default=None,
+        help='Serve control commands and metrics on a Unix socket path, '
+             'or a localhost TCP port (port or host:port); checkpoints '
+             'requested through it are written to checkpoints/')
+    parser.add_argument(
+        '--stream-viewer', dest='stream_viewer', action='store_true',
+        default=False,
+        help='Also draw the world in a separate viewer process, fed with '
+             'per-tick deltas')
+    parser.add_argument(
+        '--scenario', metavar='name', dest='scenario', default=None,
+        help='Start from a stress scenario (forest, crowd, predators, '
+             'meadow or sparse; see scenarios.py) or a fixture saved with '
+             '--scenario-save, instead of a random world')
+    parser.add_argument(
+        '--scenario-seed', metavar='n', dest='scenario_seed', type=int,
+        default=0,
+        help='Seed to build --scenario with (default: 0)')
+    parser.add_argument(
+        '--scenario-save', metavar='f', dest='scenario_save', default=None,
+        help='Save the --scenario fixture as JSON to f and exit')
+    parser.add_argument(
+        '--share-population', metavar='name', dest='share_population',
+        default=None,
+        help='Publish the live population every tick into a shared memory '
+             'block with this name, for other processes to read with '
+             'sharedpop.PopulationReader')
+    parser.add_argument(
+        '--share-population-capacity', metavar='n',
+        dest='share_population_capacity', type=int, default=4096,
+        help='Creatures the --share-population block has room for '
+             '(default: 4096)')
+    parser.add_argument(
+        '--world-size', metavar='WxH', dest='world_size', default='2000x2000',
+        help='World size in pixels; worlds too big for memory are paged '
+             'in and out in chunks (default: 2000x2000)')
+    parser.add_argument(
+        '--memreport', metavar='n', dest='memreport', nargs='?', type=int,
+        const=0, default=None,
+        help='Trace memory allocations, and print a memory report every n '
+             'ticks if n is given; press m for one at any time')
+    parser.add_argument(
+        '--set', metavar='name=value', dest='set', action='append',
+        default=[],
+        help='Change a simulation parameter (see config.py); may be repeated')
+    parser.add_argument(
+        '--sweep', metavar='spec', dest='sweep', action='append', default=[],
+        help='Run headless simulations for each value of a parameter, as '
+             'name=start:stop:steps or name=v1,v2,...; may be repeated')
+    parser.add_argument(
+        '--sweep-seeds', metavar='n', dest='sweep_seeds', default='3',
+        help='Seeds to run each --sweep configuration with: a count, or '
+             'a comma-separated list (default: 3)')
+    parser.add_argument(
+        '--sweep-ticks', metavar='n', dest='sweep_ticks', type=int,
+        default=5000,
+        help='Stop --sweep runs that have not collapsed or stabilized after '
+             'this many ticks (default: 5000)')
+    parser.add_argument(
+        '--sweep-jobs', metavar='n', dest='sweep_jobs', type=int, default=0,
+        help='Processes to run --sweep with (default: one per core)')
+    parser.add_argument(
+        '--sweep-out', metavar='f', dest='sweep_out', default='-',
+        help='CSV file for --sweep results (default: stdout)')
+    parser.add_argument(
+        '--sweep-summary', dest='sweep_summary', action='store_true',
+        default=False,
+        help='Write --sweep results aggregated over seeds')
+    parser.add_argument(
+        '--difftest', metavar='seeds', dest='difftest', default=None,
+        help='Check the simulation against the slow reference tick in '
+             'reference.py, for a count or comma-separated list of seeds')
+    parser.add_argument(
+        '--difftest-ticks', metavar='n', dest='difftest_ticks', type=int,
+        default=200,
+        help='Ticks to run each --difftest seed for (default: 200)')
+    parser.add_argument(
+        '--difftest-scenarios', metavar='names', dest='difftest_scenarios',
+        default='predators',
+        help='Scenarios, or saved fixtures, to check with --difftest as well '
+             'as the seeded worlds; comma-separated, empty for none '
+             '(default: predators, which breeds early)')
+    parser.add_argument(
+        '--difftest-tolerance', metavar='x', dest='difftest_tolerance',
+        type=float, default=1e-9,
+        help='Relative tolerance for --difftest positions, speeds, headings '
+             'and energies (default: 1e-9)')
+    parser.add_argument(
+        '--benchmark', metavar='name', dest='benchmark', nargs='*',
+        default=None,
+        help='Run the named benchmarks (default: all) and exit')
     args = parser.parse_args()
+    import config
+    try:
+        args.set = [config.parse_set(spec) for spec in args.set]
+        settings = config.Config(**dict(args.set))
+        # converted here, before any worker starts, so that bad values
+        # such as counts swept in fractional steps are reported now
+        args.sweep = [
+            (name, tuple(getattr(config.Config(**{name: value}), name)
+                         for value in values))
+            for name, values in (
+                config.parse_sweep(spec, config.Config.names())
+                for spec in args.sweep)]
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        world_w, world_h = (int(n) for n in args.world_size.split('x'))
+    except ValueError:
+        parser.error('--world-size must be WxH, e.g. 2000x2000')
 
-    if args.screenshot:
+    # Headless commands; these do not need pygame to be imported here.
+    if args.batch:
+        import batchinspect
+        return batchinspect.main(args)
+    if args.sweep:
+        import sweep
+        return sweep.main(args)
+    if args.difftest:
+        import difftest
+        return difftest.main(args)
+    if args.benchmark is not None:
+        import benchmark
+        return benchmark.main(args)
+    fixture = None
+    if args.scenario:
+        import scenarios
+        try:
+            fixture = scenarios.find(args.scenario, args.scenario_seed)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+        if args.scenario_save:
+            scenarios.save(fixture, args.scenario_save)
+            return
+
+    import pygame
+    from pygame.locals import (
+        FULLSCREEN, RESIZABLE, QUIT, KEYDOWN, VIDEORESIZE, MOUSEBUTTONDOWN,
+        MOUSEBUTTONUP, MOUSEMOTION, K_ESCAPE, K_q, K_p, K_r, K_d, K_s, K_m,
+        K_1, K_2, K_3)
+    import window as _window
+    import control
+    import scheduler as _scheduler
+
+    if args.memreport is not None:
+        import tracemalloc
+        tracemalloc.start()
+
+    if args.screenshot or args.headless:
         os.environ['SDL_VIDEODRIVER'] = 'dummy'
     pygame.init()
     pygame.mixer.quit() # Pygame's sound causes static on my computer.
@@ -49,7 +215,13 @@ def main():
         print('running full screen')
         flags = FULLSCREEN
     screen = pygame.display.set_mode((1280, 720), flags, 32)
-    window = _window.Window(screen, 2000, 2000)
+    if fixture is not None:
+        window = _window.Window(
+            screen, fixture['world_w'], fixture['world_h'],
+            scenarios.config(fixture, **dict(args.set)))
+        scenarios.populate(window.world, fixture)
+    else:
+        window = _window.Window(screen, world_w, world_h, settings)
 
     mousedown_pos = None
     mouse_was_dragged = False
@@ -70,37 +242,80 @@ def main():
             window.update()
         return
 
-    tickrate = 1/60.  # target maximum
-    framerate = 1/60. # will never be faster than tick rate
-    last_t = t = time.perf_counter() # py3.3 +
+    state = control.SimState(window, tickrate=1/60.) # target maximum
+    state.render = not args.headless
+    server = None
+    if args.control:
+        try:
+            server = control.ControlServer(args.control)
+        except ValueError as e:
+            parser.error(str(e))
+        server.start()
+        print('control server listening on', args.control)
+    streamer = None
+    if args.stream_viewer:
+        import multiprocessing
+        import stream
+        import viewer
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue(maxsize=30)
+        viewer_process = context.Process(
+            target=viewer.main, args=(messages,), name='viewer')
+        viewer_process.daemon = True
+        viewer_process.start()
+        streamer = state.streamer = stream.Streamer(window.world, messages)
+
+    population = None
+    if args.share_population:
+        import atexit
+        import sharedpop
+        population = sharedpop.PopulationWriter(
+            window.world, args.share_population,
+            args.share_population_capacity)
+        atexit.register(population.close)
+        population.publish()
+        print('population shared as', population.name)
+
+    scheduler = state.scheduler = _scheduler.TickScheduler(frame_time=1/60.)
     last_frame = time.perf_counter()
-    render = True
-    pause = False
-    i = 0
-    while 1:
-        last_t = t
-        t = time.perf_counter()
-        time_passed = t - last_t
-        #print('sleeping', tickrate - time_passed)
-        time.sleep(max(0, tickrate - time_passed))
-        
-        if not pause:
-            t1 = time.perf_counter()
-            window.update()
-            t2 = time.perf_counter()
-            print('tick time', t2 - t1, 'target tickrate', tickrate)
+    ticks_run = 0
 
-        rendered = False
-        if i % 200 == 0:
+    def tick():
+        nonlocal ticks_run
+        window.update()
+        state.ticked()
+        if streamer is not None:
+            streamer.send()
+        if population is not None:
+            population.publish()
+        if args.memreport and window.world.age % args.memreport == 0:
+            print(state.memory_text())
+        if ticks_run % 200 == 0 and not args.headless:
             window.frame()
-            pygame.image.save(window.screen, 'timelapse-screenshots/%08d.png'%(i/200))
-            rendered = True
-        i += 1
+            pygame.image.save(window.screen, 'timelapse-screenshots/%08d.png'%(ticks_run/200))
+        ticks_run += 1
 
-        if t - last_frame > framerate and render and not rendered:
+    while 1:
+        if server is not None:
+            # commands are only ever applied here, between batches of ticks
+            server.apply(state)
+
+        if not state.pause:
+            ran = scheduler.run(tick, state.tickrate)
+            if ran and not args.headless:
+                print('ticks', ran, 'tick time', scheduler.tick_cost,
+                      'speed', scheduler.name)
+        if server is not None:
+            server.publish(state.metrics())
+
+        t = time.perf_counter()
+        if t - last_frame > scheduler.frame_time and state.render:
             print('frame time', t - last_frame)
             window.frame()
-            last_frame = t
+            last_frame = time.perf_counter()
+            scheduler.drew(last_frame - t)
+        elif not state.render:
+            scheduler.drew(0.0)
 
         for event in pygame.event.get():
             if event.type == QUIT:
@@ -109,15 +324,12 @@ def main():
                 if event.key == K_ESCAPE or event.key == K_q:
                     return
                 elif event.key == K_p:
-                    if pause:
-                        pause = False
-                    else:
-                        pause = True
+                    state.pause = not state.pause
+                elif event.key in (K_1, K_2, K_3):
+                    # 1x, 10x or flat out
+                    scheduler.speed = _scheduler.SPEEDS[event.key - K_1][0]
                 elif event.key == K_r:
-                    if render:
-                        render = False
-                    else:
-                        render = True
+                    state.render = not state.render
                 elif event.key == K_d:
                     try:
                         if window.world.active_item:
@@ -126,10 +338,13 @@ def main():
                                     sort_keys=True, indent=4)
                     except:
                         traceback.print_exc()
+                elif event.key == K_m:
+                    print(state.memory_text())
                 elif event.key == K_s:
                     try:
                         if window.world.active_item:
                             window.world.active_item.spawn_asex()
+                            window.world.commit()
                     except:
                         traceback.print_exc()
             elif event.type==VIDEORESIZE:
@@ -148,6 +363,11 @@ def main():
                 mouse_was_dragged = True
                 window.ondrag(mousedown_pos, event.dict['rel'])
 
+        if state.pause:
+            time.sleep(scheduler.frame_time)
+        else:
+            time.sleep(scheduler.idle(state.tickrate))
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,166 @@
+'''batchinspect.py -- headless evaluation of saved brains over input grids.
+
+Loads creature dumps (the active-*.json files written by the 'd' key, or
+files holding a list of such dumps) and evaluates every brain over a grid of
+the eight brain inputs, writing a response table and optionally a heatmap.
+'''
+import os
+import sys
+import csv
+import glob
+import json
+import itertools
+from array import array
+
+import neuron
+import genome
+import config
+
+# Brain inputs, in the order built by Character.update
+INPUT_NAMES = (
+    'const', 'vis_left', 'vis_right', 'water', 'grass', 'forest', 'haptic',
+    'energy')
+OUTPUT_NAMES = ('angle_change', 'impulse', 'spawn')
+
+# Values each input takes in the default grid: the discrete values the
+# simulation actually produces, and a coarse sweep of energy/10k.
+DEFAULT_GRID = {
+    'const': (1.0,),
+    'vis_left': (0.0, 0.1, 0.5, 1.0),
+    'vis_right': (0.0, 0.1, 0.5, 1.0),
+    'water': (0.0, 1.0),
+    'grass': (0.0, 1.0),
+    'forest': (0.0, 1.0),
+    'haptic': (0.0, 1.0),
+    'energy': (0.0, 0.25, 0.5, 0.75, 1.0),
+}
+
+
+def build_grid(sweeps=()):
+    '''Return (rows, flat input array) for the cartesian product of inputs.'''
+    grid = dict(DEFAULT_GRID)
+    grid.update(sweeps)
+    rows = list(itertools.product(*(grid[name] for name in INPUT_NAMES)))
+    flat = array('d', itertools.chain.from_iterable(rows))
+    return rows, flat
+
+
+def find_dumps(paths):
+    '''Expand directories into the active-*.json files they contain.'''
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(glob.glob(os.path.join(path, 'active-*.json'))):
+                yield filename
+        else:
+            yield path
+
+
+def load_brains(paths):
+    '''Yield (label, (sizes, activations, weights)) per brain.'''
+    for path in find_dumps(paths):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict) and 'characters' in data:
+            data = data['characters']
+        if isinstance(data, dict):
+            data = [data]
+        for n, obj in enumerate(data):
+            label = '%s:%d' % (os.path.basename(path), n)
+            if 'genome' in obj:
+                g = genome.Genome.load(
+                    obj['genome'], len(INPUT_NAMES), len(OUTPUT_NAMES))
+                yield label, g.brain_layers()
+            else:
+                yield label, neuron.brain_layout(obj['brain'])
+
+
+def evaluate(brains, flat_inputs):
+    '''Yield (label, outputs array) with outputs for every grid row.'''
+    num_inputs = len(INPUT_NAMES)
+    num_outputs = len(OUTPUT_NAMES)
+    rows = len(flat_inputs) // num_inputs
+    for label, (sizes, activations, weights) in brains:
+        if sizes[0] != num_inputs or sizes[-1] != num_outputs:
+            raise ValueError('%s: expected %d inputs and %d outputs, got %r' % (
+                label, num_inputs, num_outputs, list(sizes)))
+        outputs = array('d', bytes(8 * rows * num_outputs))
+        neuron.process_batch(weights, sizes, activations, flat_inputs, outputs)
+        yield label, outputs
+
+
+def write_table(f, rows, results):
+    '''Write one CSV line per brain and grid row.'''
+    num_outputs = len(OUTPUT_NAMES)
+    writer = csv.writer(f)
+    writer.writerow(('brain',) + INPUT_NAMES + OUTPUT_NAMES)
+    for label, outputs in results:
+        for i, row in enumerate(rows):
+            writer.writerow(
+                (label,) + row
+                + tuple(outputs[i * num_outputs:(i + 1) * num_outputs]))
+
+
+def write_summary(f, results):
+    '''Write per-brain statistics of each output across the grid.'''
+    num_outputs = len(OUTPUT_NAMES)
+    writer = csv.writer(f)
+    header = ['brain']
+    for name in OUTPUT_NAMES:
+        header.extend(('%s_min' % name, '%s_mean' % name, '%s_max' % name))
+    header.extend(('forward_frac', 'spawn_frac'))
+    writer.writerow(header)
+    for label, outputs in results:
+        line = [label]
+        for k in range(num_outputs):
+            column = outputs[k::num_outputs]
+            line.extend((min(column), sum(column) / len(column), max(column)))
+        impulse = outputs[1::num_outputs]
+        spawn = outputs[2::num_outputs]
+        line.append(sum(1 for v in impulse if v > 0) / float(len(impulse)))
+        line.append(sum(1 for v in spawn if v > 0.5) / float(len(spawn)))
+        writer.writerow(line)
+
+
+def write_heatmap(filename, results, output_index, cell=2):
+    '''Save a heatmap: one row per brain, one column per grid row.'''
+    import pygame # only needed here, keep the rest usable without it
+    num_outputs = len(OUTPUT_NAMES)
+    results = list(results)
+    if not results:
+        return
+    columns = len(results[0][1]) // num_outputs
+    surface = pygame.Surface((columns * cell, len(results) * cell))
+    for y, (label, outputs) in enumerate(results):
+        for x in range(columns):
+            value = outputs[x * num_outputs + output_index]
+            val = int(min(abs(value) * 255, 255))
+            colour = (0, val, val) if value > 0 else (val, 0, 0)
+            surface.fill(colour, (x * cell, y * cell, cell, cell))
+    pygame.image.save(surface, filename)
+
+
+def main(args):
+    '''args -- parsed ArgumentParser Namespace from real main()'''
+    sweeps = [config.parse_sweep(spec, INPUT_NAMES, 'input')
+              for spec in args.batch_sweep]
+    rows, flat_inputs = build_grid(sweeps)
+    results = list(evaluate(load_brains(args.batch), flat_inputs))
+    print('evaluated %d brains over %d input rows' % (len(results), len(rows)),
+          file=sys.stderr)
+
+    if args.batch_out == '-':
+        out = sys.stdout
+    else:
+        out = open(args.batch_out, 'w', newline='')
+    try:
+        if args.batch_summary:
+            write_summary(out, results)
+        else:
+            write_table(out, rows, results)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.batch_heatmap:
+        write_heatmap(args.batch_heatmap, results,
+                      OUTPUT_NAMES.index(args.batch_heatmap_output))
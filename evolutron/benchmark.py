@@ -0,0 +1,245 @@
+'''benchmark.py -- timing benchmarks for the simulator.
+
+Run with `python evolutron --benchmark [name ...]`; with no names every
+benchmark is run.
+'''
+import os
+import sys
+import time
+import random
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def _headless_window(world_w=2000, world_h=2000, config=None):
+    import headless
+    import window as _window
+    return _window.Window(headless.init(), world_w, world_h, config)
+
+
+# Run in a fresh interpreter; prints the time taken to load the extensions.
+_STARTUP_SNIPPET = '''
+import sys, time
+t = time.perf_counter()
+sys.path.insert(0, %r)
+import extensions
+path = extensions.install()
+import characters, group
+print(path, time.perf_counter() - t)
+'''
+
+
+@benchmark
+def startup(repeat=5):
+    '''Cold start: a new interpreter loading the extension modules.'''
+    results = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        out = subprocess.check_output(
+            [sys.executable, '-c', _STARTUP_SNIPPET % HERE],
+            universal_newlines=True)
+        total = time.perf_counter() - t
+        path, load = out.split()[-2:]
+        results.append((total, float(load)))
+    return {
+        'path': path,
+        'process best (s)': min(r[0] for r in results),
+        'extension load best (s)': min(r[1] for r in results),
+    }
+
+
+@benchmark
+def ticks(count=200):
+    '''Simulation ticks on the default world.'''
+    random.seed(102)
+    window = _headless_window()
+    t = time.perf_counter()
+    for i in range(count):
+        window.update()
+    elapsed = time.perf_counter() - t
+    return {
+        'ticks': count,
+        'total (s)': elapsed,
+        'per tick (ms)': elapsed / count * 1000,
+    }
+
+
+@benchmark
+def multiworld(sizes=(1, 8, 32), count=100):
+    '''Small worlds (500x500, 50 creatures) stepped in a
+    multiworld.WorldBatch; the cost per world tick should stay that of a
+    lone world.'''
+    import multiworld as _multiworld
+    results = {}
+    for size in sizes:
+        batch = _multiworld.WorldBatch(
+            range(size), 500, 500, min_characters=50)
+        batch.run(20) # until the map near every creature is loaded
+        t = time.perf_counter()
+        batch.run(count)
+        elapsed = time.perf_counter() - t
+        results['%d worlds: world ticks/sec' % size] = size * count / elapsed
+        results['%d worlds: per world tick (ms)' % size] = (
+            elapsed / (size * count) * 1000)
+    return results
+
+
+@benchmark
+def brain_memo(count=300, entries=64):
+    '''Small worlds (500x500, 50 creatures) with brain outputs memoized per
+    genome and without; see characters.BrainMemo.'''
+    import multiworld as _multiworld
+    results = {}
+    for memo in (0, entries):
+        batch = _multiworld.WorldBatch(
+            range(4), 500, 500, min_characters=50, brain_memo=memo)
+        batch.run(20)
+        t = time.perf_counter()
+        batch.run(count)
+        elapsed = time.perf_counter() - t
+        name = 'memo %d' % memo
+        results[name + ': per world tick (ms)'] = (
+            elapsed / (len(batch) * count) * 1000)
+        if memo:
+            hits = misses = bypassed = 0
+            for world in batch.worlds:
+                stats = world.genomes.memo_stats()
+                hits += stats['hits']
+                misses += stats['misses']
+                bypassed += stats['bypassed']
+            results[name + ': hit rate'] = hits / max(1, hits + misses)
+            results[name + ': bypassed'] = bypassed / max(
+                1, hits + misses + bypassed)
+    return results
+
+
+@benchmark
+def scenarios(count=50):
+    '''Ticks of each stress scenario (see scenarios.py), seed 0, with the
+    time of each phase.'''
+    import scenarios as _scenarios
+    results = {}
+    for name in sorted(_scenarios.SCENARIOS):
+        fixture = _scenarios.build(name)
+        window = _headless_window(
+            fixture['world_w'], fixture['world_h'],
+            _scenarios.config(fixture))
+        _scenarios.populate(window.world, fixture)
+        world = window.world
+        phases = {}
+        t = time.perf_counter()
+        for i in range(count):
+            world.update()
+            for phase, seconds in world.phase_times.items():
+                phases[phase] = phases.get(phase, 0) + seconds
+        elapsed = time.perf_counter() - t
+        results['%s: per tick (ms)' % name] = elapsed / count * 1000
+        for phase in sorted(phases):
+            results['%s: %s (ms)' % (name, phase)] = (
+                phases[phase] / count * 1000)
+        results['%s: population' % name] = len(world.allcharacters)
+    return results
+
+
+@benchmark
+def memory(count=200):
+    '''Memory held per subsystem after some ticks; see memreport.py.'''
+    import memreport
+    random.seed(102)
+    window = _headless_window()
+    for i in range(count):
+        window.update()
+    report = memreport.Reporter(window).report()
+    results = {'ticks': count, 'population': report['population']}
+    for name, usage in report['subsystems'].items():
+        results[name + ' (bytes)'] = usage['bytes'] + usage['surface_bytes']
+    results['per creature (bytes)'] = report['bytes_per_creature']
+    results['total per creature (bytes)'] = report['total_per_creature']
+    return results
+
+
+def _random_shapes(count, points, spread, rng):
+    """count random (x1, y1, x2, y2, ...) shapes of the given number of
+    points, each within a square of side spread in a 2000x2000 world."""
+    shapes = []
+    for i in range(count):
+        x, y = rng.randint(0, 2000), rng.randint(0, 2000)
+        shapes.append(tuple(
+            c for p in range(points)
+            for c in (x + rng.randint(0, spread), y + rng.randint(0, spread))))
+    return shapes
+
+
+@benchmark
+def geometry(segments=400, triangles=300, repeat=3):
+    '''Segment/triangle tests: examples/triangle.py, one pair at a time
+    with the cdef functions, and geometry.segment_hits() in bulk.'''
+    import importlib.util
+    from array import array
+    import geometry as _geometry
+    spec = importlib.util.spec_from_file_location(
+        'triangle', os.path.join(HERE, '..', 'examples', 'triangle.py'))
+    triangle = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(triangle)
+
+    rng = random.Random(0)
+    results = {}
+    # scattered like food and trees against vision triangles, and all
+    # crowded into one spot so that few pairs can be rejected early
+    for layout, crowded in (('scattered', False), ('crowded', True)):
+        lines = _random_shapes(segments, 2, 50, rng)
+        tris = _random_shapes(triangles, 3, 50, rng)
+        if crowded:
+            lines = [tuple(c % 100 for c in l) for l in lines]
+            tris = [tuple(c % 100 for c in t) for t in tris]
+        flat_lines = array('i', [c for l in lines for c in l])
+        flat_tris = array('i', [c for t in tris for c in t])
+        pairs = float(len(lines) * len(tris))
+
+        t = time.perf_counter()
+        expected = array('B', [
+            triangle.line_in_triangle(
+                l[0:2], l[2:4], tr[0:2], tr[2:4], tr[4:6])
+            for tr in tris for l in lines])
+        python = time.perf_counter() - t
+
+        scalar = bulk = float('inf')
+        for i in range(repeat):
+            t = time.perf_counter()
+            one_at_a_time = _geometry.segment_hits_scalar(flat_lines, flat_tris)
+            scalar = min(scalar, time.perf_counter() - t)
+            t = time.perf_counter()
+            hits = _geometry.segment_hits(flat_lines, flat_tris)
+            bulk = min(bulk, time.perf_counter() - t)
+
+        results[layout + ' hits'] = sum(expected)
+        results[layout + ' agree'] = expected == one_at_a_time == hits
+        results[layout + ' python per pair (ns)'] = python / pairs * 1e9
+        results[layout + ' cdef per pair (ns)'] = scalar / pairs * 1e9
+        results[layout + ' batched per pair (ns)'] = bulk / pairs * 1e9
+    return results
+
+
+def main(args):
+    '''args -- parsed ArgumentParser Namespace from real main()'''
+    names = args.benchmark or sorted(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print('unknown benchmark %r; choose from %s' % (
+                name, ', '.join(sorted(BENCHMARKS))), file=sys.stderr)
+            return 1
+    for name in names:
+        result = BENCHMARKS[name]()
+        print('%s:' % name)
+        for key, value in result.items():
+            if isinstance(value, float):
+                value = '%.4f' % value
+            print('    %s: %s' % (key, value))
@@ -4,6 +4,7 @@ from pygame.locals import *
 
 import viewport
 import group
+import labels
 
 
 class BrainView(viewport.Viewport):
@@ -12,13 +13,21 @@ class BrainView(viewport.Viewport):
         super(BrainView, self).__init__(
             parent, viewport_rect, viewport_rect.w, viewport_rect.h)
         self._brain = None
+        self.allneurons = group.Group()
         self.height = viewport_rect.h
         self.font = pygame.font.Font(None, 18)
+        self.labels = labels.LabelCache(self.font)
         self.active_item = None
         self.input_labels = ('const', 'vis left', 'vis right', 'water', 'grass', 'forest', 'haptic', 'energy/10k')
         self.neuron_spacing = (75, self.height // (len(self.input_labels) + 1))
         self.neuron_width = 40
         self.neuron_height = self.neuron_spacing[1] // 2
+        # Labels and axons only change with the brain or the selected
+        # neuron, so they are drawn once onto this layer.
+        self.static = pygame.Surface(
+            (viewport_rect.w, viewport_rect.h)).convert()
+        self._static_key = None
+        self._drawn_offset = None
 
     @property
     def brain(self):
@@ -26,14 +35,25 @@ class BrainView(viewport.Viewport):
 
     @brain.setter
     def brain(self, brain):
+        if self._brain is not None:
+            self._brain.shown = False
+        if brain is not None:
+            brain.shown = True
         self._brain = brain
         self.allneurons = group.Group()
         if brain is None:
             return
         self.active_item = None
-        for i, layer in enumerate((brain.inputs, brain.hidden0, brain.outputs)):
+        layers = brain.layers()
+        # deep or wide brains get a canvas bigger than the view to drag
+        right, bottom = self.neuron_centre(
+            len(layers), max(len(layer) for layer in layers))
+        self.canvas_w = max(self.rect.w, right - self.neuron_spacing[0] // 2)
+        self.canvas_h = max(self.rect.h, bottom)
+        self.static = pygame.Surface((self.canvas_w, self.canvas_h)).convert()
+        self._static_key = None
+        for i, layer in enumerate(layers):
             for j, neuron in enumerate(layer):
-                centre = self.neuron_centre(i, j)
                 neuron.connect_viewport(self, self.neuron_width, self.neuron_height, self.neuron_centre(i, j))
                 self.allneurons.add(neuron)
 
@@ -41,27 +61,22 @@ class BrainView(viewport.Viewport):
         return [20 + self.neuron_spacing[0] * layer,
                 self.neuron_spacing[1] + self.neuron_spacing[1] * node_index]
 
-    def draw(self):
+    def draw_static(self):
+        """Draw the labels and axons onto the static layer."""
         brain = self._brain
+        canvas = self.static
+        canvas.fill((0, 0, 0))
 
-        self.canvas.fill((0, 0, 0))
-        
-        if brain is None:
-            self.image.blit(self.canvas, self.drag_offset)
-            return
-
-        input_labels = self.input_labels
-        hidden_labels = ()
+        layers = brain.layers()
         output_labels = ('angle ch', 'impulse', 'spawn')
 
-        for i, layer in enumerate((input_labels, hidden_labels, output_labels)):
+        for i, layer in ((0, self.input_labels), (len(layers) - 1, output_labels)):
             for j, label in enumerate(layer):
                 centrepos = self.neuron_centre(i, j)
-                text = self.font.render(label, True, (255, 255, 255))
+                text = self.labels.render(label, (255, 255, 255))
                 textrect = text.get_rect()
-                self.canvas.blit(text, (centrepos[0] - self.neuron_width // 2, centrepos[1] - self.neuron_height // 2 - textrect.h))
+                canvas.blit(text, (centrepos[0] - self.neuron_width // 2, centrepos[1] - self.neuron_height // 2 - textrect.h))
 
-        layers = brain.inputs, brain.hidden0, brain.outputs
         for i, layer in enumerate(layers):
             for j, neuron in enumerate(layer):
                 # draw axons
@@ -78,18 +93,40 @@ class BrainView(viewport.Viewport):
                         colour = (val, 0, 0)
                     start = self.neuron_centre(i - 1, k)
                     end = self.neuron_centre(i, j)
-                    pygame.draw.line(self.canvas, colour, start, end, 2)
+                    pygame.draw.line(canvas, colour, start, end, 2)
                     if self.active_item:
-                        text = self.font.render(
-                            '%.2f' % weight, True, (255, 255, 255))
+                        text = self.labels.render(
+                            '%.2f' % weight, (255, 255, 255))
                         rect = text.get_rect()
                         label_pos = (
                             (start[0] + end[0]) // 2 - rect.w // 2,
                             (start[1] + end[1]) // 2 - rect.h // 2)
-                        self.canvas.blit(text, label_pos)
-        self.allneurons.draw(self.canvas)
+                        canvas.blit(text, label_pos)
 
-        self.image.blit(self.canvas, self.drag_offset)
+    def draw(self):
+        brain = self._brain
+        changed = False
+
+        static_key = brain, self.active_item
+        if static_key != self._static_key:
+            self._static_key = static_key
+            if brain is None:
+                self.static.fill((0, 0, 0))
+            else:
+                self.draw_static()
+            changed = True
+
+        if brain is not None:
+            # neurons only re-render themselves when their value changed
+            for neuron in self.allneurons:
+                if neuron.draw():
+                    changed = True
+
+        if changed or self.drag_offset != self._drawn_offset:
+            self.canvas.blit(self.static, (0, 0))
+            self.allneurons.draw_images(self.canvas)
+            self.image.blit(self.canvas, self.drag_offset)
+            self._drawn_offset = self.drag_offset[:]
 
 
     def onclick(self, relpos, button):
@@ -98,10 +135,23 @@ class BrainView(viewport.Viewport):
             return
 
         canvas_pos = [relpos[i] - self.drag_offset[i] for i in (0, 1)]
-        clicked_neurons = [n for n in self.allneurons
-                           if n.rect.collidepoint(canvas_pos)]
-        if clicked_neurons:
-            self.active_item = clicked_neurons[0]
-            return
-        self.active_item = None
+        self.active_item = self.neuron_at(*canvas_pos)
+
+    def neuron_at(self, x, y):
+        """Return the neuron drawn at canvas position (x, y), or None.
+
+        Neurons sit on the grid of neuron_centre(), so the nearest grid
+        point is the only one that needs checking.
+        """
+        if self._brain is None:
+            return None
+        layers = self._brain.layers()
+        spacing_x, spacing_y = self.neuron_spacing
+        i = int(round((x - 20) / spacing_x))
+        j = int(round(y / spacing_y)) - 1
+        if 0 <= i < len(layers) and 0 <= j < len(layers[i]):
+            neuron = layers[i][j]
+            if neuron.rect.collidepoint(x, y):
+                return neuron
+        return None
 
@@ -6,19 +6,51 @@ cdef inline double double_min(double a, double b):
 cdef inline double double_max(double a, double b):
     return a if a > b else b
 
+cdef class BrainMemo:
+    cdef readonly int capacity
+    cdef readonly double quantum
+    cdef readonly long hits
+    cdef readonly long misses
+    cdef readonly long bypassed
+    cdef int _sets
+    cdef int _num_outputs
+    cdef long long[::1] _keys
+    cdef unsigned long long[::1] _stamps
+    cdef double[::1] _outputs
+    cdef unsigned long long _clock
+
+    cdef long long quantize(self, double[::1] values, int num_inputs)
+    cdef Py_ssize_t _set(self, long long key)
+    cdef bint fetch(self, long long key, double[::1] values, int offset)
+    cdef void save(self, long long key, double[::1] values, int offset)
+
 cdef class Brain:
-    cdef public object input_weights
-    cdef public object output_weights
-    cdef public object inputs
-    cdef public object hidden0
-    cdef public object outputs
+    cdef public BrainMemo memo
+    cdef public object sizes
+    cdef public object activations
+    cdef public object weights
+    cdef public int num_inputs
+    cdef public int num_outputs
+    cdef int[::1] _sizes
+    cdef int[::1] _activations
+    cdef double[::1] _weights
+    cdef double[::1] _raw
+    cdef double[::1] _values
+    cdef int _output_offset
+    cdef object _layers
+    cdef bint _shown
+    cdef bint _stale
 
     cdef object process(self, double[:] inputs)
     cpdef object reprocess(self)
+    cdef void _refresh(self)
+    cdef list output_values(self)
 
 cdef class Character(sprite.Sprite):
     cdef public object world
     cdef public object genome
+    cdef public long id
+    cdef public long species
 
     cdef public int haptic
     cdef public double vision_left
@@ -30,6 +62,12 @@ cdef class Character(sprite.Sprite):
     cdef public double on_water
     cdef public double on_grass
     cdef public double on_mulch
+    cdef public bint idle
+    cdef bint _quiet
+    cdef bint _trees_clear
+    cdef int _clear_x, _clear_y
+    cdef double _dir_angle, _dir_sin, _dir_cos
+    cdef double[:] _inputs
 
     cdef public int mass
     cdef public int r
@@ -56,8 +94,11 @@ cdef class Character(sprite.Sprite):
     cdef public Brain brain
 
     cdef public bint redraw
+    cdef public bint dead
 
-    cdef inline void interactions(self, group)
+    cdef inline void interactions(self, dict sprites)
+    cdef inline void _update_direction(self)
+    cdef bint sense(self)
     cdef void load_genome(Character self, object genome)
     cdef void _draw_border(self, colour)
     cpdef void set_midpoint_x(self, double x)
@@ -1,4 +1,3 @@
-# cython: profile=True
 cimport cython
 
 import struct
@@ -9,7 +8,7 @@ from colorsys import hsv_to_rgb
 
 from cpython cimport array
 from array import array
-from libc.math cimport sin, cos, exp, fabs
+from libc.math cimport sin, cos, exp, fabs, floor
 cdef extern from "errno.h":
     int errno
 
@@ -17,9 +16,11 @@ import pygame
 from pygame.locals import *
 
 import genome
+from mapgen import LAKE, MEADOW, FOREST
 from sprite cimport Sprite
-from neuron cimport Neuron
-from neuron import identity
+from geometry cimport line_in_triangle
+from neuron cimport Neuron, forward
+from neuron import ACTIVATIONS, brain_layout
 
 from characters cimport Character, Brain
 
@@ -27,120 +28,292 @@ from characters cimport Character, Brain
 DEF EVO_2PI3 = 2.0943951023931953
 DEF EVO_4PI3 = 4.1887902047863905
 DEF EVO_TAU = 6.283185307179586
+# cos(0.4) and sin(0.4), for the edges of the vision triangle
+DEF EVO_COS_VISION = 0.9210609940028851
+DEF EVO_SIN_VISION = 0.3894183423086505
 
-# Line collision algorithm. Ref: https://stackoverflow.com/a/9997374 and 
-# http://www.bryceboe.com/2006/10/23/line-segment-intersection-algorithm/
-cdef bint _ccw(int A_x, int A_y, int B_x, int B_y, int C_x, int C_y):
-    return (C_y-A_y) * (B_x-A_x) > (B_y-A_y) * (C_x-A_x)
-
-cdef bint intersect(int A_x, int A_y,
-                    int B_x, int B_y,
-                    int C_x, int C_y,
-                    int D_x, int D_y):
-    """Returns true if line segments AB and CD intersect"""
-    return (
-        _ccw(A_x, A_y, C_x, C_y, D_x, D_y) != _ccw(B_x, B_y, C_x, C_y, D_x, D_y)
-    ) and (
-        _ccw(A_x, A_y, B_x, B_y, C_x, C_y) != _ccw(A_x, A_y, B_x, B_y, D_x, D_y)
-    )
-
-# Point-in-triangle algorithm. Ref: https://stackoverflow.com/a/2049593
-cdef int _sign(int p1_x, int p1_y, int p2_x, int p2_y, int p3_x, int p3_y):
-    return (p1_x - p3_x) * (p2_y - p3_y) - (p2_x - p3_x) * (p1_y - p3_y);
-
-cdef bint point_in_triangle(int pt_x, int pt_y,
-                            int v1_x, int v1_y,
-                            int v2_x, int v2_y,
-                            int v3_x, int v3_y):
-    cdef bint b1, b2, b3
-    b1 = _sign(pt_x, pt_y, v1_x, v1_y, v2_x, v2_y) < 0
-    b2 = _sign(pt_x, pt_y, v2_x, v2_y, v3_x, v3_y) < 0
-    b3 = _sign(pt_x, pt_y, v3_x, v3_y, v1_x, v1_y) < 0
-    return (b1 == b2) and (b2 == b3)
-
-
-
-cdef bint line_in_triangle(int La_x, int La_y,
-                           int Lb_x, int Lb_y,
-                           int Ta_x, int Ta_y,
-                           int Tb_x, int Tb_y,
-                           int Tc_x, int Tc_y):
-    """Returns true if Line La->Lb intersects or contained by triangle Ta-Tb-Tc"""
-    # if either end of the line segment are inside the triangle, return True:
-    if point_in_triangle(La_x, La_y, Ta_x, Ta_y, Tb_x, Tb_y, Tc_x, Tc_y):
-        return True
-    if point_in_triangle(Lb_x, Lb_y, Ta_x, Ta_y, Tb_x, Tb_y, Tc_x, Tc_y):
-        return True
-
-    # if line segment intersects either Ta-Tb or Ta-Tc, return True:
-    # (don't need to check Tb-Tc since any line that intersects it
-    #  will also intersect Ta-Tb or Ta-Tc)
-    if intersect(La_x, La_y, Lb_x, Lb_y, Ta_x, Ta_y, Tb_x, Tb_y):
-        return True
-    if intersect(La_x, La_y, Lb_x, Lb_y, Ta_x, Ta_y, Tc_x, Tc_y):
-        return True
-
-    return False
+# Main classes:
+
+cdef array.array _DOUBLES = array.array('d')
+cdef array.array _LONGLONGS = array.array('q')
+cdef array.array _ULONGLONGS = array.array('Q')
+
+DEF MEMO_WAYS = 4 # entries per set of a BrainMemo
+DEF MEMO_BUCKETS = 1099511627776 # 2 ** 40 energy buckets fit in a key
+
+cdef inline int _memo_level(double x):
+    '''The code of a discrete brain input for a memo key, or -1.'''
+    if x == 0:
+        return 0
+    if x == 0.1:
+        return 1
+    if x == 0.5:
+        return 2
+    if x == 1:
+        return 3
+    return -1
+
+
+cdef class BrainMemo:
+    '''The outputs of one set of brain weights, by input.
+
+    A character's brain inputs but the last take one of the values 0, 0.1,
+    0.5 and 1 (the constant, vision heights, terrain flags and haptic). The
+    last, energy / 10000, is rounded to the middle of a bucket `quantum`
+    wide, so that every input in a bucket gives the same outputs and the
+    brain only needs evaluating once for each. Entries are kept in sets of
+    four, replacing the least recently used of a full set. Brains compiled
+    from the same genome share a memo (see GenomeStore.brain_memo()).
+    '''
+
+    def __cinit__(self, int capacity, double quantum, int num_outputs):
+        if capacity < 1 or not quantum > 0:
+            raise ValueError('a memo needs a capacity and a quantum above 0')
+        self._sets = (capacity + MEMO_WAYS - 1) // MEMO_WAYS
+        self.capacity = self._sets * MEMO_WAYS
+        self.quantum = quantum
+        self._num_outputs = num_outputs
+        keys = array.clone(_LONGLONGS, self.capacity, zero=False)
+        for i in range(self.capacity):
+            keys[i] = -1
+        self._keys = keys
+        self._stamps = array.clone(_ULONGLONGS, self.capacity, zero=True)
+        self._outputs = array.clone(
+            _DOUBLES, self.capacity * num_outputs, zero=True)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef long long quantize(self, double[::1] values, int num_inputs):
+        '''Round the last of the inputs in values to the middle of its
+        bucket; return their key, or -1 if they can't be memoized.'''
+        cdef int i, level
+        cdef long long key = 0
+        cdef double bucket = floor(values[num_inputs - 1] / self.quantum)
+        if not (0 <= bucket < MEMO_BUCKETS) or num_inputs > 12:
+            self.bypassed += 1
+            return -1
+        values[num_inputs - 1] = (bucket + 0.5) * self.quantum
+        for i in range(num_inputs - 1):
+            level = _memo_level(values[i])
+            if level < 0:
+                self.bypassed += 1
+                return -1
+            key = key << 2 | level
+        return (<long long>bucket) << (2 * (num_inputs - 1)) | key
+
+    cdef Py_ssize_t _set(self, long long key):
+        cdef unsigned long long h = <unsigned long long>key * 2654435761
+        h ^= h >> 29
+        return <Py_ssize_t>(h % <unsigned long long>self._sets) * MEMO_WAYS
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef bint fetch(self, long long key, double[::1] values, int offset):
+        '''Copy the outputs memoized for key into values at offset; return
+        whether there were any.'''
+        cdef Py_ssize_t first = self._set(key)
+        cdef Py_ssize_t entry
+        cdef int i
+        self._clock += 1
+        for entry in range(first, first + MEMO_WAYS):
+            if self._keys[entry] == key:
+                self._stamps[entry] = self._clock
+                for i in range(self._num_outputs):
+                    values[offset + i] = \
+                        self._outputs[entry * self._num_outputs + i]
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void save(self, long long key, double[::1] values, int offset):
+        '''Memoize the outputs in values at offset for key.'''
+        cdef Py_ssize_t first = self._set(key)
+        cdef Py_ssize_t entry
+        cdef Py_ssize_t oldest = first
+        cdef int i
+        for entry in range(first + 1, first + MEMO_WAYS):
+            if self._stamps[entry] < self._stamps[oldest]:
+                oldest = entry
+        self._keys[oldest] = key
+        self._stamps[oldest] = self._clock
+        for i in range(self._num_outputs):
+            self._outputs[oldest * self._num_outputs + i] = values[offset + i]
 
+    def __len__(self):
+        cdef Py_ssize_t i
+        return sum(1 for i in range(self.capacity) if self._keys[i] != -1)
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self)
+                + self.capacity * (16 + self._num_outputs * sizeof(double)))
 
-# Main classes:
 
 cdef class Brain:
-    def __cinit__(self, input_weights, output_weights):
+    def __cinit__(self, sizes, activations, weights):
         '''
-        input_weights -- an array of len of hidden neurons, each item
-            being an array of len of number of desired inputs.
-            eg for two inputs and four hidden layer neurons:
-                [ [1, 2], [2, 3], [4, 5], [5, 6] ]
-        output_weights -- similar to input weights, but for the number of
-            outputs and number of hidden layer neurons.
-            eg for two outputs and four hidden layer neurons:
-                [ [1, 2, 3, 4], [2, 3, 4, 5] ]
+        sizes -- array('i') of the number of neurons in each layer, inputs
+            first and outputs last; eg for two inputs, four hidden layer
+            neurons and two outputs: [2, 4, 2]
+        activations -- array('i') of the activation code of each layer (see
+            neuron.IDENTITY etc.)
+        weights -- array('d') of the weights of every layer after the
+            inputs, layer by layer and neuron by neuron; eg for the above,
+            eight weights for the first hidden neuron's inputs, then the
+            other hidden neurons', then four for each output.
+
+        The arrays are used as-is (not copied) so that brains compiled from
+        the same genome can share them; they must not be changed.
         '''
-        self.input_weights = input_weights
-        self.output_weights = output_weights
-        num_inputs = input_weights and len(input_weights[0]) or 0
-        self.inputs = [Neuron(array('d', []), 0, fn=identity) for i in range(num_inputs)]
-        self.hidden0 = []
-        for neuron_input_weights in input_weights:
-            self.hidden0.append(Neuron(array('d', neuron_input_weights)))
-        self.outputs = []
-        for output_neuron_weights in output_weights:
-            self.outputs.append(Neuron(array('d', output_neuron_weights), fn=identity))
+        cdef int i
+        cdef int total = 0
+        cdef int expected = 0
+        for i in range(len(sizes)):
+            total += sizes[i]
+            if i:
+                expected += sizes[i] * sizes[i - 1]
+        if len(weights) != expected or len(activations) != len(sizes):
+            raise ValueError('%d weights and %d activations for layers %r' % (
+                len(weights), len(activations), list(sizes)))
+        self.sizes = sizes
+        self.activations = activations
+        self.weights = weights
+        self._sizes = sizes
+        self._activations = activations
+        self._weights = weights
+        self._raw = array.clone(_DOUBLES, total, zero=True)
+        self._values = array.clone(_DOUBLES, total, zero=True)
+        self.num_inputs = sizes[0]
+        self.num_outputs = sizes[len(sizes) - 1]
+        self._output_offset = total - self.num_outputs
+        self._layers = None
+        self._shown = False # see shown
+        self._stale = False # hidden values from before a memo hit
+        self.memo = None
 
+    @property
+    def shown(self):
+        '''Whether BrainView shows this brain, so that the memo is bypassed
+        and every neuron is evaluated, every tick.'''
+        return self._shown
+
+    @shown.setter
+    def shown(self, shown):
+        self._shown = shown
+        if shown:
+            self._refresh()
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
     cdef process(self, double[:] input_values):
         cdef int i
-        cdef Neuron neuron
-        inputs = self.inputs
-        for i in range(len(inputs)):
-            neuron = inputs[i]
-            neuron.value = input_values[i]
-        return self.reprocess()
+        cdef long long key = -1
+        for i in range(self.num_inputs):
+            self._values[i] = input_values[i]
+        if self.memo is not None:
+            key = self.memo.quantize(self._values, self.num_inputs)
+            if key != -1 and not self._shown and self.memo.fetch(
+                    key, self._values, self._output_offset):
+                self._stale = True
+                return self.output_values()
+        forward(self._weights, self._sizes, self._activations,
+                self._raw, self._values)
+        self._stale = False
+        if key != -1:
+            self.memo.save(key, self._values, self._output_offset)
+        return self.output_values()
 
     cpdef reprocess(self):
-        for neuron in self.hidden0:
-            neuron.process(self.inputs)
-        for output in self.outputs:
-            output.process(self.hidden0)
-        return [output.value for output in self.outputs]
+        forward(self._weights, self._sizes, self._activations,
+                self._raw, self._values)
+        self._stale = False
+        return self.output_values()
+
+    cdef void _refresh(self):
+        '''Evaluate the hidden neurons skipped by memo hits, for the current
+        inputs, keeping the memoized outputs the character acted on.'''
+        cdef double[::1] outputs
+        if not self._stale:
+            return
+        outputs = array.clone(_DOUBLES, self.num_outputs, zero=False)
+        outputs[:] = self._values[self._output_offset:]
+        forward(self._weights, self._sizes, self._activations,
+                self._raw, self._values)
+        self._values[self._output_offset:] = outputs
+        self._stale = False
+
+    cdef list output_values(self):
+        cdef int i
+        return [self._values[self._output_offset + i]
+                for i in range(self.num_outputs)]
+
+    def layers(self):
+        '''Return a list of Neurons per layer, inputs first.
+
+        The Neurons are only created the first time this is called, for
+        BrainView and the inspector; evaluation does not need them.
+        '''
+        cdef int layer, i, num_in
+        cdef int offset = 0
+        cdef int w = 0
+        if self._layers is None:
+            layers = []
+            no_weights = array.clone(_DOUBLES, 0, zero=False)
+            for layer in range(len(self.sizes)):
+                fn = ACTIVATIONS[self.activations[layer]]
+                num_in = self.sizes[layer - 1] if layer else 0
+                neurons = []
+                for i in range(self.sizes[layer]):
+                    if layer:
+                        input_weights = self._weights[w:w + num_in]
+                        w += num_in
+                    else:
+                        input_weights = no_weights
+                    neurons.append(Neuron(
+                        self._values, self._raw, offset + i, input_weights,
+                        fn=fn))
+                layers.append(neurons)
+                offset += self.sizes[layer]
+            self._layers = layers
+        return self._layers
+
+    @property
+    def inputs(self):
+        return self.layers()[0]
+
+    @property
+    def outputs(self):
+        return self.layers()[-1]
+
+    def __sizeof__(self):
+        # the layer arrays are shared with the genome store; the value
+        # buffers are this brain's own
+        return (object.__sizeof__(self)
+                + (self._raw.shape[0] + self._values.shape[0]) * sizeof(double))
 
     def __repr__(self):
-        return 'Brain(%r, %r)' % (self.input_weights, self.output_weights)
+        return 'Brain(%r, %r, %r)' % (
+            list(self.sizes), list(self.activations), list(self.weights))
 
     def dump(self):
+        self._refresh()
         obj = {
-            'input_weights': self.input_weights,
-            'output_weights': self.output_weights,
-            'inputs': [neuron.dump() for neuron in self.inputs],
-            'hidden0': [neuron.dump() for neuron in self.hidden0],
-            'outputs': [neuron.dump() for neuron in self.outputs],
+            'sizes': list(self.sizes),
+            'activations': list(self.activations),
+            'weights': list(self.weights),
+            'values': list(self._values),
         }
         return obj
     
     @classmethod
     def load(cls, obj):
-        self = cls(obj['input_weights'], obj['output_weights'])
-        return self
+        cdef Brain brain = cls(*brain_layout(obj))
+        if 'values' in obj:
+            for i, value in enumerate(obj['values']):
+                brain._values[i] = value
+        return brain
 
 
 cdef class Character(Sprite):
@@ -150,6 +323,9 @@ cdef class Character(Sprite):
     def __cinit__(self, object world):
         self.world = world
         self.genome = None
+        self.id = -1 # set by WorldView.add_character()
+        self.dead = False # set by die(); removed from the world by commit()
+        self.species = -1 # set by the world's SpeciesTracker
 
         # Senses
         self.haptic = 0 # touching anything
@@ -158,6 +334,11 @@ cdef class Character(Sprite):
         self.on_water = 0
         self.on_grass = 0
         self.on_mulch = 0
+        # nothing near has changed since the last tick (see sense())
+        self.idle = False
+        self._quiet = False # no food or other characters near at last sense
+        # the rect has not hit a tree since it was last at _clear_x, _clear_y
+        self._trees_clear = False
 
         # Physical properties
         self.mass = 0 # mass, kg
@@ -183,6 +364,10 @@ cdef class Character(Sprite):
 
         self.brain = None
 
+        # Sensor state reused between ticks; see sense()
+        self._dir_angle = -1.0
+        self._inputs = array('d', [1, 0, 0, 0, 0, 0, 0, 0])
+
         if world:
             self.created = world.age
 
@@ -221,39 +406,21 @@ cdef class Character(Sprite):
             self.image = pygame.Surface((self.r * 2, self.r * 2), SRCALPHA).convert_alpha()
             self.rect = self.image.get_rect()
             self.redraw = True # currently ignored in Character
-        num_hidden_neurons = genome.hidden_neurons
-        input_weights = []
-        output_weights = []
-        pos = 2
-        num_hidden0_weights = genome._inputs
-        hidden0_weights_iter = iter(genome.hidden0_weights)
-        for i in range(num_hidden_neurons):
-            neuron_inputs = []
-            for j in range(num_hidden0_weights):
-                neuron_inputs.append(next(hidden0_weights_iter))
-            input_weights.append(neuron_inputs)
-        try:
-            next(hidden0_weights_iter)
-        except StopIteration:
-            pass
-        else:
-            assert 0
-        num_output_weights = genome._outputs
-        output_weights_iter = iter(genome.output_weights)
-        for i in range(num_output_weights):
-            neuron_outputs = []
-            for j in range(num_hidden_neurons):
-                neuron_outputs.append(next(output_weights_iter))
-            output_weights.append(neuron_outputs)
-        try:
-            next(output_weights_iter)
-        except StopIteration:
-            pass
+        if self.world is not None:
+            # share identical genomes and their compiled brains between
+            # characters; released again by WorldView.commit()
+            genome = self.world.genomes.intern(genome)
+            sizes, activations, weights = \
+                self.world.genomes.brain_layers(genome)
         else:
-            assert 0
+            sizes, activations, weights = genome.brain_layers()
 
-        self.brain = Brain(input_weights, output_weights)
+        self.brain = Brain(sizes, activations, weights)
         self.genome = genome
+        if self.world is not None and self.world.config.brain_memo:
+            config = self.world.config
+            self.brain.memo = self.world.genomes.brain_memo(
+                genome, config.brain_memo, config.brain_memo_energy / 10000.)
 
     cdef void _draw_border(self, colour):
         pygame.draw.lines(self.image, colour, 1, [
@@ -336,14 +503,14 @@ cdef class Character(Sprite):
         #pygame.draw.line(self.world.canvas, (0,0,0), (self._vision_start_x, self._vision_start_y), (self._vision_right_end_x, self._vision_right_end_y))
 
     cpdef void die(self):
-        self.world.allcharacters.remove(self)
-        if self.world.active_item is self:
-            self.world.active_item = None
-        if self.tile:
-            self.tile.allcharacters.remove(self)
-
-    cdef inline void interactions(self, group):
-        for item in group.spritedict:
+        """Die; the world lets go of the character when the tick ends."""
+        if self.dead:
+            return # already dead, e.g. eaten by two predators at once
+        self.dead = True
+        self.world.events.died(self)
+
+    cdef inline void interactions(self, dict sprites):
+        for item in sprites:
             if item is self:
                 continue
             for iline in item.intersect_lines:
@@ -370,20 +537,35 @@ cdef class Character(Sprite):
                 if self.vision_left != 0 and self.vision_right != 0:
                     return
 
-    @cython.cdivision(True)
-    def update(self):
-        cdef int i, j
-        cdef double x, y
-        cdef str terrain
+    cdef inline void _update_direction(self):
+        # sin/cos of the heading are only recomputed when angle changes
+        if self.angle != self._dir_angle:
+            self._dir_angle = self.angle
+            self._dir_sin = sin(self.angle)
+            self._dir_cos = cos(self.angle)
 
+    @cython.cdivision(True)
+    cdef bint sense(self):
+        """Sensor stage: find the current tile, and what can be seen.
+
+        Run for every character by Group.sense() before any of them move,
+        leaving the vision and terrain inputs in the reused input buffer.
+
+        A character whose vision triangle is unchanged since the last tick,
+        and with no food or other characters in its neighbourhood then or
+        now, sees what it saw then, and is marked idle rather than looking
+        again.
+        Returns idle.
+        """
+        cdef int code
+        cdef int sx, sy, lx, ly, mx, my, rx, ry
+        cdef bint moved
         world = self.world
 
         # observing world
-        tile_coord = self.midx // world.tile_w, self.midy // world.tile_h 
-        try:
-            tile = world.alltiles_coords[tile_coord]
-        except KeyError:
-            tile = None
+        tile_coord = self.midx // world.tile_w, self.midy // world.tile_h
+        tile = world.alltiles_coords.get(tile_coord)
+        moved = self.age == 0
         if tile is not None and tile is not self.tile:
             # tile changed
             oldtile = self.tile
@@ -391,69 +573,124 @@ cdef class Character(Sprite):
                 oldtile.allcharacters.remove(self)
             tile.allcharacters.add(self)
             self.tile = tile
-            terrain = tile.tile.terrain
-            self.on_water = 1.0 if terrain == 'lake' else 0.0
-            self.on_grass = 1.0 if terrain == 'meadow' else 0.0
-            self.on_mulch = 1.0 if terrain == 'forest' else 0.0
-        check_tiles = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                coord = tile_coord[0] + i, tile_coord[1] + j
-                try:
-                    check_tiles.append(world.alltiles_coords[coord])
-                except KeyError:
-                    pass
-
-        # vision triangle
+            world.density.moved(self)
+            self._trees_clear = False
+            moved = True
+            code = tile.terrain_code
+            self.on_water = 1.0 if code == LAKE else 0.0
+            self.on_grass = 1.0 if code == MEADOW else 0.0
+            self.on_mulch = 1.0 if code == FOREST else 0.0
+
+        # vision triangle, rotating the heading by +-0.4 radians for the
+        # left and right edges
         cdef int vr = 50
-        self._vision_start_x = <int>self.midx
-        self._vision_start_y = <int>self.midy
-        self._vision_left_end_x = <int>(
-            self._vision_start_x + (vr * sin(self.angle - 0.4)))
-        self._vision_left_end_y = <int>(
-            self._vision_start_y - (vr * cos(self.angle - 0.4)))
-        self._vision_middle_end_x = <int>(
-            self._vision_start_x + (vr * sin(self.angle)))
-        self._vision_middle_end_y = <int>(
-            self._vision_start_y - (vr * cos(self.angle)))
-        self._vision_right_end_x = <int>(
-            self._vision_start_x + (vr * sin(self.angle + 0.4)))
-        self._vision_right_end_y = <int>(
-            self._vision_start_y - (vr * cos(self.angle + 0.4)))
+        self._update_direction()
+        cdef double s = self._dir_sin
+        cdef double c = self._dir_cos
+        sx = <int>self.midx
+        sy = <int>self.midy
+        lx = <int>(sx + vr * (s * EVO_COS_VISION - c * EVO_SIN_VISION))
+        ly = <int>(sy - vr * (c * EVO_COS_VISION + s * EVO_SIN_VISION))
+        mx = <int>(sx + vr * s)
+        my = <int>(sy - vr * c)
+        rx = <int>(sx + vr * (s * EVO_COS_VISION + c * EVO_SIN_VISION))
+        ry = <int>(sy - vr * (c * EVO_COS_VISION - s * EVO_SIN_VISION))
+        moved = moved or not (
+            sx == self._vision_start_x and sy == self._vision_start_y
+            and lx == self._vision_left_end_x and ly == self._vision_left_end_y
+            and mx == self._vision_middle_end_x
+            and my == self._vision_middle_end_y
+            and rx == self._vision_right_end_x
+            and ry == self._vision_right_end_y)
+        self._vision_start_x = sx
+        self._vision_start_y = sy
+        self._vision_left_end_x = lx
+        self._vision_left_end_y = ly
+        self._vision_middle_end_x = mx
+        self._vision_middle_end_y = my
+        self._vision_right_end_x = rx
+        self._vision_right_end_y = ry
+
+        cdef bint quiet = True
+        self.idle = False
+        if self.tile is not None:
+            if self._quiet and not moved:
+                # trees never move, so only food and characters are news
+                for tile in self.tile.neighbourhood:
+                    if tile.allfood.spritedict or len(
+                            tile.allcharacters.spritedict) > (tile is self.tile):
+                        quiet = False
+                        break
+                self.idle = quiet
+            if not self.idle:
+                quiet = True
+                self.vision_left = 0
+                self.vision_right = 0
+                for tile in self.tile.neighbourhood:
+                    sprites = tile.allfood.spritedict
+                    if sprites:
+                        quiet = False
+                        self.interactions(sprites)
+                    sprites = tile.alltrees.spritedict
+                    if sprites:
+                        self.interactions(sprites)
+                    sprites = tile.allcharacters.spritedict
+                    if len(sprites) > (tile is self.tile):
+                        quiet = False
+                        self.interactions(sprites)
+        else:
+            quiet = False
+            self.vision_left = 0
+            self.vision_right = 0
+        self._quiet = quiet
+
+        cdef double[:] inputs = self._inputs
+        inputs[1] = self.vision_left
+        inputs[2] = self.vision_right
+        inputs[3] = self.on_water
+        inputs[4] = self.on_grass
+        inputs[5] = self.on_mulch
+        return self.idle
+
+    @cython.cdivision(True)
+    def update(self):
+        cdef double x, y
+
+        world = self.world
+        check_tiles = self.tile.neighbourhood if self.tile is not None else ()
 
         # age:
         self.age += 1
 
         # interaction with nearby objects:
         foods = []
-        self.vision_left = 0
-        self.vision_right = 0
         self.foodchain = False
-        for tile in check_tiles:
-            if not self.predator:
-                foods.extend(pygame.sprite.spritecollide(self, tile.allfood, 0))
-            self.interactions(tile.allfood)
-            self.interactions(tile.alltrees)
-            self.interactions(tile.allcharacters)
-
-        # eating:
+        if not self.predator and not self.idle:
+            # an idle character had no food near when it sensed
+            collide = self.rect.colliderect
+            for tile in check_tiles:
+                for food in tile.allfood.spritedict:
+                    if collide(food.rect):
+                        foods.append(food)
+
+        # eating; the food is removed when the tick ends (see events.py)
         cdef int food_energy
+        cdef bint ate = False
         for food in foods:
             food_energy = food.energy
-            self.energy += food_energy
-            food.eaten()
-
-        # brain - update brain_inputs and brain_outputs above if changing
-        cdef double[:] inputs = array('d', [
-            1,
-            self.vision_left,
-            self.vision_right,
-            self.on_water,
-            self.on_grass,
-            self.on_mulch,
-            self.haptic,
-            self.energy / 10000,
-        ])
+            if food_energy:
+                self.energy += food_energy
+                food.energy = 0
+                world.events.ate(food)
+                ate = True
+        if ate:
+            world.density.moved(self)
+
+        # brain - update brain_inputs and brain_outputs above if changing;
+        # the vision and terrain inputs were filled in by sense()
+        cdef double[:] inputs = self._inputs
+        inputs[6] = self.haptic
+        inputs[7] = self.energy / 10000
         cdef double angle_change
         cdef double Fmove
         outputs = self.brain.process(inputs)
@@ -465,17 +702,19 @@ cdef class Character(Sprite):
         # compensate values from NN
         angle_change /= 2
 
+        config = world.config
         if Fmove > 0:
-            self.energy -= Fmove * 5 + 10
+            self.energy -= Fmove * config.move_cost + config.base_cost
         else:
             # Make moving backwards possible, but harder.
-            self.energy += Fmove * 10 - 10
+            self.energy += Fmove * config.reverse_cost - config.base_cost
         if self.energy <= 0:
             self.die()
             return
 
         # asexual reproduction:
-        if self.spawn > 0.5 and self.energy > 5000 and self.spawn_refractory == 0:
+        if self.spawn > 0.5 and self.energy > config.spawn_energy \
+        and self.spawn_refractory == 0:
             self.spawn_asex()
 
         if self.spawn_refractory > 0:
@@ -489,17 +728,30 @@ cdef class Character(Sprite):
         cdef int canvas_w = world.canvas_w
         cdef int canvas_h = world.canvas_h
         self.angle = (self.angle + angle_change) % 6.283185307179586
-        x = self.midx + (ddist * sin(self.angle))
-        y = self.midy - (ddist * cos(self.angle))
+        self._update_direction()
+        x = self.midx + (ddist * self._dir_sin)
+        y = self.midy - (ddist * self._dir_cos)
         self.set_midpoint_x(double_min(double_max(self.r, x), canvas_w - self.r))
         self.set_midpoint_y(double_min(double_max(self.r, y), canvas_h - self.r))
-        collided = []
+        if self._trees_clear and self.rect.x == self._clear_x \
+        and self.rect.y == self._clear_y:
+            # still where it last hit no trees, so it still doesn't
+            self.haptic = 0
+            return
+        # bounce off the first tree hit
+        collide = self.rect.colliderect
+        hit = None
         for tile in check_tiles:
-            collided.extend(pygame.sprite.spritecollide(self, tile.alltrees, 0))
+            for tree in tile.alltrees.spritedict:
+                if collide(tree.rect):
+                    hit = tree
+                    break
+            if hit is not None:
+                break
         cdef double midpoint_x, midpoint_y
-        for tree in collided:
-            midpoint_x = (self.midx + tree.midx) / 2
-            midpoint_y = (self.midy + tree.midy) / 2
+        if hit is not None:
+            midpoint_x = (self.midx + hit.midx) / 2
+            midpoint_y = (self.midy + hit.midy) / 2
             if midpoint_x != self.midx:
                 self.set_midpoint_x(self.midx + 10 / (self.midx - midpoint_x))
             if midpoint_y != self.midy:
@@ -507,24 +759,28 @@ cdef class Character(Sprite):
 
             self.speed = 0
             self.haptic = 1
-            break
+            self._trees_clear = False
         else:
             self.haptic = 0 # may still be updated by Group.collisions()
-    
+            self._trees_clear = True
+            self._clear_x = self.rect.x
+            self._clear_y = self.rect.y
+
     cpdef void spawn_asex(self):
         cdef Character newchar
-        self.energy -= 5000
+        config = self.world.config
+        self.energy -= config.spawn_energy
         self.spawn_refractory = 60
-        newgenome = self.genome.mutate()
+        newgenome = self.genome.mutate(config.mutation_rate)
         newchar = Character(self.world)
         newchar.load_genome(newgenome)
         newchar.set_midpoint_x(self.midx)
         newchar.set_midpoint_y(self.midy)
         newchar.gen = self.gen + 1
         newchar.parents = 1
-        newchar.energy = 4000
+        newchar.energy = config.child_energy
         self.children += 1
-        self.world.allcharacters.add(newchar)
+        self.world.events.born(newchar)
 
     cpdef void set_midpoint_x(self, double x):
         self.midx = x
@@ -534,6 +790,9 @@ cdef class Character(Sprite):
         self.midy = y
         self.rect.y = y - 2 - self.r
 
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._inputs.shape[0] * sizeof(double)
+
     def __repr__(self):
         return '<Char at {},{}>'.format(self.rect.x, self.rect.y)
 
@@ -543,6 +802,7 @@ cdef class Character(Sprite):
             "created at: %dt" % self.created,
             "age: %dt" % self.age,
             "generation: %d" % self.gen,
+            "species: %d" % self.species,
             "energy: %.2fJ" % self.energy,
             "r: %dm" % self.r,
             "mass: %dkg" % self.mass,
@@ -553,8 +813,18 @@ cdef class Character(Sprite):
             "y: %dm S" % self.midy,
         ])
 
+    def info_key(self):
+        """The values shown by __str__, to tell when it needs rebuilding."""
+        return (
+            self.predator, self.created, self.age, self.gen, self.species,
+            round(self.energy, 2), self.r, self.mass, round(self.angle, 2),
+            round(self.speed, 2), self.children, int(self.midx),
+            int(self.midy))
+
     def dump(self):
         obj = {
+            'id': self.id,
+            'species': self.species,
             'r': self.r,
             'x': self.rect.x,
             'y': self.rect.y,
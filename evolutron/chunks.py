@@ -0,0 +1,226 @@
+'''chunks.py -- the world's tiles, paged in and out a chunk at a time.
+
+The terrain, trees and food counts of every tile live in flat arrays in a
+memory-mapped file, so a world can be far bigger than the TileViews that
+would fit in memory. TileViews are created a chunk (a square of tiles) at a
+time, when a character comes near it or it comes into view, and the least
+recently used chunks are evicted again once there are more than max_chunks,
+keeping only their food counts. Tiles grow the food they would have grown
+while paged out in one step, the next time they are updated (see
+TileView.update()).
+'''
+import mmap
+import random
+import tempfile
+import collections
+
+import mapgen
+import tiles
+
+TREE_BYTES = 3 # radius (0 for no tree), x, y within the tile
+
+
+def plant_trees(terrain, w, h):
+    '''Return the tree array for terrain codes, with a random tree on each
+    forest tile of w x h pixels.'''
+    trees = bytearray(len(terrain) * TREE_BYTES)
+    forest = mapgen.FOREST
+    for index, code in enumerate(terrain):
+        if code == forest:
+            trees[index * TREE_BYTES:(index + 1) * TREE_BYTES] = bytes((
+                random.randint(4, 18), # radius
+                random.randint(0, w), # x
+                random.randint(0, h))) # y
+    return trees
+
+
+class Chunk(object):
+    def __init__(self, cx, cy):
+        self.cx = cx
+        self.cy = cy
+        self.tiles = []
+        self.last_used = 0 # world.age when last needed
+        self.phase = 0 # tick, modulo tile_lod_interval, its quiet tiles update
+
+    def __repr__(self):
+        return '<Chunk %d,%d>' % (self.cx, self.cy)
+
+
+class ChunkStore(object):
+    """Pages a world's TileViews in and out of its alltiles group.
+
+    The tile (i, j) is at index i * sizey + j in each array.
+    """
+
+    def __init__(self, world, sizex, sizey, chunk_tiles=16, max_chunks=64):
+        self.world = world
+        self.sizex = sizex
+        self.sizey = sizey
+        self.chunk_tiles = chunk_tiles
+        self.max_chunks = max_chunks
+        self.chunks_x = -(-sizex // chunk_tiles)
+        self.chunks_y = -(-sizey // chunk_tiles)
+
+        n = sizex * sizey
+        nchunks = self.chunks_x * self.chunks_y
+        size = n * (1 + TREE_BYTES + 1) + nchunks * 4
+        self._file = tempfile.TemporaryFile()
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        view = memoryview(self._mmap)
+        self.terrain = view[:n]
+        self.trees = view[n:n * (1 + TREE_BYTES)]
+        self.food = view[n * (1 + TREE_BYTES):n * (2 + TREE_BYTES)]
+        # last tick each evicted chunk's food was grown for
+        self.evicted_at = view[n * (2 + TREE_BYTES):].cast('I')
+
+        self.loaded = collections.OrderedDict() # (cx, cy) -> Chunk, LRU first
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def resident(self):
+        '''Whether every chunk is loaded and none will be evicted, so that
+        nothing needs to be required any more.'''
+        return len(self.loaded) == self.chunks_x * self.chunks_y \
+            and len(self.loaded) <= self.max_chunks
+
+    def generate(self):
+        '''Fill in random terrain, and a tree on each forest tile.'''
+        self.terrain[:] = mapgen.generate_codes(self.sizex, self.sizey)
+        self.trees[:] = plant_trees(
+            self.terrain, self.world.tile_w, self.world.tile_h)
+
+    def tree_positions(self):
+        '''Yield (x, y, r) in world coordinates of every tree, loaded or not.'''
+        w, h = self.world.tile_w, self.world.tile_h
+        trees = self.trees
+        sizey = self.sizey
+        for index in range(0, len(trees), TREE_BYTES):
+            r = trees[index]
+            if r:
+                i, j = divmod(index // TREE_BYTES, sizey)
+                yield i * w + trees[index + 1], j * h + trees[index + 2], r
+
+    def require(self, cx, cy):
+        '''Return chunk (cx, cy), loading it if need be, and mark it used.'''
+        key = cx, cy
+        chunk = self.loaded.get(key)
+        if chunk is None:
+            chunk = self._load(cx, cy)
+        else:
+            self.loaded.move_to_end(key)
+        chunk.last_used = self.world.age
+        return chunk
+
+    def require_around(self, x, y):
+        '''Require the chunks holding the tile at world position x, y and
+        the tiles around it.'''
+        c = self.chunk_tiles
+        i = int(x // self.world.tile_w)
+        j = int(y // self.world.tile_h)
+        cx0 = max(i - 1, 0) // c
+        cx1 = min(i + 1, self.sizex - 1) // c
+        cy0 = max(j - 1, 0) // c
+        cy1 = min(j + 1, self.sizey - 1) // c
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.require(cx, cy)
+
+    def require_rect(self, rect):
+        '''Require and return the chunks overlapping a rect in world coordinates.'''
+        cw = self.chunk_tiles * self.world.tile_w
+        ch = self.chunk_tiles * self.world.tile_h
+        cx0 = max(rect.left // cw, 0)
+        cx1 = min((rect.right - 1) // cw, self.chunks_x - 1)
+        cy0 = max(rect.top // ch, 0)
+        cy1 = min((rect.bottom - 1) // ch, self.chunks_y - 1)
+        return [self.require(cx, cy)
+                for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+
+    def evict(self):
+        '''Evict least recently used chunks not needed this tick, down to
+        max_chunks.'''
+        age = self.world.age
+        while len(self.loaded) > self.max_chunks:
+            chunk = next(iter(self.loaded.values()))
+            if chunk.last_used >= age:
+                break # everything left is in use
+            self._evict(chunk)
+
+    def _bounds(self, chunk):
+        c = self.chunk_tiles
+        i0, j0 = chunk.cx * c, chunk.cy * c
+        return i0, min(i0 + c, self.sizex), j0, min(j0 + c, self.sizey)
+
+    def _load(self, cx, cy):
+        world = self.world
+        chunk = Chunk(cx, cy)
+        grown_to = self.evicted_at[cy * self.chunks_x + cx]
+        trees = self.trees
+        i0, i1, j0, j1 = self._bounds(chunk)
+        for i in range(i0, i1):
+            for j in range(j0, j1):
+                index = i * self.sizey + j
+                tree = None
+                if trees[index * TREE_BYTES]:
+                    tree = trees[index * TREE_BYTES:(index + 1) * TREE_BYTES]
+                tile = tiles.TileView(
+                    world, i, j, world.tile_w, world.tile_h,
+                    self.terrain[index], tuple(tree) if tree else None)
+                tile.grown_to = grown_to
+                world.density.set_food(tile, 0) # counted again as it grows
+                for n in range(self.food[index]):
+                    tile.grow_food()
+                world.alltiles.add(tile)
+                world.alltiles_coords[i, j] = tile
+                chunk.tiles.append(tile)
+        self._link(i0, i1, j0, j1)
+        self.loaded[cx, cy] = chunk
+        chunk.phase = self.loads
+        self.loads += 1
+        return chunk
+
+    def _evict(self, chunk):
+        world = self.world
+        active = world.active_item
+        # this tick's food has not grown yet
+        grown_to = int(world.age) - 1
+        for tile in chunk.tiles:
+            count = len(tile.allfood) + tile.food_grown(grown_to - tile.grown_to)
+            self.food[tile.x * self.sizey + tile.y] = min(count, 255)
+            world.density.set_food(tile, min(count, 255))
+            world.allfood.remove(*tile.allfood)
+            world.alltrees.remove(*tile.alltrees)
+            world.alltiles.remove(tile)
+            del world.alltiles_coords[tile.x, tile.y]
+            if active is tile or getattr(active, 'tile', None) is tile:
+                world.deselect()
+        self.evicted_at[chunk.cy * self.chunks_x + chunk.cx] = grown_to
+        del self.loaded[chunk.cx, chunk.cy]
+        self._link(*self._bounds(chunk))
+        self.evictions += 1
+
+    def _link(self, i0, i1, j0, j1):
+        '''Rebuild the neighbourhoods of tiles i0 <= i < i1, j0 <= j < j1
+        and the ring of tiles around them.'''
+        coords = self.world.alltiles_coords
+        for i in range(i0 - 1, i1 + 1):
+            for j in range(j0 - 1, j1 + 1):
+                tile = coords.get((i, j))
+                if tile is None:
+                    continue
+                tile.neighbourhood = [
+                    neighbour for neighbour in (
+                        coords.get((i + di, j + dj))
+                        for di in (-1, 0, 1) for dj in (-1, 0, 1))
+                    if neighbour is not None]
+
+    def stats(self):
+        return {
+            'loaded': len(self.loaded),
+            'tiles': len(self.world.alltiles),
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'file_bytes': len(self._mmap),
+        }
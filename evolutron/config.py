@@ -0,0 +1,119 @@
+'''config.py -- tunable simulation parameters.
+
+A Config is created once per world and read by the world, its tiles and its
+characters. Override values with Config(name=value, ...), from the command
+line with `--set name=value`, or per run in a sweep (see sweep.py).
+'''
+import mapgen
+
+
+class Config(object):
+    """Simulation parameters; class attributes hold the defaults."""
+
+    # world
+    min_characters = 150 # topped up with random characters each tick
+    chunk_tiles = 16 # width and height of a chunk of tiles (see chunks.py)
+    max_chunks = 64 # chunks kept in memory when not in use
+    tile_lod_interval = 8 # ticks between updates of tiles no character is near
+
+    # brain outputs memoized per genome (see characters.BrainMemo): entries
+    # kept, 0 for none, and the width in J of the energy buckets they are
+    # kept for, which trades accuracy for hits
+    brain_memo = 0
+    brain_memo_energy = 100.0
+
+    # reproduction
+    mutation_rate = 0.01 # chance of each gene mutating in a child
+    spawn_energy = 5000.0 # needed for, and spent on, asexual reproduction
+    mate_energy = 2500.0 # needed for, and spent by each parent on, mating
+    child_energy = 4000.0 # a newborn's energy
+
+    # energy spent per tick
+    base_cost = 10.0 # just for being alive
+    move_cost = 5.0 # per unit of forward impulse
+    reverse_cost = 10.0 # per unit of backward impulse
+
+    # food growth: chance per tick of a tile growing food, and the most food
+    # a tile holds, by terrain
+    meadow_fertility = 0.0025
+    meadow_max_food = 2
+    forest_fertility = 0.005
+    forest_max_food = 10
+    lake_fertility = 0.0
+    lake_max_food = 0
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            self.set(name, value)
+
+    @classmethod
+    def names(cls):
+        return sorted(
+            name for name, value in vars(cls).items()
+            if not name.startswith('_') and isinstance(value, (int, float)))
+
+    def set(self, name, value):
+        '''Set a parameter, converting strings to the default's type.
+
+        Parameters with int defaults are counts, and only take whole numbers.
+        '''
+        if name not in self.names():
+            raise ValueError('unknown parameter %r; choose from %s' % (
+                name, ', '.join(self.names())))
+        default = getattr(Config, name)
+        number = float(value)
+        if isinstance(default, int) and not isinstance(default, bool):
+            if not number.is_integer():
+                raise ValueError('%s takes a whole number, not %r' % (
+                    name, value))
+            number = int(number)
+        setattr(self, name, number)
+
+    def food(self, terrain_code):
+        '''Return (fertility, max_food) for a mapgen terrain code.'''
+        if terrain_code == mapgen.MEADOW:
+            return self.meadow_fertility, self.meadow_max_food
+        if terrain_code == mapgen.FOREST:
+            return self.forest_fertility, self.forest_max_food
+        if terrain_code == mapgen.LAKE:
+            return self.lake_fertility, self.lake_max_food
+        return 0.5, 10
+
+    def dump(self):
+        return dict((name, getattr(self, name)) for name in self.names())
+
+    def __repr__(self):
+        changed = ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.names()
+            if getattr(self, name) != getattr(Config, name))
+        return 'Config(%s)' % changed
+
+
+def parse_set(spec):
+    '''Parse 'name=value' into (name, value).'''
+    name, sep, value = spec.partition('=')
+    if not sep:
+        raise ValueError('expected name=value, got %r' % spec)
+    return name, value
+
+
+def parse_sweep(spec, names, kind='parameter'):
+    '''Parse 'name=start:stop:steps' or 'name=v1,v2,...' into (name, values).
+
+    names -- the names allowed, of what kind
+    '''
+    name, _, values = spec.partition('=')
+    if name not in names:
+        raise ValueError('unknown %s %r; choose from %s' % (
+            kind, name, ', '.join(names)))
+    if ':' in values:
+        try:
+            start, stop, steps = values.split(':')
+        except ValueError:
+            raise ValueError('%r is not name=start:stop:steps' % spec)
+        start, stop, steps = float(start), float(stop), int(steps)
+        if steps < 2:
+            return name, (start,)
+        step = (stop - start) / (steps - 1)
+        return name, tuple(start + step * i for i in range(steps))
+    return name, tuple(float(v) for v in values.split(','))
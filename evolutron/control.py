@@ -0,0 +1,290 @@
+'''control.py -- local control and metrics server for a running simulation.
+
+The server runs an asyncio event loop in a background thread, listening on a
+Unix socket or a localhost TCP port; it has no authentication, so it is
+never served on another interface. Clients send one command per line and
+get one JSON object per line back:
+
+    metrics             live metrics (ticks/sec, population, phase timings)
+    pause / resume      stop or restart ticking
+    tickrate <n>        target ticks per second (0 for as fast as possible)
+    speed [s]           run at 1x, 10x or max times the target tick rate;
+                        without s, the current speed
+    dump [id]           the active creature, or the creature with that id
+    checkpoint [name]   write every creature to checkpoints/<name>, by
+                        default checkpoint-<tick>.json
+    memory              bytes and object counts per subsystem (memreport.py)
+    stream [seconds]    send metrics every interval until disconnected
+    help                list the commands
+
+The simulation is never blocked: commands that touch it are queued and
+applied by the main loop between ticks, and metrics are published by the
+main loop once per tick for the server to read.
+'''
+import os
+import json
+import time
+import queue
+import socket
+import asyncio
+import ipaddress
+import threading
+import collections
+
+import scheduler
+
+
+class SimState(object):
+    """Main loop state that can be changed by keys and control commands."""
+
+    def __init__(self, window, tickrate=1/60., checkpoint_dir='checkpoints'):
+        self.window = window
+        self.checkpoint_dir = checkpoint_dir
+        self.tickrate = tickrate # seconds per tick, target maximum
+        self.pause = False
+        self.render = True
+        self.streamer = None # stream.Streamer, if a viewer is attached
+        self.reporter = None # memreport.Reporter, created when first needed
+        self.scheduler = None # scheduler.TickScheduler of the main loop
+        self._tick_times = collections.deque(maxlen=60)
+
+    def ticked(self):
+        self._tick_times.append(time.perf_counter())
+
+    @property
+    def ticks_per_sec(self):
+        times = self._tick_times
+        if self.pause or len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def metrics(self):
+        world = self.window.world
+        stats = world.stats
+        return {
+            'tick': int(world.age),
+            'ticks_per_sec': round(self.ticks_per_sec, 2),
+            'paused': self.pause,
+            'tickrate': self.tickrate and 1 / self.tickrate,
+            'speed': self.scheduler and self.scheduler.name,
+            'population': stats.population,
+            'genomes': len(world.genomes),
+            'avgage': round(stats.avgage, 2),
+            'avggen': round(stats.avggen, 2),
+            'species': len(world.species),
+            'species_extinct': world.species.extinct,
+            'largest_species': world.species.counts()[:10],
+            'phase_ms': dict(
+                (phase, round(seconds * 1000, 3))
+                for phase, seconds in world.phase_times.items()),
+            'stream': self.streamer and self.streamer.stats(),
+            'chunks': world.chunks.stats(),
+            'lod': world.lod_counts,
+            'events': world.event_counts,
+            'brain_memo': world.genomes.memo_stats(),
+        }
+
+    def memory(self):
+        if self.reporter is None:
+            import memreport
+            self.reporter = memreport.Reporter(self.window)
+        return self.reporter.report()
+
+    def memory_text(self):
+        report = self.memory()
+        return self.reporter.format(report)
+
+    def find_character(self, character_id):
+        for character in self.window.world.allcharacters:
+            if character.id == character_id:
+                return character
+        return None
+
+    def checkpoint(self, name=None):
+        """Write every creature to a file in checkpoint_dir; return its path.
+
+        name -- a bare file name, from a client, so not a path
+        """
+        world = self.window.world
+        if name is None:
+            name = 'checkpoint-%08d.json' % world.age
+        if name != os.path.basename(name) or name in ('.', '..'):
+            raise ValueError('checkpoint takes a file name, not a path')
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        filename = os.path.join(self.checkpoint_dir, name)
+        with open(filename, 'w') as f:
+            json.dump({
+                'age': world.age,
+                'characters': [c.dump() for c in world.allcharacters],
+            }, f)
+        return filename
+
+
+# Commands applied between ticks by the main loop; each is called with the
+# SimState and the command's arguments and returns a JSON-able reply.
+
+def _pause(state, args):
+    state.pause = True
+    return {'paused': True}
+
+def _resume(state, args):
+    state.pause = False
+    return {'paused': False}
+
+def _tickrate(state, args):
+    rate = float(args[0])
+    state.tickrate = 1 / rate if rate > 0 else 0
+    return {'tickrate': rate}
+
+def _speed(state, args):
+    if args:
+        state.scheduler.set_speed(args[0])
+    return {'speed': state.scheduler.name,
+            'speeds': [name for speed, name in scheduler.SPEEDS]}
+
+def _dump(state, args):
+    if args:
+        character = state.find_character(int(args[0]))
+    else:
+        character = state.window.world.active_item
+    if character is None or not hasattr(character, 'dump'):
+        return {'error': 'no such creature'}
+    return character.dump()
+
+def _checkpoint(state, args):
+    return {'checkpoint': state.checkpoint(*args[:1])}
+
+def _memory(state, args):
+    return state.memory()
+
+COMMANDS = {
+    'pause': _pause,
+    'resume': _resume,
+    'tickrate': _tickrate,
+    'speed': _speed,
+    'dump': _dump,
+    'checkpoint': _checkpoint,
+    'memory': _memory,
+}
+
+
+def _loopback(host):
+    """Whether every address host resolves to is a loopback one."""
+    try:
+        infos = socket.getaddrinfo(host.strip('[]'), None)
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(info[4][0]).is_loopback
+               for info in infos)
+
+
+class ControlServer(object):
+    """Serves control commands and metrics from a background thread.
+
+    address -- a Unix socket path, or 'host:port' / 'port' for TCP. TCP is
+        only served on localhost; other hosts raise ValueError.
+    """
+
+    def __init__(self, address):
+        host, _, port = address.rpartition(':')
+        if port.isdigit() and host and not _loopback(host):
+            raise ValueError('control server only listens on localhost, '
+                             'not %r' % host)
+        self.address = address
+        self.commands = queue.Queue()
+        self.metrics = {}
+        self.loop = None
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='control')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        self.loop = loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            host, _, port = self.address.rpartition(':')
+            if port.isdigit():
+                server = asyncio.start_server(
+                    self._client, host.strip('[]') or '127.0.0.1', int(port))
+            else:
+                if os.path.exists(self.address):
+                    os.unlink(self.address)
+                server = asyncio.start_unix_server(
+                    self._client, path=self.address)
+            loop.run_until_complete(server)
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        loop.run_forever()
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode('utf-8', 'replace').split()
+                if not words:
+                    continue
+                command, args = words[0], words[1:]
+                if command == 'stream':
+                    await self._stream(writer, float(args[0]) if args else 1.0)
+                    break
+                reply = await self._handle(command, args)
+                writer.write((json.dumps(reply) + '\n').encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, command, args):
+        if command == 'metrics':
+            return self.metrics
+        if command == 'help':
+            return {'commands': sorted(list(COMMANDS) + ['metrics', 'stream'])}
+        if command not in COMMANDS:
+            return {'error': 'unknown command %r' % command}
+        future = self.loop.create_future()
+        self.commands.put((command, args, future))
+        return await future
+
+    async def _stream(self, writer, interval):
+        while True:
+            writer.write((json.dumps(self.metrics) + '\n').encode('utf-8'))
+            await writer.drain()
+            await asyncio.sleep(interval)
+
+    # Called from the main loop:
+
+    def publish(self, metrics):
+        """Make a new metrics snapshot available to clients."""
+        self.metrics = metrics
+
+    def apply(self, state):
+        """Apply the queued commands to state; call between ticks."""
+        replies = []
+        while True:
+            try:
+                command, args, future = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                reply = COMMANDS[command](state, args)
+            except Exception as e:
+                reply = {'error': '%s: %s' % (e.__class__.__name__, e)}
+            replies.append((future, reply))
+        if replies:
+            # so that metrics requested after a reply reflect the command
+            self.publish(state.metrics())
+            for future, reply in replies:
+                self.loop.call_soon_threadsafe(future.set_result, reply)
@@ -0,0 +1,92 @@
+'''density.py -- per-tile counts of creatures, food and energy, kept current.
+
+A DensityGrid holds, for every tile of the world whether it is loaded or
+not, the number of prey, predators and food on it and the energy of its
+creatures. They live in flat arrays with tile (i, j) at index j * sizex + i,
+row by row like the pixels of an image, and are never recomputed: the world
+reports births and deaths (through its callbacks), creatures report moving
+to another tile and eating, tiles report food growing and being eaten, and
+the ChunkStore reports the food of tiles it pages in and out.
+
+A creature's energy changes every tick, so each is counted with the energy
+it had at its last birth, change of tile or meal.
+'''
+from array import array
+
+
+class DensityGrid(object):
+
+    def __init__(self, world):
+        self.world = world
+        self.tile_w = world.tile_w
+        self.tile_h = world.tile_h
+        self.sizex = world.world_w // world.tile_w
+        self.sizey = world.world_h // world.tile_h
+        n = self.sizex * self.sizey
+        self.prey = array('H', [0]) * n
+        self.predators = array('H', [0]) * n
+        self.food = array('H', [0]) * n
+        self.energy = array('d', [0.0]) * n
+        self._cells = {} # character -> (index, energy it is counted with)
+        self.changes = 0 # for views, to tell when to redraw
+        world.birth_callbacks.append(self.born)
+        world.death_callbacks.append(self.died)
+
+    def index(self, x, y):
+        """Index of the tile at world position (x, y)."""
+        i = min(max(int(x // self.tile_w), 0), self.sizex - 1)
+        j = min(max(int(y // self.tile_h), 0), self.sizey - 1)
+        return j * self.sizex + i
+
+    def _add(self, character, index):
+        counts = self.predators if character.predator else self.prey
+        counts[index] += 1
+        energy = character.energy
+        self.energy[index] += energy
+        self._cells[character] = index, energy
+
+    def _remove(self, character, index, energy):
+        counts = self.predators if character.predator else self.prey
+        counts[index] -= 1
+        if self.prey[index] or self.predators[index]:
+            self.energy[index] -= energy
+        else:
+            self.energy[index] = 0.0 # rather than rounding errors
+
+    def born(self, character):
+        self._add(character, self.index(character.midx, character.midy))
+        self.changes += 1
+
+    def died(self, character):
+        self._remove(character, *self._cells.pop(character))
+        self.changes += 1
+
+    def moved(self, character):
+        """Recount a creature that moved to another tile or ate."""
+        cell = self._cells.get(character)
+        if cell is None:
+            return # born this tick; counted when the tick ends
+        self._remove(character, *cell)
+        self._add(character, self.index(character.midx, character.midy))
+        self.changes += 1
+
+    def grew(self, tile):
+        self.food[tile.y * self.sizex + tile.x] += 1
+        self.changes += 1
+
+    def eaten(self, tile):
+        self.food[tile.y * self.sizex + tile.x] -= 1
+        self.changes += 1
+
+    def set_food(self, tile, count):
+        """Set the food count of a tile being paged in or out."""
+        self.food[tile.y * self.sizex + tile.x] = count
+        self.changes += 1
+
+    def totals(self):
+        return {
+            'prey': sum(self.prey),
+            'predators': sum(self.predators),
+            'food': sum(self.food),
+            'energy': sum(self.energy),
+        }
@@ -0,0 +1,158 @@
+'''difftest.py -- check the fast tick against reference.py, tick by tick.
+
+Runs seeded random worlds headless. Before every WorldView.step() the world
+is copied with reference.snapshot(), and the copy is stepped by
+reference.step(); the two results must then agree on which characters are
+alive, who was born and who died, where every character is, its energy,
+speed and heading, and what food is left:
+
+    python evolutron --difftest 3 --difftest-ticks 500
+
+Each tick starts again from a fresh snapshot, so a difference shows up on
+the tick that causes it rather than growing from there.
+
+Random worlds seldom breed in their first few hundred ticks, so the
+predators scenario (see scenarios.py), where prey spawn and mate from tick
+100, is checked as well unless --difftest-scenarios says otherwise. A run
+that checked no births is warned about, and if none did the test fails.
+'''
+import sys
+import time
+import random
+
+import config as _config
+import reference
+import sweep
+import headless
+import scenarios
+
+# compared within the tolerance, relative to the larger of 1 and the value
+APPROXIMATE = ('midx', 'midy', 'angle', 'speed', 'energy')
+EXACT = ('r', 'haptic', 'spawn_refractory', 'age', 'gen', 'parents',
+         'children', 'foodchain', 'tile')
+
+
+def compare(expected, actual, deaths, tolerance):
+    '''Return a list of differences between two stepped reference.Worlds.
+
+    deaths -- ids of the characters that died in the fast step.
+    '''
+    problems = []
+    expected_ids = [c.id for c in expected.characters]
+    actual_ids = [c.id for c in actual.characters]
+    if expected_ids != actual_ids:
+        problems.append('characters: expected %s, got %s' % (
+            sorted(set(expected_ids) - set(actual_ids)),
+            sorted(set(actual_ids) - set(expected_ids))))
+    if expected.deaths != deaths:
+        problems.append('deaths: expected %s, got %s' % (
+            expected.deaths, deaths))
+    born = [c.id for c in expected.births]
+    if born != actual_ids[len(actual_ids) - len(born):]:
+        problems.append('births: expected %s' % born)
+
+    by_id = dict((c.id, c) for c in actual.characters)
+    for e in expected.characters:
+        a = by_id.get(e.id)
+        if a is None:
+            continue
+        for name in APPROXIMATE:
+            x, y = getattr(e, name), getattr(a, name)
+            if not abs(x - y) <= tolerance * max(1, abs(x)):
+                problems.append('character %d %s: expected %r, got %r' % (
+                    e.id, name, x, y))
+        for name in EXACT:
+            x, y = getattr(e, name), getattr(a, name)
+            if x != y:
+                problems.append('character %d %s: expected %r, got %r' % (
+                    e.id, name, x, y))
+
+    for coord, tile in expected.tiles.items():
+        expected_food = set(f.key for f in tile.food)
+        actual_food = set(f.key for f in actual.tiles[coord].food)
+        if expected_food != actual_food:
+            problems.append('tile %r: %d food expected, %d left' % (
+                coord, len(expected_food), len(actual_food)))
+    return problems
+
+
+def run(settings, seed, ticks=200, world_w=2000, world_h=2000,
+        tolerance=1e-9, limit=10, out=sys.stdout, fixture=None):
+    '''Step a seeded world, or a scenario fixture's, with both engines.
+
+    Returns (ticks that differed, asexual births, mated births, deaths),
+    the last three to show how much of step() was exercised. The first
+    `limit` differing ticks are described on out.
+    '''
+    screen = headless.init()
+    import window as _window
+    random.seed(seed)
+    if fixture is None:
+        win = _window.Window(
+            screen, world_w, world_h, _config.Config(**settings))
+    else:
+        win = _window.Window(
+            screen, fixture['world_w'], fixture['world_h'],
+            scenarios.config(fixture, **settings))
+        scenarios.populate(win.world, fixture)
+    world = win.world
+    offspring = []
+    deaths = []
+    world.birth_callbacks.append(lambda c: offspring.append(c.genome))
+    world.death_callbacks.append(lambda c: deaths.append(c.id))
+
+    failed = spawned = mated = died = 0
+    for tick in range(ticks):
+        world.prepare()
+        expected = reference.snapshot(world)
+        del offspring[:]
+        del deaths[:]
+        world.step()
+        reference.step(expected, offspring)
+        for child in expected.births:
+            if child.parents == 1:
+                spawned += 1
+            else:
+                mated += 1
+        died += len(expected.deaths)
+        problems = compare(
+            expected, reference.snapshot(world), deaths, tolerance)
+        if problems:
+            failed += 1
+            if failed <= limit:
+                print('seed %d tick %d:' % (seed, world.age), file=out)
+                for problem in problems[:10]:
+                    print('    ' + problem, file=out)
+                if len(problems) > 10:
+                    print('    ... and %d more' % (len(problems) - 10),
+                          file=out)
+    return failed, spawned, mated, died
+
+
+def main(args):
+    '''args -- parsed ArgumentParser Namespace from real main()'''
+    settings = dict(args.set)
+    runs = [('seed %d' % seed, seed, None)
+            for seed in sweep.parse_seeds(args.difftest)]
+    for name in filter(None, args.difftest_scenarios.split(',')):
+        runs.append((name, 0, scenarios.find(name)))
+    failed = births = 0
+    for name, seed, fixture in runs:
+        t = time.perf_counter()
+        run_failed, spawned, mated, deaths = run(
+            settings, seed, args.difftest_ticks,
+            tolerance=args.difftest_tolerance, fixture=fixture)
+        print('%s: %d of %d ticks differ; %d births (%d asexual, %d mated), '
+              '%d deaths (%.1fs)' % (
+                  name, run_failed, args.difftest_ticks, spawned + mated,
+                  spawned, mated, deaths, time.perf_counter() - t))
+        if not spawned + mated:
+            print('%s: warning: no births were checked' % name,
+                  file=sys.stderr)
+        failed += run_failed
+        births += spawned + mated
+    if not births:
+        print('no run checked a birth; run more --difftest-ticks',
+              file=sys.stderr)
+        return 1
+    return 1 if failed else 0
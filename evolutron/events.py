@@ -0,0 +1,61 @@
+'''events.py -- births, deaths and meals of a tick, applied when it ends.
+
+Characters are born, die and eat while the tick iterates over the world's
+groups. Instead of changing the groups there and then, they are recorded in
+the world's TickEvents, and WorldView.commit() applies them all once every
+phase of the tick is done: eaten food first, then deaths, then births, each
+in the order they happened. Until then:
+
+- a dead character has Character.dead set, and takes no further part in
+  the tick;
+- eaten food has no energy left, so a second character touching it in the
+  same tick gains nothing;
+- a newborn is not yet in the world, has no id, and first senses and moves
+  on the next tick.
+
+Energy taken by predators is applied at once, since later collisions in the
+same tick depend on it, and logged in parallel arrays.
+'''
+from array import array
+
+
+class TickEvents(object):
+
+    def __init__(self):
+        self.births = [] # Characters
+        self.deaths = [] # Characters
+        self.food = [] # Food
+        # one entry per bite: predator id, prey id, joules moved
+        self.predators = array('l')
+        self.prey = array('l')
+        self.transfers = array('d')
+
+    def born(self, character):
+        self.births.append(character)
+
+    def died(self, character):
+        self.deaths.append(character)
+
+    def ate(self, food):
+        self.food.append(food)
+
+    def bite(self, predator, prey, energy):
+        self.predators.append(predator.id)
+        self.prey.append(prey.id)
+        self.transfers.append(energy)
+
+    def counts(self):
+        return {
+            'births': len(self.births),
+            'deaths': len(self.deaths),
+            'food': len(self.food),
+            'bites': len(self.transfers),
+        }
+
+    def clear(self):
+        del self.births[:]
+        del self.deaths[:]
+        del self.food[:]
+        del self.predators[:]
+        del self.prey[:]
+        del self.transfers[:]
@@ -0,0 +1,74 @@
+'''extensions.py -- load the Cython extension modules.
+
+Extensions prebuilt with `python setup.py build_ext --inplace` are used when
+they are present. Any that are missing are compiled on the fly with
+pyximport, which is slow on a cold start. Either way Cython is needed:
+there is no pure-Python fallback, as the modules are written with cdef
+classes and typed memoryviews that plain Python cannot run.
+'''
+import os
+import re
+import sys
+import importlib.machinery
+
+EXTENSIONS = ('sprite', 'geometry', 'neuron', 'characters', 'group')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_CIMPORT = re.compile(r'^\s*(?:from\s+(\w+)\s+cimport|cimport\s+(\w+))', re.M)
+
+
+def _sources(name):
+    """Return the paths of a module's .pyx and .pxd, and of the .pxd files
+    they cimport from this directory, and those cimport, and so on."""
+    paths = []
+    seen = set([name])
+    todo = [name + '.pyx', name + '.pxd']
+    while todo:
+        path = os.path.join(HERE, todo.pop())
+        if not os.path.exists(path):
+            continue # a .pxd of libc, cpython, cython, or none at all
+        paths.append(path)
+        with open(path) as f:
+            text = f.read()
+        for match in _CIMPORT.finditer(text):
+            module = match.group(1) or match.group(2)
+            if module not in seen:
+                seen.add(module)
+                todo.append(module + '.pxd')
+    return paths
+
+
+def _prebuilt(name):
+    """Return the path of a prebuilt extension, or None."""
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        path = os.path.join(HERE, name + suffix)
+        if os.path.exists(path):
+            built = os.path.getmtime(path)
+            stale = [os.path.basename(source) for source in _sources(name)
+                     if os.path.getmtime(source) > built]
+            if stale:
+                print('warning: %s is older than %s; rebuild with '
+                      '"python setup.py build_ext --inplace"' % (
+                          os.path.basename(path), ', '.join(stale)),
+                      file=sys.stderr)
+            return path
+    return None
+
+
+def install():
+    """Make the extension modules importable.
+
+    Returns 'prebuilt' or 'pyximport' according to the path taken.
+    """
+    if all(_prebuilt(name) for name in EXTENSIONS):
+        return 'prebuilt'
+    try:
+        import pyximport
+    except ImportError:
+        raise ImportError(
+            'the Cython extensions are not built and Cython is not '
+            'installed; pip install cython, then run '
+            '"python setup.py build_ext --inplace"')
+    pyximport.install()
+    return 'pyximport'
@@ -24,6 +24,7 @@ class Food(pygame.sprite.Sprite):
     def eaten(self):
         self.tile.allfood.remove(self)
         self.tile.world.allfood.remove(self)
+        self.tile.world.density.eaten(self.tile)
 
     def draw(self):
         if self.redraw:
@@ -1,5 +1,9 @@
 import random
 import struct
+import hashlib
+from array import array
+
+from neuron import IDENTITY, SIGMOID
 
 class Genome(object):
     def __init__(self, inputs, outputs):
@@ -8,11 +12,16 @@ class Genome(object):
         self.predator = 0
         self.hidden_neurons = 0
         self.hidden0_weights = []
+        # hidden layers after the first, as (size, weights) tuples; each
+        # layer's weights are laid out like hidden0_weights, with one weight
+        # per neuron of the layer before
+        self.extra_layers = []
         self.output_weights = []
 
         # These are not part of the genome but used to speed up calculations
         self._inputs = inputs
         self._outputs = outputs
+        self._key = None
 
 
     @classmethod
@@ -36,39 +45,133 @@ class Genome(object):
 
 
     def mutate(self, rate=0.01):
+        """Return a mutated copy of this genome.
+
+        Mutation is copy-on-write: the weight lists of the child are shared
+        with the parent unless one of their genes actually changes, and if
+        nothing mutates at all the parent itself is returned. Genomes must
+        therefore be treated as immutable once created.
+        """
+        size = int(round(self._mutate_single(self.size, rate, min=7)))
+        hue = self._mutate_single(self.hue, rate) % 100.0
+        predator = self._mutate_single(self.predator, rate)
+        hidden_neurons = int(round(self._mutate_single(self.hidden_neurons, rate, min=3)))
+        if self.extra_layers:
+            hidden0_weights = self._mutate_layer(
+                self.hidden0_weights, hidden_neurons * self._inputs, rate)
+            output_weights = None # they follow the last layer; see below
+        else:
+            hidden0_weights, output_weights = self._mutate_neurons(
+                hidden_neurons, rate)
+
+        # layers after the first follow the size of the layer before them
+        fan_in = hidden_neurons
+        extra_layers = []
+        for layer_size, weights in self.extra_layers:
+            layer_size = int(round(self._mutate_single(layer_size, rate, min=1)))
+            weights = self._mutate_layer(weights, layer_size * fan_in, rate)
+            extra_layers.append((layer_size, weights))
+            fan_in = layer_size
+        r = random.random()
+        if r < rate / 2:
+            # grow a layer, the same size as the last, before the outputs
+            extra_layers.append((fan_in, self._fit([], fan_in * fan_in)))
+        elif r < rate and extra_layers:
+            extra_layers.pop()
+            fan_in = extra_layers[-1][0] if extra_layers else hidden_neurons
+        if output_weights is None:
+            output_weights = self._mutate_layer(
+                self.output_weights, fan_in * self._outputs, rate)
+
+        if (size == self.size and hue == self.hue
+        and predator == self.predator
+        and hidden_neurons == self.hidden_neurons
+        and hidden0_weights is self.hidden0_weights
+        and len(extra_layers) == len(self.extra_layers)
+        and all(new[1] is old[1] for new, old in zip(extra_layers, self.extra_layers))
+        and output_weights is self.output_weights):
+            return self
+
         new = self.__class__(self._inputs, self._outputs)
-        new.size = int(round(self._mutate_single(self.size, rate, min=7)))
-        new.hue = self._mutate_single(self.hue, rate) % 100.0
-        new.predator = self._mutate_single(self.predator, rate)
-        new.hidden_neurons = int(round(self._mutate_single(self.hidden_neurons, rate, min=3)))
-        iterate_over = self.hidden_neurons
-        if new.hidden_neurons < self.hidden_neurons:
-            iterate_over = new.hidden_neurons
-        i = 0
-        for i in range(iterate_over):
-            offset = self._inputs * i
-            for j in range(self._inputs):
-                new.hidden0_weights.append(
-                    self._mutate_single(self.hidden0_weights[offset + j], rate))
-            offset = self._outputs * i
-            for j in range(self._outputs):
-                new.output_weights.append(
-                    self._mutate_single(self.output_weights[offset + j], rate))
-        while i < new.hidden_neurons - 1:
-            # the genome mutated to desire more hidden neurons
-            # so add random numbers to increase the weight part of the genome
-            for j in range(self._inputs):
-                new.hidden0_weights.append(random.random() * 2 - 1) 
-            for j in range(self._outputs):
-                new.output_weights.append(random.random() * 2 - 1) 
-            i += 1
+        new.size = size
+        new.hue = hue
+        new.predator = predator
+        new.hidden_neurons = hidden_neurons
+        new.hidden0_weights = hidden0_weights
+        new.extra_layers = extra_layers
+        new.output_weights = output_weights
         assert len(new.hidden0_weights) == new.hidden_neurons * new._inputs, \
             '%s %s %s'%(len(new.hidden0_weights), new.hidden_neurons, new._inputs)
-        assert len(new.output_weights) == new.hidden_neurons * new._outputs, \
-            '%s %s %s'%(len(new.output_weights), new.hidden_neurons, new._outputs)
+        assert len(new.output_weights) == fan_in * new._outputs, \
+            '%s %s %s'%(len(new.output_weights), fan_in, new._outputs)
         return new
 
 
+    def _mutate_neurons(self, hidden_neurons, rate):
+        """Mutate the first hidden layer's and the output weights a hidden
+        neuron at a time, its input weights then its output weights, in the
+        order genomes without extra layers have always used the random
+        module in. Returns (hidden0_weights, output_weights), each shared
+        with this genome if none of its genes changed."""
+        keep = min(self.hidden_neurons, hidden_neurons)
+        layers = ((self.hidden0_weights, self._inputs),
+                  (self.output_weights, self._outputs))
+        new = [None, None]
+        for i in range(keep):
+            for n, (weights, width) in enumerate(layers):
+                for j in range(i * width, (i + 1) * width):
+                    if random.random() < rate:
+                        if new[n] is None:
+                            new[n] = weights[:keep * width]
+                        new[n][j] += random.random() * 2 - 1
+        for n, (weights, width) in enumerate(layers):
+            if new[n] is None:
+                new[n] = self._fit(weights, keep * width)
+        if hidden_neurons > keep:
+            # the genome mutated to desire more hidden neurons
+            # so add random numbers to increase the weight part of the genome
+            new = [weights[:] for weights in new]
+            for i in range(hidden_neurons - keep):
+                for weights, (old, width) in zip(new, layers):
+                    for j in range(width):
+                        weights.append(random.random() * 2 - 1)
+        return tuple(new)
+
+
+    def _mutate_layer(self, weights, count, rate):
+        """Mutate a layer's weights, resized to count, sharing them if unchanged."""
+        weights = self._mutate_weights(weights, min(count, len(weights)), rate)
+        if count > len(weights):
+            # the layer grew, so add random weights for its new part
+            weights = self._fit(weights, count)
+        return weights
+
+
+    def _fit(self, weights, count):
+        """Return weights truncated, or extended with random weights, to count."""
+        if count == len(weights):
+            return weights
+        weights = weights[:count]
+        for i in range(count - len(weights)):
+            weights.append(random.random() * 2 - 1)
+        return weights
+
+
+    def _mutate_weights(self, weights, count, rate):
+        """Mutate the first count weights, sharing the list if none change."""
+        new = None
+        for i in range(count):
+            if random.random() < rate:
+                if new is None:
+                    new = weights[:count]
+                new[i] += random.random() * 2 - 1
+        if new is not None:
+            return new
+        if count == len(weights):
+            return weights
+        return weights[:count]
+
+
     def _mutate_single(self, value, rate, min=None):
         r = random.random()
         if r < rate:
@@ -94,6 +197,11 @@ class Genome(object):
         assert p1._inputs == 8
         assert p2._inputs == 8
         assert new._inputs == 8
+        # the output weights of a parent with extra layers connect to its
+        # last layer; line them up with its first hidden layer like the rest
+        output_weights = dict(
+            (id(p), p._fit(p.output_weights, p.hidden_neurons * p._outputs))
+            for p in (p1, p2))
         for i in range(new.hidden_neurons):
             offset = new._inputs * i
             for j in range(new._inputs):
@@ -108,11 +216,60 @@ class Genome(object):
                     parent = p2
                 else:
                     parent = p1 if random.random() < 0.5 else p2
-                new.output_weights.append(parent.output_weights[offset + j])
+                new.output_weights.append(output_weights[id(parent)][offset + j])
+        # the extra layers come whole from one parent, fitted to the new
+        # first hidden layer
+        fan_in = new.hidden_neurons
+        for layer_size, weights in random.choice((p1, p2)).extra_layers:
+            new.extra_layers.append(
+                (layer_size, new._fit(weights, layer_size * fan_in)))
+            fan_in = layer_size
+        new.output_weights = new._fit(new.output_weights, fan_in * new._outputs)
         new = new.mutate(rate)
         return new
 
 
+    @property
+    def key(self):
+        """Content address of this genome; identical genomes share a key."""
+        if self._key is None:
+            weights = self.hidden0_weights + self.output_weights
+            layer_sizes = []
+            for layer_size, layer_weights in self.extra_layers:
+                layer_sizes.append(layer_size)
+                weights = weights + layer_weights
+            packed = struct.pack(
+                '<i2d3i%di%dd' % (len(layer_sizes), len(weights)),
+                self.size, self.hue, self.predator, self.hidden_neurons,
+                self._inputs, self._outputs, *(layer_sizes + weights))
+            self._key = hashlib.sha1(packed).digest()
+        return self._key
+
+
+    @property
+    def layer_sizes(self):
+        """Number of neurons in each brain layer, inputs first."""
+        return ([self._inputs, self.hidden_neurons]
+                + [layer_size for layer_size, weights in self.extra_layers]
+                + [self._outputs])
+
+
+    def brain_layers(self):
+        """Compile the weight genes into the arrays a Brain evaluates.
+
+        Returns (sizes, activations, weights) as expected by
+        characters.Brain: sigmoid hidden layers between identity inputs and
+        outputs, with every layer's weights in one contiguous array.
+        """
+        sizes = self.layer_sizes
+        activations = [IDENTITY] + [SIGMOID] * (len(sizes) - 2) + [IDENTITY]
+        weights = array('d', self.hidden0_weights)
+        for layer_size, layer_weights in self.extra_layers:
+            weights.extend(layer_weights)
+        weights.extend(self.output_weights)
+        return array('i', sizes), array('i', activations), weights
+
+
     def __str__(self):
         return 'Genome:\n  ' + '\n  '.join([str(s) for s in (
             self.size,
@@ -120,10 +277,27 @@ class Genome(object):
             self.predator,
             self.hidden_neurons,
             self.hidden0_weights,
+            self.extra_layers,
             self.output_weights,
         )])
 
     
+    @classmethod
+    def load(cls, obj, inputs, outputs):
+        """Recreate a genome from the output of dump()."""
+        self = cls(inputs, outputs)
+        self.size = obj['size']
+        self.hue = obj['hue']
+        self.predator = obj['predator']
+        self.hidden_neurons = obj['hidden_neurons']
+        self.hidden0_weights = list(obj['hidden0_weights'])
+        self.extra_layers = [
+            (layer_size, list(weights))
+            for layer_size, weights in obj.get('extra_layers', ())]
+        self.output_weights = list(obj['output_weights'])
+        return self
+
+
     def dump(self):
         return {
             'size': self.size,
@@ -131,6 +305,7 @@ class Genome(object):
             'predator': self.predator,
             'hidden_neurons': self.hidden_neurons,
             'hidden0_weights': self.hidden0_weights,
+            'extra_layers': [list(layer) for layer in self.extra_layers],
             'output_weights': self.output_weights,
         }
 
@@ -0,0 +1,94 @@
+'''genomestore.py -- content-addressed store of the genomes alive in a world.'''
+
+
+class GenomeStore(object):
+    """Interned, reference-counted genomes keyed by Genome.key.
+
+    Characters intern their genome when they are created and release it when
+    they die, so identical genomes (which asexual reproduction produces most
+    of the time) are held once, together with the brain arrays compiled
+    from them and the BrainMemo their brains share, if any. len() gives the
+    number of distinct living genomes.
+    """
+
+    def __init__(self):
+        # key -> [genome, refcount, brain layers or None, BrainMemo or None]
+        self._entries = {}
+        self.refs = 0
+        # hits, misses and bypassed of the memos of genomes no longer alive
+        self._retired = [0, 0, 0]
+
+    def intern(self, genome):
+        """Add a reference to genome and return the canonical instance."""
+        entry = self._entries.get(genome.key)
+        if entry is None:
+            entry = self._entries[genome.key] = [genome, 0, None, None]
+        entry[1] += 1
+        self.refs += 1
+        return entry[0]
+
+    def release(self, genome):
+        """Drop a reference to genome, forgetting it once unreferenced."""
+        key = genome.key
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= 0:
+            # e.g. a character that died twice
+            raise ValueError('release() of a genome with no references')
+        entry[1] -= 1
+        self.refs -= 1
+        if entry[1] == 0:
+            memo = entry[3]
+            if memo is not None:
+                self._retired[0] += memo.hits
+                self._retired[1] += memo.misses
+                self._retired[2] += memo.bypassed
+            del self._entries[key]
+
+    def brain_layers(self, genome):
+        """Return the shared (sizes, activations, weights) for genome."""
+        entry = self._entries[genome.key]
+        if entry[2] is None:
+            entry[2] = genome.brain_layers()
+        return entry[2]
+
+    def brain_memo(self, genome, capacity, quantum):
+        """Return the BrainMemo shared by the brains of genome."""
+        entry = self._entries[genome.key]
+        if entry[3] is None:
+            import characters
+            sizes = self.brain_layers(genome)[0]
+            entry[3] = characters.BrainMemo(capacity, quantum, sizes[-1])
+        return entry[3]
+
+    def memo_stats(self):
+        """Lookups of every BrainMemo there has been, as a dict."""
+        hits, misses, bypassed = self._retired
+        memos = 0
+        for entry in self._entries.values():
+            memo = entry[3]
+            if memo is not None:
+                memos += 1
+                hits += memo.hits
+                misses += memo.misses
+                bypassed += memo.bypassed
+        lookups = hits + misses
+        return {
+            'memos': memos,
+            'hits': hits,
+            'misses': misses,
+            'bypassed': bypassed,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def refcount(self, genome):
+        entry = self._entries.get(genome.key)
+        return entry[1] if entry is not None else 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, genome):
+        return genome.key in self._entries
+
+    def __iter__(self):
+        return (entry[0] for entry in self._entries.values())
@@ -0,0 +1,60 @@
+# Segment and triangle tests on integer coordinates, shared by the Cython
+# modules. Products are taken in long long so that coordinates of very large
+# worlds don't overflow.
+
+# Line collision algorithm. Ref: https://stackoverflow.com/a/9997374 and
+# http://www.bryceboe.com/2006/10/23/line-segment-intersection-algorithm/
+cdef inline bint _ccw(int A_x, int A_y, int B_x, int B_y, int C_x, int C_y) noexcept nogil:
+    return <long long>(C_y-A_y) * (B_x-A_x) > <long long>(B_y-A_y) * (C_x-A_x)
+
+cdef inline bint intersect(int A_x, int A_y,
+                           int B_x, int B_y,
+                           int C_x, int C_y,
+                           int D_x, int D_y) noexcept nogil:
+    """Returns true if line segments AB and CD intersect"""
+    return (
+        _ccw(A_x, A_y, C_x, C_y, D_x, D_y) != _ccw(B_x, B_y, C_x, C_y, D_x, D_y)
+    ) and (
+        _ccw(A_x, A_y, B_x, B_y, C_x, C_y) != _ccw(A_x, A_y, B_x, B_y, D_x, D_y)
+    )
+
+# Point-in-triangle algorithm. Ref: https://stackoverflow.com/a/2049593
+cdef inline long long _sign(int p1_x, int p1_y, int p2_x, int p2_y,
+                            int p3_x, int p3_y) noexcept nogil:
+    return <long long>(p1_x - p3_x) * (p2_y - p3_y) \
+        - <long long>(p2_x - p3_x) * (p1_y - p3_y)
+
+cdef inline bint point_in_triangle(int pt_x, int pt_y,
+                                   int v1_x, int v1_y,
+                                   int v2_x, int v2_y,
+                                   int v3_x, int v3_y) noexcept nogil:
+    cdef bint b1, b2, b3
+    b1 = _sign(pt_x, pt_y, v1_x, v1_y, v2_x, v2_y) < 0
+    b2 = _sign(pt_x, pt_y, v2_x, v2_y, v3_x, v3_y) < 0
+    b3 = _sign(pt_x, pt_y, v3_x, v3_y, v1_x, v1_y) < 0
+    return (b1 == b2) and (b2 == b3)
+
+cdef inline bint line_in_triangle(int La_x, int La_y,
+                                  int Lb_x, int Lb_y,
+                                  int Ta_x, int Ta_y,
+                                  int Tb_x, int Tb_y,
+                                  int Tc_x, int Tc_y) noexcept nogil:
+    """Returns true if Line La->Lb intersects or contained by triangle Ta-Tb-Tc"""
+    # if either end of the line segment are inside the triangle, return True:
+    if point_in_triangle(La_x, La_y, Ta_x, Ta_y, Tb_x, Tb_y, Tc_x, Tc_y):
+        return True
+    if point_in_triangle(Lb_x, Lb_y, Ta_x, Ta_y, Tb_x, Tb_y, Tc_x, Tc_y):
+        return True
+
+    # if line segment intersects either Ta-Tb or Ta-Tc, return True:
+    # (don't need to check Tb-Tc since any line that intersects it
+    #  will also intersect Ta-Tb or Ta-Tc)
+    if intersect(La_x, La_y, Lb_x, Lb_y, Ta_x, Ta_y, Tb_x, Tb_y):
+        return True
+    if intersect(La_x, La_y, Lb_x, Lb_y, Ta_x, Ta_y, Tc_x, Tc_y):
+        return True
+
+    return False
+
+cdef void segment_hits_nogil(const int[::1] segments, const int[::1] triangles,
+                             unsigned char[::1] out) noexcept nogil
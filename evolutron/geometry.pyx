@@ -0,0 +1,96 @@
+'''geometry.pyx -- segments against triangles, many at a time.
+
+The scalar tests are inline functions in geometry.pxd, for other Cython
+modules to cimport. segment_hits() tests every segment in a flat buffer
+against every triangle in another in one call, rejecting pairs whose
+bounding boxes don't overlap before running the full test.
+
+Segments are 4 ints each (x1, y1, x2, y2), triangles 6 (ax, ay, bx, by, cx,
+cy), as array('i') or any other int buffer.
+'''
+cimport cython
+from cpython cimport array
+from array import array
+
+cdef array.array _BYTES = array('B')
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void segment_hits_nogil(const int[::1] segments, const int[::1] triangles,
+                             unsigned char[::1] out) noexcept nogil:
+    cdef Py_ssize_t nsegments = segments.shape[0] // 4
+    cdef Py_ssize_t ntriangles = triangles.shape[0] // 6
+    cdef Py_ssize_t t, s, row
+    cdef int ax, ay, bx, by, cx, cy
+    cdef int left, right, top, bottom
+    cdef int x1, y1, x2, y2
+    cdef bint degenerate
+    for t in range(ntriangles):
+        ax = triangles[6 * t]
+        ay = triangles[6 * t + 1]
+        bx = triangles[6 * t + 2]
+        by = triangles[6 * t + 3]
+        cx = triangles[6 * t + 4]
+        cy = triangles[6 * t + 5]
+        left = min(ax, min(bx, cx))
+        right = max(ax, max(bx, cx))
+        top = min(ay, min(by, cy))
+        bottom = max(ay, max(by, cy))
+        # point_in_triangle() finds points outside a flat triangle to be
+        # inside, so those are never rejected early
+        degenerate = _sign(ax, ay, bx, by, cx, cy) == 0
+        row = t * nsegments
+        for s in range(nsegments):
+            x1 = segments[4 * s]
+            y1 = segments[4 * s + 1]
+            x2 = segments[4 * s + 2]
+            y2 = segments[4 * s + 3]
+            if not degenerate and (
+                    max(x1, x2) < left or min(x1, x2) > right
+                    or max(y1, y2) < top or min(y1, y2) > bottom):
+                out[row + s] = 0
+            else:
+                out[row + s] = line_in_triangle(
+                    x1, y1, x2, y2, ax, ay, bx, by, cx, cy)
+
+
+def segment_hits(segments, triangles, out=None):
+    '''Test every segment against every triangle.
+
+    Returns an array('B') (out, if given) where item
+    t * number_of_segments + s is 1 if segment s touches triangle t.
+    '''
+    if len(segments) % 4 or len(triangles) % 6:
+        raise ValueError('segments need 4 ints each and triangles 6')
+    cdef Py_ssize_t n = len(segments) // 4 * (len(triangles) // 6)
+    if out is None:
+        out = array.clone(_BYTES, n, zero=False)
+    elif len(out) < n:
+        raise ValueError('out holds %d results; %d needed' % (len(out), n))
+    cdef const int[::1] s = segments
+    cdef const int[::1] t = triangles
+    cdef unsigned char[::1] o = out
+    with nogil:
+        segment_hits_nogil(s, t, o)
+    return out
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def segment_hits_scalar(segments, triangles):
+    '''segment_hits() one pair at a time with no early rejection, as the
+    characters' vision code does; for comparison.'''
+    cdef const int[::1] s = segments
+    cdef const int[::1] t = triangles
+    cdef Py_ssize_t nsegments = len(segments) // 4
+    cdef Py_ssize_t i, j
+    out = array.clone(_BYTES, nsegments * (len(triangles) // 6), zero=False)
+    cdef unsigned char[::1] o = out
+    for i in range(len(triangles) // 6):
+        for j in range(nsegments):
+            o[i * nsegments + j] = line_in_triangle(
+                s[4 * j], s[4 * j + 1], s[4 * j + 2], s[4 * j + 3],
+                t[6 * i], t[6 * i + 1], t[6 * i + 2], t[6 * i + 3],
+                t[6 * i + 4], t[6 * i + 5])
+    return out
@@ -1,9 +1,8 @@
-# cython: profile=True
 cimport cython
 
 import operator
 from itertools import combinations
-from pygame.sprite import Group as pygame_Group, collide_rect, spritecollideany
+from pygame.sprite import Group as pygame_Group, spritecollideany
 
 from characters cimport Character
 from genome import Genome
@@ -13,19 +12,54 @@ class Group(pygame_Group):
         super(Group, self).__init__()
         self.world = world
 
+    # pygame's versions copy the sprites into a list first
+    def __len__(self):
+        return len(self.spritedict)
+
+    def __bool__(self):
+        return bool(self.spritedict)
+
     def draw(self, onto, offset=(0,0)):
         for sprite in self.spritedict:
             sprite.draw()
         # Group.draw() basically just does [onto.blit(s.image, s.rect) for s...]
         super(Group, self).draw(onto)
 
+    def draw_images(self, onto):
+        """Blit the sprites' images without asking them to redraw first."""
+        super(Group, self).draw(onto)
+
+    def update(self, *args):
+        """Update every sprite, in the order they were added.
+
+        Births and deaths wait for the end of the tick (see events.py), so
+        unlike pygame's Group.update() this doesn't iterate over a copy.
+        """
+        for sprite in self.spritedict:
+            sprite.update(*args)
+
+    def sense(self):
+        """Run the sensor stage of every character before any moves.
+
+        Returns the number of characters that were idle.
+        """
+        cdef Character character
+        cdef int idle = 0
+        for character in self.spritedict:
+            idle += character.sense()
+        return idle
+
     @cython.cdivision(True)
     def collisions(self):
         cdef double xoff, yoff
         cdef Character sprite, other, newchar, predator, prey
         world = self.world
-        for sprite, other in combinations(self, 2):
-            if collide_rect(sprite, other):
+        config = world.config
+        events = world.events
+        for sprite, other in combinations(self.spritedict, 2):
+            if sprite.dead or other.dead:
+                continue
+            if sprite.rect.colliderect(other.rect):
                 sprite_midpoint_x = sprite.midx
                 sprite_midpoint_y = sprite.midy
                 other_midpoint_x = other.midx
@@ -50,23 +84,25 @@ class Group(pygame_Group):
                 if sprite.predator == other.predator:
                     # sexual reproduction:
                     if sprite.spawn > 0 and other.spawn > 0 \
-                    and sprite.energy > 2500 and other.energy > 2500 \
+                    and sprite.energy > config.mate_energy \
+                    and other.energy > config.mate_energy \
                     and sprite.spawn_refractory == 0 and other.spawn_refractory == 0:
-                        sprite.energy -= 2500
-                        other.energy -= 2500
+                        sprite.energy -= config.mate_energy
+                        other.energy -= config.mate_energy
                         sprite.spawn_refractory = 30
                         other.spawn_refractory = 30
-                        newgenome = Genome.from_parents(sprite.genome, other.genome)
+                        newgenome = Genome.from_parents(
+                            sprite.genome, other.genome, config.mutation_rate)
                         newchar = Character(world)
                         newchar.load_genome(newgenome)
                         newchar.set_midpoint_x(midpoint_x)
                         newchar.set_midpoint_y(midpoint_y)
                         newchar.gen = max(sprite.gen, other.gen) + 1
                         newchar.parents = 2
-                        newchar.energy = 4000
+                        newchar.energy = config.child_energy
                         sprite.children += 1
                         other.children += 1
-                        world.allcharacters.add(newchar)
+                        events.born(newchar)
                 else:
                     # nom nom nom nom nom
                     if sprite.predator:
@@ -79,10 +115,12 @@ class Group(pygame_Group):
                     predator.foodchain = True
                     prey.foodchain = True
                     if prey.energy < 1000:
+                        events.bite(predator, prey, prey.energy)
                         predator.energy += prey.energy
                         prey.energy = 0
                         prey.die()
                     else:
+                        events.bite(predator, prey, 900)
                         predator.energy += 900
                         prey.energy -= 1000
 
@@ -0,0 +1,29 @@
+'''headless.py -- a display for worlds nobody watches.
+
+Sweeps, difftests, benchmarks and WorldBatches build worlds without a
+window, but pygame still needs a display mode set before Surfaces can be
+converted. init() sets one up once per process on SDL's dummy video driver:
+
+    screen = headless.init()
+    win = window.Window(screen, 2000, 2000, config)
+'''
+import os
+
+_screen = None
+
+
+def init():
+    """Set up pygame without a real display, once; return its screen.
+
+    Also makes the extension modules importable, so that it can serve as
+    the initializer of pool worker processes.
+    """
+    global _screen
+    if _screen is None:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        import extensions
+        extensions.install()
+        import pygame
+        pygame.init()
+        _screen = pygame.display.set_mode((1280, 720))
+    return _screen
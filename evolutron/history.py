@@ -0,0 +1,172 @@
+'''history.py -- population statistics kept over the whole run.'''
+import collections
+
+# Bucket fields: first tick, tick after the last, min, max, total, count,
+# number of finer buckets merged in.
+START, END, MIN, MAX, TOTAL, COUNT, PARTS = range(7)
+
+
+class History(object):
+    """Time series of one value at several resolutions.
+
+    The most recent raw_size samples are kept as they are. Older samples are
+    folded into buckets of min/mean/max, each level merging `factor` buckets
+    of the level below. The top level never drops anything: when it fills,
+    neighbouring buckets are merged in pairs, so the whole run back to tick 0
+    is always covered by a bounded number of buckets. Appending is amortized
+    O(1).
+    """
+
+    def __init__(self, raw_size=200, bucket_size=200, factor=10, levels=3):
+        self.raw_size = raw_size
+        self.bucket_size = bucket_size
+        self.factor = factor
+        self.raw = collections.deque()
+        self.levels = [collections.deque() for i in range(levels)]
+        # finer buckets per top level bucket; doubles as the top level halves
+        self._top_parts = factor
+
+    def append(self, tick, value):
+        self.raw.append((tick, value))
+        if len(self.raw) > self.raw_size:
+            tick, value = self.raw.popleft()
+            self._fold(0, [tick, tick + 1, value, value, value, 1, 1])
+
+    def _fold(self, level, bucket):
+        buckets = self.levels[level]
+        top = level == len(self.levels) - 1
+        parts = self._top_parts if top else self.factor
+        if buckets and buckets[-1][PARTS] < parts:
+            last = buckets[-1]
+            last[END] = bucket[END]
+            last[MIN] = min(last[MIN], bucket[MIN])
+            last[MAX] = max(last[MAX], bucket[MAX])
+            last[TOTAL] += bucket[TOTAL]
+            last[COUNT] += bucket[COUNT]
+            last[PARTS] += 1
+        else:
+            bucket = bucket[:]
+            bucket[PARTS] = 1
+            buckets.append(bucket)
+        if len(buckets) > self.bucket_size:
+            if not top:
+                self._fold(level + 1, buckets.popleft())
+            else:
+                self._halve(buckets)
+
+    def _halve(self, buckets):
+        self._top_parts *= 2
+        merged = collections.deque()
+        while buckets:
+            first = buckets.popleft()
+            if buckets:
+                second = buckets.popleft()
+                first[END] = second[END]
+                first[MIN] = min(first[MIN], second[MIN])
+                first[MAX] = max(first[MAX], second[MAX])
+                first[TOTAL] += second[TOTAL]
+                first[COUNT] += second[COUNT]
+            first[PARTS] = self._top_parts
+            merged.append(first)
+        self.levels[-1] = merged
+
+    def __len__(self):
+        return len(self.raw) + sum(len(buckets) for buckets in self.levels)
+
+    @property
+    def first_tick(self):
+        for buckets in reversed(self.levels):
+            if buckets:
+                return buckets[0][START]
+        return self.raw[0][0] if self.raw else 0
+
+    @property
+    def last_tick(self):
+        return self.raw[-1][0] + 1 if self.raw else 0
+
+    @property
+    def latest(self):
+        return self.raw[-1][1] if self.raw else 0
+
+    def buckets(self, start=None, end=None):
+        """Yield the stored buckets overlapping [start, end), oldest first."""
+        if start is None:
+            start = self.first_tick
+        if end is None:
+            end = self.last_tick
+        for buckets in reversed(self.levels):
+            for bucket in buckets:
+                if bucket[END] > start and bucket[START] < end:
+                    yield bucket
+        for tick, value in self.raw:
+            if start <= tick < end:
+                yield [tick, tick + 1, value, value, value, 1, 1]
+
+    def resample(self, columns, start=None, end=None):
+        """Return up to `columns` (min, mean, max) tuples covering a range.
+
+        Columns with no samples in them are None. The cost is bounded by the
+        number of stored buckets, however long the run has been.
+        """
+        if start is None:
+            start = self.first_tick
+        if end is None:
+            end = self.last_tick
+        span = max(end - start, 1)
+        result = [None] * columns
+        for bucket in self.buckets(start, end):
+            column = min((max(bucket[START], start) - start) * columns // span,
+                         columns - 1)
+            current = result[column]
+            if current is None:
+                result[column] = bucket[MIN:COUNT + 1]
+            else:
+                current[0] = min(current[0], bucket[MIN])
+                current[1] = max(current[1], bucket[MAX])
+                current[2] += bucket[TOTAL]
+                current[3] += bucket[COUNT]
+        return [
+            column and (column[0], column[2] / column[3], column[1])
+            for column in result]
+
+
+class PopulationStats(object):
+    """Population aggregates maintained on birth, death and tick.
+
+    Nothing here rescans the population: sums are adjusted as characters
+    come and go, and every character's age grows by one per tick it is
+    updated.
+    """
+
+    def __init__(self):
+        self.population = 0
+        self.total_age = 0
+        self.total_gen = 0
+        self.pop_history = History()
+        self.avgage_history = History()
+        self.avggen_history = History()
+
+    def born(self, character):
+        self.population += 1
+        self.total_age += character.age
+        self.total_gen += character.gen
+
+    def died(self, character):
+        self.population -= 1
+        self.total_age -= character.age
+        self.total_gen -= character.gen
+
+    def tick(self, tick, aged):
+        '''Record a tick in which `aged` characters were updated.'''
+        self.total_age += aged
+        self.pop_history.append(tick, self.population)
+        self.avgage_history.append(tick, self.avgage)
+        self.avggen_history.append(tick, self.avggen)
+
+    @property
+    def avgage(self):
+        return self.total_age / float(self.population or 1)
+
+    @property
+    def avggen(self):
+        return self.total_gen / float(self.population or 1)
@@ -26,7 +26,7 @@ class InspectWindow(object):
         self.infopane = infopane.InfoPane(self, Rect(0, 0, 250, 1000))
         self.allsprites.add(self.infopane)
 
-        for i, input_ in enumerate(character.brain.inputs):
+        for i, input_ in enumerate(character.brain.layers()[0]):
             ypos = 25 + i * 100
             textbox_ = textbox.TextBox(self, Rect(275, ypos, 100, 25))
             self.allsprites.add(textbox_)
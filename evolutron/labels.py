@@ -0,0 +1,27 @@
+'''labels.py -- cache of rendered text.'''
+
+
+class LabelCache(object):
+    """Rendered text Surfaces, keyed by text and colour.
+
+    Rendering text is one of the more expensive things a panel does each
+    frame, and most labels never change. The cache is simply emptied when
+    it reaches max_size, which is plenty for the labels and numbers a panel
+    shows.
+    """
+
+    def __init__(self, font, antialias=True, max_size=1000):
+        self.font = font
+        self.antialias = antialias
+        self.max_size = max_size
+        self._cache = {}
+
+    def render(self, text, colour):
+        key = text, colour
+        surface = self._cache.get(key)
+        if surface is None:
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+            surface = self._cache[key] = self.font.render(
+                text, self.antialias, colour)
+        return surface
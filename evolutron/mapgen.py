@@ -4,6 +4,12 @@ import random
 import operator
 from collections import OrderedDict
 
+# Integer codes for terrain types, so hot code can avoid string comparisons.
+UNKNOWN, LAKE, MEADOW, FOREST = range(4)
+TERRAIN_CODES = {'lake': LAKE, 'meadow': MEADOW, 'forest': FOREST}
+TERRAIN_NAMES = dict((code, name) for name, code in TERRAIN_CODES.items())
+TERRAIN_NAMES[UNKNOWN] = 'unknown'
+
 class Map(list):
     def __init__(self, x, y):
         self.sizex = x
@@ -12,48 +18,12 @@ class Map(list):
     @classmethod
     def from_random(cls, x, y):
         self = cls(x, y)
-        tiles = x * y
-
-        # Generate blank grid:
+        codes = generate_codes(x, y)
         for i in range(x):
             row = []
             self.append(row)
             for j in range(y):
-                row.append(None)
-
-        # Generate some forests:
-        for n in range(tiles // 16):
-            sizex = random.randint(0, 5)
-            sizey = random.randint(0, 5)
-            origin = random.randint(0, x - sizex - 1), random.randint(0, y - sizey - 1)
-            for i in range(origin[0], origin[0] + sizex):
-                for j in range(origin[1], origin[1] + sizey):
-                    self[i][j] = Tile(i, j, 'forest')
-
-        # Generate some lakes:
-        for n in range(tiles // 64):
-            centre = random.randint(0, x - 1), random.randint(0, y - 1)
-            radius = random.randint(0, 3)
-            radius_sq = radius ** 2
-            self[centre[0]][centre[1]] = Tile(centre[0], centre[1], 'lake')
-            for offset_i in range(- radius, radius + 1):
-                i = centre[0] + offset_i
-                if i < 0 or i >= self.sizex:
-                    continue
-                offset_i_sq = offset_i ** 2
-                for offset_j in range(- radius, radius + 1):
-                    j = centre[1] + offset_j
-                    if j < 0 or j >= self.sizey:
-                        continue
-                    offset_j_sq = offset_j ** 2
-                    if offset_i_sq * offset_j_sq < radius_sq:
-                        self[i][j] = Tile(i, j, 'lake')
-
-        # Rest of the map is meadow:
-        for i in range(x):
-            for j in range(y):
-                if self[i][j] is None:
-                    self[i][j] = Tile(i, j, 'meadow')
+                row.append(Tile(i, j, TERRAIN_NAMES[codes[i * y + j]]))
 
         # Link up grid:
         for i in range(x):
@@ -90,11 +60,52 @@ class Map(list):
         return ''.join(s)
 
 
+def generate_codes(x, y):
+    """Return a random map as a bytearray of terrain codes.
+
+    The code of tile (i, j) is at index i * y + j.
+    """
+    codes = bytearray(x * y) # all UNKNOWN
+    tiles = x * y
+
+    # Generate some forests:
+    for n in range(tiles // 16):
+        sizex = random.randint(0, 5)
+        sizey = random.randint(0, 5)
+        origin = random.randint(0, x - sizex - 1), random.randint(0, y - sizey - 1)
+        for i in range(origin[0], origin[0] + sizex):
+            start = i * y + origin[1]
+            codes[start:start + sizey] = bytes((FOREST,)) * sizey
+
+    # Generate some lakes:
+    for n in range(tiles // 64):
+        centre = random.randint(0, x - 1), random.randint(0, y - 1)
+        radius = random.randint(0, 3)
+        radius_sq = radius ** 2
+        codes[centre[0] * y + centre[1]] = LAKE
+        for offset_i in range(- radius, radius + 1):
+            i = centre[0] + offset_i
+            if i < 0 or i >= x:
+                continue
+            offset_i_sq = offset_i ** 2
+            for offset_j in range(- radius, radius + 1):
+                j = centre[1] + offset_j
+                if j < 0 or j >= y:
+                    continue
+                offset_j_sq = offset_j ** 2
+                if offset_i_sq * offset_j_sq < radius_sq:
+                    codes[i * y + j] = LAKE
+
+    # Rest of the map is meadow:
+    return codes.replace(bytes((UNKNOWN,)), bytes((MEADOW,)))
+
+
 class Tile:
     def __init__(self, posx, posy, terrain):
         self.posx = posx
         self.posy = posy
         self.terrain = terrain
+        self.code = TERRAIN_CODES.get(terrain, UNKNOWN)
         self.west = None
         self.east = None
         self.north = None
@@ -0,0 +1,215 @@
+'''memreport.py -- how much memory each part of the simulation holds.
+
+measure() walks the objects owned by each subsystem (creatures, their
+brains, the genome store, food, trees, tiles, sprite groups and the render
+surfaces) and adds up their sizes with sys.getsizeof(). An object reachable
+from more than one subsystem, such as the weight arrays a brain shares with
+the genome store, is charged to the first in SUBSYSTEMS.
+
+Surface pixels are allocated by SDL, where neither sys.getsizeof() nor
+tracemalloc can see them, so they are counted separately from each
+Surface's pitch and height.
+
+If tracemalloc is tracing, Reporter also lists the source lines that
+allocated the most since the last report. Start it with `--memreport`,
+which also prints a report every n ticks; `m` prints one at any time, and
+the control server's `memory` command returns one as JSON.
+'''
+import gc
+import sys
+import types
+import tracemalloc
+import collections
+
+import pygame
+
+import food
+import tree
+import tiles
+import group
+import chunks
+import density
+import genome
+import genomestore
+import characters
+import neuron
+
+SUBSYSTEMS = ('genomes', 'brains', 'groups', 'creatures', 'food', 'trees',
+              'tiles', 'render')
+
+# never walked into: shared by everything and owned by none of it
+_SKIP = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+         types.MethodType)
+# walked into from any subsystem
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+class Usage(object):
+    """Memory held by one subsystem."""
+
+    def __init__(self):
+        self.count = 0 # root objects: creatures, food items, tiles...
+        self.objects = 0
+        self.bytes = 0 # Python objects, including Surface objects
+        self.surfaces = 0
+        self.surface_bytes = 0 # Surface pixels
+
+    @property
+    def total(self):
+        return self.bytes + self.surface_bytes
+
+    def dump(self):
+        return {
+            'count': self.count,
+            'objects': self.objects,
+            'bytes': self.bytes,
+            'surfaces': self.surfaces,
+            'surface_bytes': self.surface_bytes,
+        }
+
+
+def surface_bytes(surface):
+    """Bytes of pixels held by surface (none for subsurfaces)."""
+    if surface.get_parent() is not None:
+        return 0
+    return surface.get_pitch() * surface.get_height()
+
+
+def _walk(roots, owned, seen, usage):
+    """Add the objects reachable from roots to usage.
+
+    Containers and instances of the owned classes are walked into; other
+    objects (the world, tiles seen from a creature...) belong to somebody
+    else and are left for their own subsystem.
+    """
+    stack = list(roots)
+    usage.count += len(stack)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        usage.objects += 1
+        usage.bytes += sys.getsizeof(obj)
+        if isinstance(obj, pygame.Surface):
+            usage.surfaces += 1
+            usage.surface_bytes += surface_bytes(obj)
+            continue
+        for ref in gc.get_referents(obj):
+            if id(ref) in seen or isinstance(ref, _SKIP):
+                continue
+            if (isinstance(ref, _CONTAINERS + owned)
+                    or not gc.is_tracked(ref)
+                    or isinstance(ref, pygame.Surface)):
+                stack.append(ref)
+
+
+def _roots(window):
+    """(name, roots, owned classes) for each of SUBSYSTEMS, in order."""
+    world = window.world
+    characters_ = list(world.allcharacters)
+    loaded = list(world.alltiles)
+    groups = [world.allcharacters, world.allfood, world.alltrees,
+              world.alltiles, window.allsprites]
+    for tile in loaded:
+        groups.extend((tile.alltrees, tile.allfood, tile.allcharacters))
+    views = [window.infopane, window.brainview, window.minimap,
+             window.genesview, window.popview]
+    surfaces = [window.screen, window.background, world.canvas, world.image]
+    return [
+        ('genomes', [world.genomes],
+            (genomestore.GenomeStore, genome.Genome)),
+        ('brains', [c.brain for c in characters_ if c.brain is not None],
+            (characters.Brain, neuron.Neuron)),
+        ('groups', groups, (group.Group,)),
+        ('creatures', characters_, (characters.Character,)),
+        ('food', list(world.allfood), (food.Food,)),
+        ('trees', list(world.alltrees), (tree.Tree,)),
+        ('tiles', loaded + [world.chunks, world.density],
+            (tiles.TileView, chunks.ChunkStore, chunks.Chunk,
+             density.DensityGrid)),
+        ('render', views + surfaces, tuple(type(view) for view in views)),
+    ]
+
+
+def measure(window):
+    """Return an OrderedDict of subsystem name -> Usage."""
+    usages = collections.OrderedDict()
+    # the window and world themselves are nobody's, and stop every walk
+    seen = set([id(window), id(window.world)])
+    for name, roots, owned in _roots(window):
+        usages[name] = usage = Usage()
+        _walk(roots, owned, seen, usage)
+    return usages
+
+
+class Reporter(object):
+    """Memory reports, with tracemalloc growth since the previous one."""
+
+    def __init__(self, window, top=10):
+        self.window = window
+        self.top = top
+        self._snapshot = None
+
+    def report(self):
+        """Return a dict of the current memory use; see format()."""
+        world = self.window.world
+        usages = measure(self.window)
+        population = len(world.allcharacters)
+        per_creature = sum(usages[name].total
+                           for name in ('genomes', 'brains', 'creatures'))
+        total = sum(usage.total for usage in usages.values())
+        result = {
+            'tick': int(world.age),
+            'subsystems': collections.OrderedDict(
+                (name, usage.dump()) for name, usage in usages.items()),
+            'population': population,
+            'bytes_per_creature': population and per_creature // population,
+            'total_bytes': total,
+            'total_per_creature': population and total // population,
+            'mapped_bytes': world.chunks.stats()['file_bytes'],
+        }
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)])
+            current, peak = tracemalloc.get_traced_memory()
+            if self._snapshot is None:
+                stats = snapshot.statistics('lineno')
+            else:
+                stats = snapshot.compare_to(self._snapshot, 'lineno')
+            self._snapshot = snapshot
+            result['traced'] = {
+                'current': current,
+                'peak': peak,
+                'top': [(str(stat.traceback[0]), stat.size,
+                         getattr(stat, 'size_diff', stat.size))
+                        for stat in stats[:self.top]],
+            }
+        return result
+
+    def format(self, result):
+        """Return a report from report() as text."""
+        lines = ['memory at tick %d:' % result['tick'],
+                 '    %-10s %8s %9s %12s %9s %12s' % (
+                     'subsystem', 'count', 'objects', 'bytes', 'surfaces',
+                     'pixel bytes')]
+        for name, usage in result['subsystems'].items():
+            lines.append('    %-10s %8d %9d %12d %9d %12d' % (
+                name, usage['count'], usage['objects'], usage['bytes'],
+                usage['surfaces'], usage['surface_bytes']))
+        lines.append(
+            '    %d bytes in all, %d per creature; creatures, brains and '
+            'genomes %d per creature' % (
+                result['total_bytes'], result['total_per_creature'],
+                result['bytes_per_creature']))
+        lines.append('    tile file: %d bytes mapped' % result['mapped_bytes'])
+        traced = result.get('traced')
+        if traced is None:
+            lines.append('    (run with --memreport to trace allocations)')
+        else:
+            lines.append('    traced: %d bytes, peak %d; growth by line:' % (
+                traced['current'], traced['peak']))
+            for where, size, diff in traced['top']:
+                lines.append('    %+12d %12d  %s' % (diff, size, where))
+        return '\n'.join(lines)
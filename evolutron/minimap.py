@@ -0,0 +1,113 @@
+import sys
+from array import array
+
+import pygame
+from pygame.locals import *
+
+import viewport
+
+MODES = ('creatures', 'food', 'energy')
+
+# half of each channel value, for the dimmer channel of a colour
+_HALF = bytes(value // 2 for value in range(256))
+
+
+def _channel(values, peak):
+    """Scale an array of values from 0 up to peak to bytes up to 255."""
+    if peak <= 0:
+        return bytes(len(values))
+    scale = 255. / peak
+    if values.typecode == 'H' and peak < 256:
+        # the counts fit in their low bytes; scale those by table
+        low = values.tobytes()[0 if sys.byteorder == 'little' else 1::2]
+        return low.translate(bytes(min(255, int(value * scale))
+                                   for value in range(256)))
+    try:
+        return array('B', map(int, map(scale.__mul__, values))).tobytes()
+    except OverflowError: # a value below 0 or above peak
+        return bytes([min(255, max(0, int(value * scale)))
+                      for value in values])
+
+
+class MiniMap(viewport.Viewport):
+    """The whole world as a heatmap of its DensityGrid, one pixel per tile,
+    scaled to fit, with the part on show in the WorldView outlined.
+
+    Left click to show somewhere else; right click to switch between
+    creatures (prey green, predators red), food and creature energy. The
+    heatmap is rebuilt when the grid has changed, at most every `interval`
+    ticks, at a cost that depends only on the number of tiles.
+    """
+
+    def __init__(self, parent, viewport_rect, interval=10):
+        self.mode = 0
+        self.interval = interval
+        self._heat = None # scaled heatmap Surface
+        self._built = None # world age it was built at
+        self._changes = None # DensityGrid.changes it was built from
+        super(MiniMap, self).__init__(
+            parent, viewport_rect, viewport_rect.w, viewport_rect.h)
+
+    def resize(self, viewport_rect):
+        super(MiniMap, self).resize(viewport_rect)
+        self._heat = None
+
+    def _build(self, grid):
+        if MODES[self.mode] == 'creatures':
+            peak = max(max(grid.prey), max(grid.predators))
+            red = _channel(grid.predators, peak)
+            green = _channel(grid.prey, peak)
+            blue = bytes(len(green))
+        elif MODES[self.mode] == 'food':
+            red = green = _channel(grid.food, max(grid.food))
+            blue = bytes(len(green))
+        else:
+            red = _channel(grid.energy, max(grid.energy))
+            green = red.translate(_HALF)
+            blue = bytes(len(red))
+        pixels = bytearray(len(red) * 3)
+        pixels[0::3] = red
+        pixels[1::3] = green
+        pixels[2::3] = blue
+        heat = pygame.image.frombuffer(
+            pixels, (grid.sizex, grid.sizey), 'RGB').convert()
+        # as big as fits, keeping the world's proportions
+        self.scale = min(self.rect.w / grid.sizex, self.rect.h / grid.sizey)
+        size = (max(1, int(grid.sizex * self.scale)),
+                max(1, int(grid.sizey * self.scale)))
+        self.origin = ((self.rect.w - size[0]) // 2,
+                       (self.rect.h - size[1]) // 2)
+        self._heat = pygame.transform.scale(heat, size)
+
+    def draw(self):
+        world = self.parent.world
+        grid = world.density
+        if self._heat is None or (grid.changes != self._changes
+                                  and world.age - self._built >= self.interval):
+            self._build(grid)
+            self._built = world.age
+            self._changes = grid.changes
+        self.image.fill((0, 0, 0))
+        self.image.blit(self._heat, self.origin)
+        # the part of the world on show
+        pixel_w = self.scale / grid.tile_w
+        pixel_h = self.scale / grid.tile_h
+        shown = Rect(
+            self.origin[0] - world.drag_offset[0] * pixel_w,
+            self.origin[1] - world.drag_offset[1] * pixel_h,
+            max(2, world.rect.w * pixel_w), max(2, world.rect.h * pixel_h))
+        pygame.draw.rect(self.image, (255, 255, 255), shown, 1)
+
+    def onclick(self, relpos, button):
+        if button == 3:
+            self.mode = (self.mode + 1) % len(MODES)
+            self._heat = None
+            return
+        if button != 1 or self._heat is None:
+            return
+        world = self.parent.world
+        grid = world.density
+        x = (relpos[0] - self.origin[0]) / self.scale
+        y = (relpos[1] - self.origin[1]) / self.scale
+        if 0 <= x < grid.sizex and 0 <= y < grid.sizey:
+            world.jump_to((x * grid.tile_w, y * grid.tile_h))
@@ -0,0 +1,102 @@
+'''multiworld.py -- many small worlds stepped in turn in one process.
+
+Evolution experiments often want many small independent worlds rather than
+one big one. A WorldBatch holds any number of them, each a WorldView with
+its own map, Config and random number generator, and steps each of them a
+tick in turn. Nothing is shared or vectorized across worlds: every world
+senses, thinks and moves its own creatures, so K worlds cost K times what
+one does. What a batch saves is what nobody watches: its worlds have no
+window, panels or screen-sized canvas.
+
+    batch = multiworld.WorldBatch(range(32), 500, 500, min_characters=50)
+    batch.run(1000)
+    print(batch.summary())
+
+Each world's random state is swapped into the random module around its
+tick, so a world runs exactly as it would alone with the same seed, however
+many others share the batch.
+'''
+import random
+
+from pygame import Rect
+
+import headless
+import config as _config
+
+
+class _Panel(object):
+    """The BrainView or InfoPane of a world nobody is watching."""
+    brain = None
+    text = ''
+
+
+class _Unwatched(object):
+    """Stands in for the Window of a world nobody is watching."""
+
+    def __init__(self):
+        self.brainview = _Panel()
+        self.infopane = _Panel()
+
+
+class WorldBatch(object):
+
+    def __init__(self, seeds, world_w=500, world_h=500, **settings):
+        '''
+        seeds -- one world is made for each, seeded with it
+        settings -- Config parameters shared by every world
+        '''
+        headless.init() # Surfaces need a display to convert to
+        import worldview
+        self.seeds = list(seeds)
+        self.worlds = []
+        self._states = []
+        outer = random.getstate()
+        try:
+            for seed in self.seeds:
+                random.seed(seed)
+                world = worldview.WorldView(
+                    _Unwatched(), Rect(0, 0, 1, 1), world_w, world_h,
+                    _config.Config(**settings))
+                self.worlds.append(world)
+                self._states.append(random.getstate())
+        finally:
+            random.setstate(outer)
+
+    def __len__(self):
+        return len(self.worlds)
+
+    def step(self):
+        """Advance every world by one tick."""
+        states = self._states
+        outer = random.getstate()
+        try:
+            for i, world in enumerate(self.worlds):
+                random.setstate(states[i])
+                world.update()
+                states[i] = random.getstate()
+        finally:
+            random.setstate(outer)
+
+    def run(self, ticks):
+        for i in range(ticks):
+            self.step()
+
+    def phase_times(self):
+        """Seconds spent in each phase of the last step, over all worlds."""
+        totals = {}
+        for world in self.worlds:
+            for phase, seconds in world.phase_times.items():
+                totals[phase] = totals.get(phase, 0) + seconds
+        return totals
+
+    def summary(self):
+        """A dict per world of its seed and state."""
+        return [{
+            'seed': seed,
+            'tick': int(world.age),
+            'population': world.stats.population,
+            'avggen': round(world.stats.avggen, 2),
+            'genomes': len(world.genomes),
+            'species': len(world.species),
+            'food': len(world.allfood),
+        } for seed, world in zip(self.seeds, self.worlds)]
@@ -1,10 +1,20 @@
+
 from sprite cimport Sprite
 
+cdef enum:
+    ACT_IDENTITY = 0
+    ACT_SIGMOID = 1
+    ACT_CUBE = 2
+
+cdef void forward(double[::1] weights, int[::1] sizes, int[::1] activations,
+                  double[::1] raw, double[::1] values) noexcept nogil
+
 cdef class Neuron(Sprite):
     cdef public object fn
-    cdef public double raw_value
-    cdef public double value
+    cdef double[::1] _values
+    cdef double[::1] _raw
+    cdef int _offset
     cdef public double[:] input_weights
     
-    cdef object font
     cdef object viewport
+    cdef object _drawn
@@ -1,10 +1,10 @@
+cimport cython
 from libc.math cimport sin, cos, exp, fabs
 cdef extern from "errno.h":
     int errno
  
 from cpython cimport array
-import pygame
-from pygame import Rect
+import array
 
 from sprite cimport Sprite
 from neuron cimport Neuron
@@ -24,51 +24,171 @@ def identity(x):
 def cube(x):
     return x**3
 
+# Activation codes, as used in Brain.activations; ACTIVATIONS holds the
+# matching Python functions by code.
+IDENTITY = ACT_IDENTITY
+SIGMOID = ACT_SIGMOID
+CUBE = ACT_CUBE
+ACTIVATIONS = (identity, sigmoid, cube)
+
+# Evaluation:
+
+cdef inline double activate(int code, double x) noexcept nogil:
+    if code == ACT_SIGMOID:
+        return 1 / (1 + exp(-x))
+    if code == ACT_CUBE:
+        return x * x * x
+    return x
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void forward(double[::1] weights, int[::1] sizes, int[::1] activations,
+                  double[::1] raw, double[::1] values) noexcept nogil:
+    """Evaluate a feed-forward network, layer by layer.
+
+    sizes -- the number of neurons in each layer, inputs first and outputs
+        last.
+    activations -- an activation code for each layer (the first is unused).
+    weights -- the weights of every layer after the first, one layer after
+        another; within a layer, all the weights of neuron 0 come first, one
+        for each neuron of the previous layer.
+    raw, values -- sum(sizes) long; the values of each layer, one layer
+        after another, before and after activation. The first sizes[0]
+        values are the inputs, and must be set by the caller.
+    """
+    cdef int layer, i, j, num_in, num_out, code
+    cdef int w = 0 # weights offset
+    cdef int src = 0 # values offset of the previous layer
+    cdef int dst = sizes[0] # values offset of this layer
+    cdef double acc
+    for layer in range(1, sizes.shape[0]):
+        num_in = sizes[layer - 1]
+        num_out = sizes[layer]
+        code = activations[layer]
+        for i in range(num_out):
+            acc = 0.0
+            for j in range(num_in):
+                acc = acc + values[src + j] * weights[w + j]
+            w += num_in
+            raw[dst + i] = acc
+            values[dst + i] = activate(code, acc)
+        src = dst
+        dst += num_out
+
+def process_batch(double[::1] weights, int[::1] sizes, int[::1] activations,
+                  double[::1] inputs, double[::1] outputs):
+    """Evaluate a brain over many rows of inputs.
+
+    weights, sizes, activations -- as for forward().
+    inputs -- rows * sizes[0] input values, one row after another.
+    outputs -- rows * sizes[-1] buffer that receives the output values.
+    """
+    cdef int num_inputs = sizes[0]
+    cdef int num_outputs = sizes[sizes.shape[0] - 1]
+    cdef int rows = inputs.shape[0] // num_inputs
+    cdef int total = 0
+    cdef int row, i
+    for i in range(sizes.shape[0]):
+        total += sizes[i]
+    cdef int output_offset = total - num_outputs
+    cdef double[::1] raw = cython.view.array(
+        shape=(total,), itemsize=sizeof(double), format='d')
+    cdef double[::1] values = cython.view.array(
+        shape=(total,), itemsize=sizeof(double), format='d')
+    assert outputs.shape[0] >= rows * num_outputs
+    with nogil:
+        for row in range(rows):
+            for i in range(num_inputs):
+                values[i] = inputs[row * num_inputs + i]
+            forward(weights, sizes, activations, raw, values)
+            for i in range(num_outputs):
+                outputs[row * num_outputs + i] = values[output_offset + i]
+
+def brain_layout(obj):
+    """Return (sizes, activations, weights) arrays for a dumped brain.
+
+    Accepts Brain.dump() output, and the older format of one hidden layer
+    given as 'input_weights' and 'output_weights' lists of lists.
+    """
+    if 'sizes' in obj:
+        return (array.array('i', obj['sizes']),
+                array.array('i', obj['activations']),
+                array.array('d', obj['weights']))
+    input_weights = obj['input_weights']
+    output_weights = obj['output_weights']
+    sizes = [len(input_weights[0]) if input_weights else 0,
+             len(input_weights), len(output_weights)]
+    weights = array.array('d')
+    for neuron_weights in input_weights + output_weights:
+        weights.extend(neuron_weights)
+    return (array.array('i', sizes),
+            array.array('i', (ACT_IDENTITY, ACT_SIGMOID, ACT_IDENTITY)),
+            weights)
+
 # Main class:
 
 cdef class Neuron(Sprite):
-    def __init__(self, double[:] input_weights, initial_value=-1, fn=sigmoid):
+    """A view of one neuron of a Brain, for display and inspection.
+
+    Brains evaluate from flat buffers; Neurons are only created when
+    something asks Brain.layers for them. Setting value writes through to
+    the brain.
+    """
+    def __init__(self, double[::1] values, double[::1] raw, int offset,
+                 double[:] input_weights, fn=sigmoid):
         Sprite.__init__(self)
         self.fn = fn
-        self.raw_value = initial_value
-        self.value = initial_value
-        self.input_weights = input_weights[:]
-
-    def process(self, list inputs):
-        cdef int i
-        cdef Neuron input_
-        cdef double weight
-        cdef double raw_value = 0.0
-        for i in range(len(inputs)):
-            input_ = inputs[i]
-            weight = self.input_weights[i]
-            raw_value += input_.value * weight
-        self.raw_value = raw_value
-        self.value = self.fn(self.raw_value)
+        self._values = values
+        self._raw = raw
+        self._offset = offset
+        self.input_weights = input_weights
+
+    property value:
+        def __get__(self):
+            return self._values[self._offset]
+        def __set__(self, double value):
+            self._values[self._offset] = value
+
+    property raw_value:
+        def __get__(self):
+            return self._raw[self._offset]
 
     def connect_viewport(self, viewport, neuron_width, neuron_height, neuron_centre):
+        import pygame # not needed for headless use
         self.image = pygame.Surface((neuron_width, neuron_height), pygame.locals.SRCALPHA).convert_alpha()
         self.rect = self.image.get_rect()
         self.rect.x = neuron_centre[0] - neuron_width // 2
         self.rect.y = neuron_centre[1] - neuron_height // 2
-        self.font = pygame.font.Font(None, 18)
         self.viewport = viewport
+        self._drawn = None
 
     def draw(self):
+        """Redraw the neuron if its text or selection changed.
+
+        Returns True if the image was redrawn.
+        """
+        text = str(self.value and '%0.1f'%self.value)
+        active = self.viewport.active_item is self
+        if (text, active) == self._drawn:
+            return False
+        self._drawn = text, active
+
+        import pygame
         colour = 128, 255, 128
-        if self.viewport.active_item is self:
+        if active:
             colour = 0, 255, 0
-        rect = Rect(0, 0, self.rect.w, self.rect.h)
+        rect = pygame.Rect(0, 0, self.rect.w, self.rect.h)
         pygame.draw.ellipse(self.image, colour, rect, 0)
-        text = self.font.render(
-            str(self.value and '%0.1f'%self.value), True, (0, 0, 0))
+        text = self.viewport.labels.render(text, (0, 0, 0))
         textrect = text.get_rect()
         textpos = (self.rect.w // 2) - (textrect.w // 2), (self.rect.h // 2) - (textrect.h // 2)
 
         self.image.blit(text, textpos)
+        return True
 
     def __repr__(self):
-        return "Neuron(%r, %r, %r)" % (self.input_weights, self.value, self.fn)
+        return "Neuron(%r, %r, %r)" % (
+            list(self.input_weights), self.value, self.fn)
 
     def __str__(self):
         lines = [
@@ -1,4 +1,5 @@
-import operator
+import math
+import bisect
 import collections
 import colorsys
 
@@ -6,10 +7,18 @@ import pygame
 from pygame.locals import *
 
 import viewport
-import characters
-import neuron
+import species
 
 class GenePopView(viewport.Viewport):
+    """One row of colours per character's genome, oldest character first.
+
+    The first cell of each row is the colour of the character's species;
+    right click to group the rows by species, oldest species first.
+
+    Rows are rendered once per distinct genome into a pixel buffer and
+    cached. The row order is maintained on birth and death rather than
+    re-sorted, and only rows from the first changed position are redrawn.
+    """
 
     def __init__(self, parent, viewport_rect):
         super(GenePopView, self).__init__(
@@ -18,71 +27,112 @@ class GenePopView(viewport.Viewport):
         self.xwidth = 2
         self.ywidth = 2
         self.sorted_chars = []
+        self._sort_keys = [] # sort keys of sorted_chars, for bisect
+        self._rows = {} # genome key -> rendered row Surface
+        self._dirty_from = 0 # first row that needs redrawing
+        self._drawn = 0 # number of rows currently on the canvas
+        self._selected = None
+        self.by_species = False
+
+        world = self.parent.world
+        world.birth_callbacks.append(self.born)
+        world.death_callbacks.append(self.died)
+        for character in world.allcharacters:
+            self.born(character)
+
+    def sort_key(self, character):
+        if self.by_species:
+            # species ids are assigned in order of appearance, so the oldest
+            # species come first
+            return character.species, character.created
+        return character.created
+
+    def born(self, character):
+        key = self.sort_key(character)
+        index = bisect.bisect_right(self._sort_keys, key)
+        self._sort_keys.insert(index, key)
+        self.sorted_chars.insert(index, character)
+        self._dirty_from = min(self._dirty_from, index)
+
+    def died(self, character):
+        index = bisect.bisect_left(self._sort_keys, self.sort_key(character))
+        index = self.sorted_chars.index(character, index)
+        del self._sort_keys[index]
+        del self.sorted_chars[index]
+        self._dirty_from = min(self._dirty_from, index)
+        if character.genome not in self.parent.world.genomes:
+            self._rows.pop(character.genome.key, None)
+
+    def render_row(self, g, species_id, selected=False):
+        """Render genome g as a row Surface, ywidth pixels high."""
+        s = selected and 255
+        cells = [species.colour(species_id)]
+        colour = min(int(g.size / 30. * 255), 255)
+        cells.append((colour, colour, s or colour))
+        cells.append(tuple(
+            int(255 * val) for val in colorsys.hsv_to_rgb(g.hue / 100, 1.0, 1.0)))
+        colour = min(int(g.hidden_neurons / 10. * 255), 255)
+        cells.append((colour, colour, s or colour))
+
+        # This style should show two creatures 'matching up' even if one
+        # of them had their whole length of genome changed by a mutated
+        # hidden_neurons gene.
+        exp = math.exp
+        for i in range(g.hidden_neurons):
+            weights = (
+                g.hidden0_weights[i * g._inputs:(i + 1) * g._inputs]
+                + g.output_weights[i * g._outputs:(i + 1) * g._outputs])
+            for weight in weights:
+                colour = int(255 / (1 + exp(-weight)))
+                cells.append((colour, colour, s or colour))
 
-    def draw(self):
-        self.canvas.fill((0, 0, 0))
-        off = 0
-        self.sorted_chars = sorted(
-            self.parent.world.allcharacters,
-            key=operator.attrgetter('created'))
         xwidth = self.xwidth
-        ywidth = self.ywidth
-        hsv_to_rgb = colorsys.hsv_to_rgb
-        for character in self.sorted_chars:
-            g = character.genome
-            s = selected = (self.parent.world.active_item is character) * 255
-            xoff = 0
-
-            colour = int(g.size / 30. * 255)
-            start = (xoff, off)
-            xoff += xwidth
-            end = (xoff, off)
-            pygame.draw.line(self.canvas, (colour, colour, s or colour),
-                             start, end, ywidth)
-
-            rgb = tuple(255 * val for val in hsv_to_rgb(g.hue / 100, 1.0, 1.0))
-            start = (xoff, off)
-            xoff += xwidth
-            end = (xoff, off)
-            pygame.draw.line(self.canvas, rgb, start, end, ywidth)
-
-            colour = int(g.hidden_neurons / 10. * 255)
-            start = (xoff, off)
-            xoff += xwidth
-            end = (xoff, off)
-            pygame.draw.line(self.canvas, (colour, colour, s or colour),
-                                           start, end, ywidth)
-
-            # This style should show two creatures 'matching up' even if one
-            # of them had their whole length of genome changed by a mutated
-            # hidden_neurons gene.
-            for i in range(g.hidden_neurons):
-                for j in range(g._inputs):
-                    weight = g.hidden0_weights[i * g._inputs + j]             
-                    colour = int(neuron.sigmoid(weight) * 255)
-                    start = (xoff, off)
-                    xoff += xwidth
-                    end = (xoff, off)
-                    pygame.draw.line(
-                        self.canvas, (colour, colour, s or colour),
-                        start, end, ywidth)
-                for j in range(g._outputs):
-                    weight = g.hidden0_weights[i * g._outputs + j]             
-                    colour = int(neuron.sigmoid(weight) * 255)
-                    start = (xoff, off)
-                    xoff += xwidth
-                    end = (xoff, off)
-                    pygame.draw.line(
-                        self.canvas, (colour, colour, s or colour),
-                        start, end, ywidth)
-
-            off += ywidth
-            if off > self.height:
-                break
+        row = b''.join(bytes(cell) * xwidth for cell in cells)
+        return pygame.image.frombuffer(
+            row * self.ywidth, (len(cells) * xwidth, self.ywidth), 'RGB')
+
+    def draw(self):
+        selected = self.parent.world.active_item
+        if selected is not self._selected:
+            for character in (self._selected, selected):
+                if character in self.parent.world.allcharacters:
+                    self._dirty_from = min(
+                        self._dirty_from, self.sorted_chars.index(character))
+            self._selected = selected
+
+        first = self._dirty_from
+        last = min(len(self.sorted_chars), self.height // self.ywidth + 1)
+        if first < max(last, self._drawn):
+            ywidth = self.ywidth
+            self.canvas.fill((0, 0, 0), (0, first * ywidth,
+                self.canvas.get_width(), self.canvas.get_height()))
+            rows = self._rows
+            for index in range(first, last):
+                character = self.sorted_chars[index]
+                g = character.genome
+                if character is selected:
+                    row = self.render_row(g, character.species, True)
+                else:
+                    row = rows.get(g.key)
+                    if row is None:
+                        row = rows[g.key] = self.render_row(
+                            g, character.species)
+                self.canvas.blit(row, (0, index * ywidth))
+            self._drawn = last
+        self._dirty_from = len(self.sorted_chars)
 
         self.image.blit(self.canvas, self.drag_offset)
 
     def onclick(self, relpos, button):
+        if button == 3:
+            self.by_species = not self.by_species
+            characters = self.sorted_chars
+            self.sorted_chars = []
+            self._sort_keys = []
+            for character in characters:
+                self.born(character)
+            self._dirty_from = 0
+            return
         sorted_chars_idx = relpos[1] // self.ywidth
         if sorted_chars_idx < len(self.sorted_chars):
             char = self.sorted_chars[sorted_chars_idx]
@@ -91,53 +141,68 @@ class GenePopView(viewport.Viewport):
             self.parent.world.jump_to(char)
 
 class TimePopView(viewport.Viewport):
+    """Population, average age and average generation over the run.
+
+    Reads the multi-resolution histories in the world's PopulationStats, so
+    drawing costs the same however long the run has been. Left click zooms
+    into the clicked part of the plot, any other button zooms back out.
+    """
 
     def __init__(self, parent, viewport_rect):
         super(TimePopView, self).__init__(
             parent, viewport_rect, viewport_rect.w, viewport_rect.h)
         self.font = pygame.font.Font(None, 18)
         self.h = viewport_rect.h
-        self.pop_plots = collections.deque()
-        self.avgage_plots = collections.deque()
-        self.avggen_plots = collections.deque()
         self.plot_every = 5
         self.plot_count = 0
+        self.width = 2
+        self.zoom = None # (start tick, end tick), or None for the whole run
 
     def draw(self):
         if self.plot_count == 0:
             self.canvas.fill((0, 0, 0))
-            pop = len(self.parent.world.allcharacters)
-            avgage = sum(c.age for c in self.parent.world.allcharacters) / float(pop or 1)
-            avggen = sum(c.gen for c in self.parent.world.allcharacters) / float(pop or 1)
+            stats = self.parent.world.stats
+            columns = self.canvas_w // self.width
+            start, end = self.zoom or (None, None)
             label_xoff = 0
-            for label, plots, latest, colour in (
-                ('Pop', self.pop_plots, pop, (255, 255, 0)),
-                ('AvAge', self.avgage_plots, avgage, (0, 255, 0)),
-                ('AvGen', self.avggen_plots, avggen, (0, 255, 255))):
-                plots.append(latest)
-                if len(plots) > 100:
-                    plots.popleft()
-                width = 2
-                max_ = max(plots) or 1
+            for label, series, colour in (
+                ('Pop', stats.pop_history, (255, 255, 0)),
+                ('AvAge', stats.avgage_history, (0, 255, 0)),
+                ('AvGen', stats.avggen_history, (0, 255, 255)),
+                ('Spp', self.parent.world.species.history, (255, 128, 255))):
+                plots = series.resample(columns, start, end)
+                width = self.width
+                max_ = max([plot[2] for plot in plots if plot] or [0]) or 1
+                scale = (self.h - 20) / float(max_)
                 for i, plot in enumerate(plots):
+                    if plot is None:
+                        continue
+                    low, mean, high = plot
                     x = width * i
-                    y = self.h - float(plot) / max_ * (self.h - 20)
-                    start = (x, y)
-                    end = (x, y + 2)
-                    pygame.draw.line(self.canvas, colour, start, end, width)
-                text = self.font.render('%s:%d'%(label, latest), False, colour)
+                    y = self.h - mean * scale
+                    if high > low:
+                        pygame.draw.line(self.canvas, [c // 3 for c in colour],
+                            (x, self.h - high * scale),
+                            (x, self.h - low * scale), width)
+                    pygame.draw.line(self.canvas, colour, (x, y), (x, y + 2), width)
+                text = self.font.render(
+                    '%s:%d' % (label, series.latest), False, colour)
                 rect = text.get_rect()
                 self.canvas.blit(text, (label_xoff, 0))
                 label_xoff += rect.w + 3
             self.image.blit(self.canvas, self.drag_offset)
         self.plot_count = (self.plot_count + 1) % self.plot_every
 
-    @property
-    def text(self):
-        raise NotImplementedError()
-    @text.setter
-    def text(self, value):
-        if value != self._text:
-            self._text_changed = True
-        self._text = value
+    def onclick(self, relpos, button):
+        if button != 1:
+            self.zoom = None
+        else:
+            series = self.parent.world.stats.pop_history
+            start, end = self.zoom or (series.first_tick, series.last_tick)
+            span = end - start
+            if span >= 4:
+                centre = start + span * relpos[0] // self.canvas_w
+                self.zoom = (max(centre - span // 4, start),
+                             min(centre + span // 4, end))
+        self.plot_count = 0
 
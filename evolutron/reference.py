@@ -0,0 +1,440 @@
+'''reference.py -- a slow, plain-Python specification of a world tick.
+
+WorldView.update() is prepare(), which does everything random about a tick
+(topping up the population, paging chunks, growing food), then step(),
+where every character senses, then acts, then collides, and the births
+and deaths take effect once it is all done (see events.py). This module
+restates step() as simply as it can, on a plain copy of the world made by
+snapshot(), so that the fast Cython version can be checked against it (see
+difftest.py). The one random thing in step(), the genomes of offspring, is
+taken as an input.
+
+It deliberately copies the fast code's numerics where they matter: energy
+is stored as a C float, pixel rects round their coordinates half away from
+zero, vision coordinates are truncated to ints, and the angle wraps with
+fmod.
+'''
+import math
+import struct
+import itertools
+
+VISION_RANGE = 50
+COS_VISION = 0.9210609940028851 # cos(0.4)
+SIN_VISION = 0.3894183423086505 # sin(0.4)
+TAU = 6.283185307179586
+
+FOOD_HEIGHT = 0.1
+TREE_HEIGHT = 1.0
+CHARACTER_HEIGHT = 0.5
+
+# mapgen terrain codes
+LAKE, MEADOW, FOREST = 1, 2, 3
+
+_FLOAT = struct.Struct('f')
+
+
+def f32(x):
+    '''x rounded to a C float, as Character.energy is stored.'''
+    return _FLOAT.unpack(_FLOAT.pack(x))[0]
+
+
+def rect_coord(x):
+    '''x as stored in a pygame Rect: rounded half away from zero.'''
+    return int(math.copysign(math.floor(abs(x) + 0.5), x))
+
+
+def colliderect(a, b):
+    '''a and b are [x, y, w, h].'''
+    return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2]
+            and a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
+
+def cdiv(a, b):
+    '''a / b with C's answer for division by zero.'''
+    if b == 0:
+        if a == 0 or a != a:
+            return float('nan')
+        return math.copysign(float('inf'), a) * math.copysign(1, b)
+    return a / b
+
+
+# Triangle tests, as in examples/triangle.py
+
+def _ccw(A, B, C):
+    return (C[1]-A[1]) * (B[0]-A[0]) > (B[1]-A[1]) * (C[0]-A[0])
+
+def intersect(A, B, C, D):
+    return _ccw(A, C, D) != _ccw(B, C, D) and _ccw(A, B, C) != _ccw(A, B, D)
+
+def _sign(p1, p2, p3):
+    return (p1[0] - p3[0]) * (p2[1] - p3[1]) - (p2[0] - p3[0]) * (p1[1] - p3[1])
+
+def point_in_triangle(pt, v1, v2, v3):
+    b1 = _sign(pt, v1, v2) < 0
+    b2 = _sign(pt, v2, v3) < 0
+    b3 = _sign(pt, v3, v1) < 0
+    return (b1 == b2) and (b2 == b3)
+
+def line_in_triangle(La, Lb, Ta, Tb, Tc):
+    return (point_in_triangle(La, Ta, Tb, Tc)
+            or point_in_triangle(Lb, Ta, Tb, Tc)
+            or intersect(La, Lb, Ta, Tb) or intersect(La, Lb, Ta, Tc))
+
+
+def activate(code, x):
+    '''neuron.pyx activation codes: 0 identity, 1 sigmoid, 2 cube.'''
+    if code == 1:
+        try:
+            return 1 / (1 + math.exp(-x))
+        except OverflowError:
+            return 0.0
+    if code == 2:
+        return x * x * x
+    return x
+
+
+def forward(sizes, activations, weights, inputs):
+    '''Evaluate a brain; returns the output values.'''
+    values = list(inputs)
+    w = 0
+    for layer in range(1, len(sizes)):
+        layer_values = []
+        for i in range(sizes[layer]):
+            acc = 0.0
+            for j in range(sizes[layer - 1]):
+                acc = acc + values[j] * weights[w + j]
+            w += sizes[layer - 1]
+            layer_values.append(activate(activations[layer], acc))
+        values = layer_values
+    return values
+
+
+class Food(object):
+    def __init__(self, key, rect):
+        self.key = key # identifies the Food sprite
+        self.rect = rect
+        x, y, w, h = rect
+        self.lines = [((x, y), (x + w, y + h))]
+        self.height = FOOD_HEIGHT
+
+
+class Tree(object):
+    def __init__(self, midx, midy, rect):
+        self.midx = midx
+        self.midy = midy
+        self.rect = rect
+        x, y, w, h = rect
+        self.lines = [((x, y), (x + w, y + h))]
+        self.height = TREE_HEIGHT
+
+
+class Tile(object):
+    def __init__(self, code, food, trees, characters):
+        self.code = code
+        self.food = food # [Food]
+        self.trees = trees # [Tree]
+        self.characters = characters # [Character], in the order they came
+
+
+class Character(object):
+    FIELDS = (
+        'id', 'midx', 'midy', 'r', 'mass', 'predator', 'angle', 'speed',
+        'energy', 'haptic', 'spawn', 'spawn_refractory', 'age', 'gen',
+        'parents', 'children', 'foodchain', 'on_water', 'on_grass',
+        'on_mulch', 'created')
+
+    def __init__(self, **values):
+        for name in self.FIELDS:
+            setattr(self, name, values[name])
+        self.rect = values['rect'] # [x, y, w, h]
+        self.tile = values['tile'] # (i, j), or None before the first sense
+        self.brain = values['brain'] # (sizes, activations, weights)
+        self.vision_left = 0
+        self.vision_right = 0
+        self.height = CHARACTER_HEIGHT
+        self.dead = False
+
+    def set_midpoint_x(self, x):
+        self.midx = x
+        self.rect[0] = rect_coord(x - 2 - self.r)
+
+    def set_midpoint_y(self, y):
+        self.midy = y
+        self.rect[1] = rect_coord(y - 2 - self.r)
+
+    @property
+    def lines(self):
+        x, y, w, h = self.rect
+        start = 0.2 + (self.r - 0.707)
+        end = w - start
+        return [((x + start, y + start), (x - end, y - end))]
+
+
+class World(object):
+    """A plain copy of a WorldView, as made by snapshot()."""
+
+    def __init__(self, age, next_id, config, tile_w, tile_h, width, height,
+                 tiles, characters):
+        self.age = age
+        self.next_id = next_id
+        self.config = config
+        self.tile_w = tile_w
+        self.tile_h = tile_h
+        self.width = width
+        self.height = height
+        self.tiles = tiles # (i, j) -> Tile, loaded tiles only
+        self.characters = characters # [Character], in the world's order
+        self.births = [] # Characters born during step()
+        self.deaths = [] # ids of Characters that died during step()
+        self._dead = []
+
+    def neighbourhood(self, coord):
+        if coord is None:
+            return []
+        i, j = coord
+        return [self.tiles[i + di, j + dj]
+                for di in (-1, 0, 1) for dj in (-1, 0, 1)
+                if (i + di, j + dj) in self.tiles]
+
+    def add_character(self, character):
+        self.births.append(character)
+
+    def die(self, character):
+        if character.dead:
+            return
+        character.dead = True
+        self._dead.append(character)
+
+    def commit(self):
+        '''The end of a tick: the dead leave, then the newborns arrive.'''
+        for character in self._dead:
+            self.characters.remove(character)
+            if character.tile is not None:
+                self.tiles[character.tile].characters.remove(character)
+            self.deaths.append(character.id)
+        for character in self.births:
+            character.id = self.next_id
+            self.next_id += 1
+            self.characters.append(character)
+
+
+def snapshot(world):
+    '''Copy the state of a WorldView that step() depends on.'''
+    characters = []
+    by_sprite = {}
+    for sprite in world.allcharacters:
+        tile = sprite.tile
+        brain = sprite.brain
+        character = Character(
+            rect=list(sprite.rect),
+            tile=(tile.x, tile.y) if tile is not None else None,
+            brain=(list(brain.sizes), list(brain.activations),
+                   list(brain.weights)),
+            **dict((name, getattr(sprite, name))
+                   for name in Character.FIELDS))
+        characters.append(character)
+        by_sprite[sprite] = character
+    tiles = {}
+    for coord, tile in world.alltiles_coords.items():
+        tiles[coord] = Tile(
+            tile.terrain_code,
+            [Food(id(f), list(f.rect)) for f in tile.allfood],
+            [Tree(t.midx, t.midy, list(t.rect)) for t in tile.alltrees],
+            [by_sprite[c] for c in tile.allcharacters])
+    return World(
+        int(world.age), world.next_id, world.config, world.tile_w,
+        world.tile_h, world.canvas_w, world.canvas_h, tiles, characters)
+
+
+def step(world, offspring):
+    '''Run WorldView.step() on a snapshot.
+
+    offspring -- an iterable of the Genomes the fast step gave its newborns,
+        in the order they were born.
+    '''
+    offspring = iter(offspring)
+    for character in list(world.characters):
+        sense(world, character)
+    for character in world.characters:
+        act(world, character, offspring)
+    collide(world, offspring)
+    world.commit()
+
+
+def sense(world, character):
+    coord = (character.midx // world.tile_w, character.midy // world.tile_h)
+    coord = (int(coord[0]), int(coord[1]))
+    if coord in world.tiles and coord != character.tile:
+        if character.tile is not None:
+            world.tiles[character.tile].characters.remove(character)
+        tile = world.tiles[coord]
+        tile.characters.append(character)
+        character.tile = coord
+        character.on_water = 1.0 if tile.code == LAKE else 0.0
+        character.on_grass = 1.0 if tile.code == MEADOW else 0.0
+        character.on_mulch = 1.0 if tile.code == FOREST else 0.0
+
+    s = math.sin(character.angle)
+    c = math.cos(character.angle)
+    vr = VISION_RANGE
+    start = int(character.midx), int(character.midy)
+    left = (int(start[0] + vr * (s * COS_VISION - c * SIN_VISION)),
+            int(start[1] - vr * (c * COS_VISION + s * SIN_VISION)))
+    middle = int(start[0] + vr * s), int(start[1] - vr * c)
+    right = (int(start[0] + vr * (s * COS_VISION + c * SIN_VISION)),
+             int(start[1] - vr * (c * COS_VISION - s * SIN_VISION)))
+
+    # each half of the vision triangle sees the first thing found in it
+    character.vision_left = 0
+    character.vision_right = 0
+    for tile in world.neighbourhood(character.tile):
+        for item in itertools.chain(tile.food, tile.trees, tile.characters):
+            if item is character:
+                continue
+            for a, b in item.lines:
+                a = int(a[0]), int(a[1])
+                b = int(b[0]), int(b[1])
+                if character.vision_left == 0 \
+                and line_in_triangle(a, b, start, left, middle):
+                    character.vision_left = item.height
+                if character.vision_right == 0 \
+                and line_in_triangle(a, b, start, middle, right):
+                    character.vision_right = item.height
+
+
+def act(world, character, offspring):
+    config = world.config
+    check_tiles = world.neighbourhood(character.tile)
+    character.age += 1
+
+    # eat any food touched
+    character.foodchain = False
+    if not character.predator:
+        eaten = [(tile, food) for tile in check_tiles for food in tile.food
+                 if colliderect(character.rect, food.rect)]
+        for tile, food in eaten:
+            character.energy = f32(character.energy + 1000)
+            tile.food.remove(food)
+
+    inputs = [
+        1, character.vision_left, character.vision_right,
+        character.on_water, character.on_grass, character.on_mulch,
+        character.haptic, character.energy / 10000]
+    if config.brain_memo:
+        # a memoized brain sees its energy in the middle of a bucket
+        quantum = config.brain_memo_energy / 10000.
+        bucket = math.floor(inputs[7] / quantum)
+        if 0 <= bucket < 2 ** 40:
+            inputs[7] = (bucket + 0.5) * quantum
+    angle_change, Fmove, character.spawn = forward(
+        *character.brain, inputs=inputs)
+    angle_change /= 2
+
+    if Fmove > 0:
+        cost = Fmove * config.move_cost + config.base_cost
+    else:
+        # moving backwards is possible, but harder
+        cost = -(Fmove * config.reverse_cost - config.base_cost)
+    character.energy = f32(character.energy - cost)
+    if character.energy <= 0:
+        world.die(character)
+        return
+
+    if character.spawn > 0.5 and character.energy > config.spawn_energy \
+    and character.spawn_refractory == 0:
+        character.energy = f32(character.energy - config.spawn_energy)
+        character.spawn_refractory = 60
+        child = newborn(world, next(offspring))
+        child.set_midpoint_x(character.midx)
+        child.set_midpoint_y(character.midy)
+        child.gen = character.gen + 1
+        child.parents = 1
+        character.children += 1
+        world.add_character(child)
+    if character.spawn_refractory > 0:
+        character.spawn_refractory -= 1
+
+    # move
+    friction = character.speed / 4
+    character.speed += (Fmove - friction) / character.mass
+    character.angle = math.fmod(character.angle + angle_change, TAU)
+    x = character.midx + character.speed * math.sin(character.angle)
+    y = character.midy - character.speed * math.cos(character.angle)
+    r = character.r
+    character.set_midpoint_x(min(max(r, x), world.width - r))
+    character.set_midpoint_y(min(max(r, y), world.height - r))
+
+    # bounce off the first tree hit
+    for tile in check_tiles:
+        hit = [t for t in tile.trees if colliderect(character.rect, t.rect)]
+        if hit:
+            tree = hit[0]
+            midpoint_x = (character.midx + tree.midx) / 2
+            midpoint_y = (character.midy + tree.midy) / 2
+            if midpoint_x != character.midx:
+                character.set_midpoint_x(
+                    character.midx + 10 / (character.midx - midpoint_x))
+            if midpoint_y != character.midy:
+                character.set_midpoint_y(
+                    character.midy + 10 / (character.midy - midpoint_y))
+            character.speed = 0
+            character.haptic = 1
+            break
+    else:
+        character.haptic = 0
+
+
+def collide(world, offspring):
+    config = world.config
+    for a, b in itertools.combinations(world.characters, 2):
+        if a.dead or b.dead or not colliderect(a.rect, b.rect):
+            continue
+        midpoint_x = (a.midx + b.midx) / 2
+        midpoint_y = (a.midy + b.midy) / 2
+        for character in (a, b):
+            move_x = cdiv(5., character.midx - midpoint_x)
+            move_y = cdiv(5., character.midy - midpoint_y)
+            character.set_midpoint_x(character.midx + min(move_x, 2.5))
+            character.set_midpoint_y(character.midy + min(move_y, 2.5))
+        for character in (a, b):
+            character.haptic = 1
+            character.speed /= 2
+
+        if a.predator == b.predator:
+            if a.spawn > 0 and b.spawn > 0 \
+            and a.energy > config.mate_energy and b.energy > config.mate_energy \
+            and a.spawn_refractory == 0 and b.spawn_refractory == 0:
+                for parent in (a, b):
+                    parent.energy = f32(parent.energy - config.mate_energy)
+                    parent.spawn_refractory = 30
+                    parent.children += 1
+                child = newborn(world, next(offspring))
+                child.set_midpoint_x(midpoint_x)
+                child.set_midpoint_y(midpoint_y)
+                child.gen = max(a.gen, b.gen) + 1
+                child.parents = 2
+                world.add_character(child)
+        else:
+            predator, prey = (a, b) if a.predator else (b, a)
+            predator.foodchain = True
+            prey.foodchain = True
+            if prey.energy < 1000:
+                predator.energy = f32(predator.energy + prey.energy)
+                prey.energy = 0.0
+                world.die(prey)
+            else:
+                predator.energy = f32(predator.energy + 900)
+                prey.energy = f32(prey.energy - 1000)
+
+
+def newborn(world, genome):
+    '''A Character made from genome, as Character.load_genome() does.'''
+    predator = genome.predator > 0
+    r = int(genome.size * (1.414 if predator else 1))
+    return Character(
+        id=-1, midx=-1, midy=-1, r=r, mass=genome.size, predator=predator,
+        angle=0.0, speed=0.0, energy=f32(world.config.child_energy),
+        haptic=0, spawn=0.0, spawn_refractory=100, age=0, gen=0, parents=0,
+        children=0, foodchain=False, on_water=0.0, on_grass=0.0,
+        on_mulch=0.0, created=world.age, rect=[0, 0, 2 * r, 2 * r],
+        tile=None, brain=genome.brain_layers())
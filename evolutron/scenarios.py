@@ -0,0 +1,202 @@
+'''scenarios.py -- seeded worst-case worlds for benchmarking and profiling.
+
+Random worlds rarely push any one part of the tick to its limit. Each
+scenario here builds a world that does, from a seed:
+
+    forest    every tile a forest with a tree, so that placing creatures
+              (WorldView._create_character) and tree collisions are slow
+    crowd     a thousand prey piled on top of each other (collisions)
+    predators predator swarms in among their prey (collisions, bites)
+    meadow    meadows full of food (eating, food growth)
+    sparse    a few creatures on a 50000x50000 map (chunk paging)
+
+A scenario is built into a fixture, a plain dict of the map arrays, the
+creatures and the Config settings it needs, which can be saved and loaded
+again as JSON:
+
+    fixture = scenarios.build('crowd', seed=1)
+    scenarios.save(fixture, 'crowd.json')
+    window = window.Window(screen, fixture['world_w'], fixture['world_h'],
+                           scenarios.config(fixture))
+    scenarios.populate(window.world, scenarios.load('crowd.json'))
+
+`python evolutron --scenario crowd` runs one (or a saved fixture), and
+`--benchmark scenarios` times a tick of each.
+'''
+import os
+import json
+import zlib
+import base64
+import random
+
+import chunks
+import config as _config
+import genome
+import mapgen
+import characters
+
+SCENARIOS = {} # name -> function(fixture) filling in a fixture
+TILE_W = TILE_H = 50 # as WorldView has them
+
+_ARRAYS = ('terrain', 'trees', 'food')
+
+
+def scenario(fn):
+    SCENARIOS[fn.__name__] = fn
+    return fn
+
+
+def _map(fixture, code=None):
+    '''Fill in the map arrays: all one terrain code, or random if None.'''
+    sizex = fixture['world_w'] // TILE_W
+    sizey = fixture['world_h'] // TILE_H
+    if code is None:
+        terrain = mapgen.generate_codes(sizex, sizey)
+    else:
+        terrain = bytearray((code,)) * (sizex * sizey)
+    fixture['terrain'] = terrain
+    fixture['trees'] = chunks.plant_trees(terrain, TILE_W, TILE_H)
+    fixture['food'] = bytearray(sizex * sizey)
+
+
+def _creatures(fixture, count, box, predator=None):
+    '''Add count random creatures within box, (x0, y0, x1, y1); predators,
+    prey, or either as they come if predator is None.'''
+    x0, y0, x1, y1 = box
+    for n in range(count):
+        g = genome.Genome.from_random(
+            characters.Character.brain_inputs,
+            characters.Character.brain_outputs)
+        if predator is not None:
+            g.predator = abs(g.predator) if predator else -abs(g.predator)
+        fixture['characters'].append({
+            'x': random.uniform(x0, x1),
+            'y': random.uniform(y0, y1),
+            'angle': random.uniform(0, 6.283185307179586),
+            'genome': g.dump(),
+        })
+
+
+@scenario
+def forest(fixture):
+    _map(fixture, mapgen.FOREST)
+    # the rest of min_characters are placed by the world, among the trees
+    _creatures(fixture, 50, (20, 20, 1980, 1980))
+
+
+@scenario
+def crowd(fixture):
+    fixture['world_w'] = fixture['world_h'] = 1000
+    fixture['settings']['min_characters'] = 0
+    _map(fixture, mapgen.MEADOW)
+    _creatures(fixture, 1000, (350, 350, 650, 650), predator=False)
+
+
+@scenario
+def predators(fixture):
+    fixture['world_w'] = fixture['world_h'] = 1500
+    fixture['settings']['min_characters'] = 0
+    _map(fixture, mapgen.MEADOW)
+    # a few dense swarms, each in the middle of a herd
+    for n in range(4):
+        x, y = random.uniform(300, 1200), random.uniform(300, 1200)
+        _creatures(fixture, 150, (x - 150, y - 150, x + 150, y + 150),
+                   predator=False)
+        _creatures(fixture, 75, (x - 60, y - 60, x + 60, y + 60),
+                   predator=True)
+
+
+@scenario
+def meadow(fixture):
+    _map(fixture, mapgen.MEADOW)
+    full = _config.Config(**fixture['settings']).food(mapgen.MEADOW)[1]
+    fixture['food'] = bytearray((min(full, 255),)) * len(fixture['food'])
+    _creatures(fixture, 150, (20, 20, 1980, 1980), predator=False)
+
+
+@scenario
+def sparse(fixture):
+    fixture['world_w'] = fixture['world_h'] = 50000
+    fixture['settings']['min_characters'] = 20
+    _map(fixture)
+    _creatures(fixture, 20, (20, 20, 49980, 49980))
+
+
+def build(name, seed=0):
+    '''Return the fixture of scenario name with a seed.'''
+    if name not in SCENARIOS:
+        raise ValueError('unknown scenario %r; choose from %s' % (
+            name, ', '.join(sorted(SCENARIOS))))
+    fixture = {
+        'scenario': name,
+        'seed': seed,
+        'world_w': 2000,
+        'world_h': 2000,
+        'settings': {},
+        'characters': [],
+    }
+    outer = random.getstate()
+    try:
+        random.seed(seed)
+        SCENARIOS[name](fixture)
+    finally:
+        random.setstate(outer)
+    return fixture
+
+
+def save(fixture, path):
+    obj = dict(fixture)
+    for name in _ARRAYS:
+        obj[name] = base64.b64encode(
+            zlib.compress(bytes(fixture[name]))).decode('ascii')
+    with open(path, 'w') as f:
+        json.dump(obj, f, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        fixture = json.load(f)
+    for name in _ARRAYS:
+        fixture[name] = bytearray(zlib.decompress(
+            base64.b64decode(fixture[name])))
+    return fixture
+
+
+def find(spec, seed=0):
+    '''Return a fixture from a scenario name, or the path of a saved one.'''
+    if spec in SCENARIOS or not os.path.exists(spec):
+        return build(spec, seed)
+    return load(spec)
+
+
+def config(fixture, **settings):
+    '''Return the Config for a fixture, with settings overriding its own.'''
+    merged = dict(fixture['settings'])
+    merged.update(settings)
+    return _config.Config(**merged)
+
+
+def populate(world, fixture):
+    '''Lay out the map and creatures of a fixture in a new, empty world of
+    its size, and seed the random module with the fixture's seed, so that
+    every run of a fixture is the same.'''
+    store = world.chunks
+    if store.loaded or len(world.allcharacters):
+        raise ValueError('scenarios need a new world')
+    if (world.world_w, world.world_h) != (
+            fixture['world_w'], fixture['world_h']):
+        raise ValueError('scenario %r needs a %dx%d world' % (
+            fixture['scenario'], fixture['world_w'], fixture['world_h']))
+    store.terrain[:] = fixture['terrain']
+    store.trees[:] = fixture['trees']
+    store.food[:] = fixture['food']
+    inputs = characters.Character.brain_inputs
+    outputs = characters.Character.brain_outputs
+    for obj in fixture['characters']:
+        character = characters.Character.from_genome(
+            world, genome.Genome.load(obj['genome'], inputs, outputs))
+        character.set_midpoint_x(obj['x'])
+        character.set_midpoint_y(obj['y'])
+        character.angle = obj['angle']
+        world.add_character(character)
+    random.seed(fixture['seed'])
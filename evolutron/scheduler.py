@@ -0,0 +1,96 @@
+'''scheduler.py -- how many ticks the main loop runs between frames.
+
+At 1x the simulation runs at the target tick rate (SimState.tickrate), at
+10x ten times as fast, and at max as fast as it can. Whatever the speed,
+ticking stops in time for the next frame: run() keeps an exponentially
+weighted average of what a tick and a frame cost, and only starts a tick
+that is expected to finish within the frame's budget. It runs at least
+one tick per batch when any is due, so when ticks cost more than a frame
+the simulation slows to one tick per frame instead of the window freezing,
+and ticks that fell behind are dropped rather than caught up on.
+'''
+import time
+
+# (multiple of the target tick rate, name); 0 runs as fast as possible
+SPEEDS = ((1, '1x'), (10, '10x'), (0, 'max'))
+
+
+class TickScheduler(object):
+
+    def __init__(self, frame_time=1/60., smoothing=0.1):
+        '''
+        frame_time -- seconds between frames
+        smoothing -- weight of the newest measurement in the averages
+        '''
+        self.frame_time = frame_time
+        self.smoothing = smoothing
+        self.speed = 1
+        self.tick_cost = None # seconds, averaged
+        self.frame_cost = 0.0 # seconds, averaged; 0 when not rendering
+        self._owed = 0.0 # ticks due at the current speed but not yet run
+        self._last = None
+
+    @property
+    def name(self):
+        return dict(SPEEDS)[self.speed]
+
+    def set_speed(self, name):
+        for speed, speed_name in SPEEDS:
+            if speed_name == name:
+                self.speed = speed
+                return
+        raise ValueError('speed must be one of %s' % ', '.join(
+            speed_name for speed, speed_name in SPEEDS))
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+    def budget(self):
+        """Seconds left for ticking in each frame."""
+        # never less than a quarter of the frame, however slow drawing is
+        return max(self.frame_time - self.frame_cost, self.frame_time / 4)
+
+    def run(self, tick, tickrate):
+        """Call tick() as many times as are due and fit in the budget.
+
+        tickrate -- seconds per tick at 1x, 0 for no limit
+        Returns the number of ticks run.
+        """
+        now = time.perf_counter()
+        if self.speed and tickrate:
+            if self._last is not None:
+                self._owed += (now - self._last) * self.speed / tickrate
+            # a batch that couldn't keep up isn't made up for later
+            self._owed = min(
+                self._owed, self.frame_time * self.speed / tickrate + 1)
+            due = int(self._owed)
+            self._last = now
+        else:
+            due = -1 # unlimited
+            self._last = None
+        deadline = now + self.budget()
+        ran = 0
+        while ran != due:
+            start = time.perf_counter()
+            if ran and start + self.tick_cost > deadline:
+                break
+            tick()
+            self.tick_cost = self._average(
+                self.tick_cost, time.perf_counter() - start)
+            ran += 1
+        if due > 0:
+            self._owed -= ran
+        return ran
+
+    def drew(self, seconds):
+        """Record the time a frame took to draw."""
+        self.frame_cost = self._average(self.frame_cost, seconds)
+
+    def idle(self, tickrate):
+        """Seconds the main loop can sleep before anything is due."""
+        if not (self.speed and tickrate):
+            return 0.0
+        until_tick = (1 - self._owed) * tickrate / self.speed
+        return max(0.0, min(until_tick, self.frame_time))
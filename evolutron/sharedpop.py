@@ -0,0 +1,205 @@
+'''sharedpop.py -- the live population in shared memory, for other processes.
+
+With `--share-population NAME`, a PopulationWriter copies a column per
+creature field (COLUMNS) into a multiprocessing.shared_memory block named
+NAME once per tick. Analysis scripts and notebooks attach to it with a
+PopulationReader, which maps the block read-only and never pauses the
+simulation:
+
+    reader = sharedpop.PopulationReader('evolutron')
+    tick, columns = reader.read() # a consistent copy of every column
+    reader.close()
+
+The block starts with a header (HEADER) whose version counter is a seqlock:
+the writer makes it odd before it changes the columns and even again after.
+Code that works on the columns in place, without copying them, checks that
+the version was the same even number before and after, and otherwise tries
+again:
+
+    while True:
+        version = reader.begin()
+        mean = sum(reader.columns['energy'][:reader.count]) / reader.count
+        if not reader.retry(version):
+            break
+
+The block has room for `capacity` creatures. When the population outgrows
+it the first `capacity` are published, and the header's total says how many
+there are.
+'''
+import time
+import struct
+from array import array
+from multiprocessing import shared_memory
+
+MAGIC = b'EVOPOP1\0'
+# magic, version, tick, capacity, count, total, padding
+HEADER = struct.Struct('<8sQQIIII')
+VERSION = struct.Struct('<Q')
+VERSION_OFFSET = 8
+
+# (name, array typecode, value of a Character)
+COLUMNS = (
+    ('id', 'q', lambda c: c.id),
+    ('x', 'd', lambda c: c.midx),
+    ('y', 'd', lambda c: c.midy),
+    ('energy', 'd', lambda c: c.energy),
+    ('age', 'i', lambda c: c.age),
+    ('gen', 'i', lambda c: c.gen),
+    ('predator', 'B', lambda c: c.predator),
+    ('hue', 'd', lambda c: c.hue),
+    ('size', 'i', lambda c: c.mass),
+    ('hidden_neurons', 'i', lambda c: c.genome.hidden_neurons),
+)
+
+
+def layout(capacity):
+    """Return ({column name: byte offset}, size of the block)."""
+    offsets = {}
+    offset = HEADER.size
+    for name, typecode, value in COLUMNS:
+        offsets[name] = offset
+        size = capacity * array(typecode).itemsize
+        offset += (size + 7) // 8 * 8
+    return offsets, offset
+
+
+def _columns(buf, capacity):
+    offsets, size = layout(capacity)
+    columns = {}
+    for name, typecode, value in COLUMNS:
+        start = offsets[name]
+        end = start + capacity * array(typecode).itemsize
+        columns[name] = buf[start:end].cast(typecode)
+    return columns
+
+
+class PopulationWriter(object):
+    """Publishes a world's creatures into a new shared memory block."""
+
+    def __init__(self, world, name=None, capacity=4096):
+        '''
+        name -- of the block; a random one is chosen if None
+        capacity -- creatures the block has room for
+        '''
+        self.world = world
+        self.capacity = capacity
+        offsets, size = layout(capacity)
+        self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = self.shm.name
+        self.columns = _columns(self.shm.buf, capacity)
+        self.version = 0
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, 0, 0, capacity, 0, 0, 0)
+
+    def publish(self):
+        """Copy the current population into the block."""
+        characters = list(self.world.allcharacters)[:self.capacity]
+        count = len(characters)
+        # build every column first, keeping the block's odd window short
+        values = [array(typecode, [value(c) for c in characters])
+                  for name, typecode, value in COLUMNS]
+        buf = self.shm.buf
+        self.version += 1
+        VERSION.pack_into(buf, VERSION_OFFSET, self.version)
+        for (name, typecode, value), column in zip(COLUMNS, values):
+            self.columns[name][:count] = column
+        HEADER.pack_into(buf, 0, MAGIC, self.version, int(self.world.age),
+                         self.capacity, count,
+                         len(self.world.allcharacters), 0)
+        self.version += 1
+        VERSION.pack_into(buf, VERSION_OFFSET, self.version)
+
+    def close(self):
+        """Release and remove the block; readers keep what they mapped."""
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.shm.close()
+        self.shm.unlink()
+
+
+class PopulationReader(object):
+    """A read-only view of a block published by a PopulationWriter."""
+
+    def __init__(self, name):
+        try:
+            self.shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # before Python 3.13, attaching registers the block to be
+            # removed when this process exits, under the writer's feet
+            from multiprocessing import resource_tracker
+            self.shm = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self._buf = self.shm.buf.toreadonly()
+        magic, version, tick, capacity, count, total, pad = \
+            HEADER.unpack_from(self._buf)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('%s is not a population block' % name)
+        self.capacity = capacity
+        self._offsets = layout(capacity)[0]
+        # memoryviews onto the block, `capacity` long; see count
+        self.columns = _columns(self._buf, capacity)
+
+    def _header(self):
+        return HEADER.unpack_from(self._buf)
+
+    @property
+    def version(self):
+        return VERSION.unpack_from(self._buf, VERSION_OFFSET)[0]
+
+    @property
+    def tick(self):
+        return self._header()[2]
+
+    @property
+    def count(self):
+        """Creatures in the columns."""
+        return self._header()[4]
+
+    @property
+    def total(self):
+        """Creatures alive, some of which may not fit in the columns."""
+        return self._header()[5]
+
+    def begin(self, timeout=1.0):
+        """Wait until no update is under way; return the version."""
+        deadline = time.monotonic() + timeout
+        while True:
+            version = self.version
+            if not version & 1:
+                return version
+            if time.monotonic() > deadline:
+                raise TimeoutError('population block stuck mid-update')
+            time.sleep(0)
+
+    def retry(self, version):
+        """Whether the columns changed since begin() returned version."""
+        return self.version != version
+
+    def read(self, timeout=1.0):
+        """Return (tick, {column name: array}) copied from one tick."""
+        while True:
+            version = self.begin(timeout)
+            magic, v, tick, capacity, count, total, pad = self._header()
+            columns = {}
+            for name, typecode, value in COLUMNS:
+                columns[name] = column = array(typecode)
+                start = self._offsets[name]
+                column.frombytes(
+                    self._buf[start:start + count * column.itemsize])
+            if not self.retry(version):
+                return tick, columns
+
+    def rows(self, timeout=1.0):
+        """Return (tick, [{column name: value}, ...]) from one tick."""
+        tick, columns = self.read(timeout)
+        names = [name for name, typecode, value in COLUMNS]
+        return tick, [dict(zip(names, row))
+                      for row in zip(*(columns[name] for name in names))]
+
+    def close(self):
+        for column in getattr(self, 'columns', {}).values():
+            column.release()
+        self.columns = {}
+        self._buf.release()
+        self.shm.close()
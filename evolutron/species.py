@@ -0,0 +1,177 @@
+'''species.py -- approximate species detection for the living population.
+
+Genomes are embedded as fixed-length vectors and grouped into species by
+distance to each species' founder. Candidate species are found with
+locality-sensitive hashing (random hyperplanes, several tables), so
+classifying a new genome costs the same however many species there are,
+and each distinct genome is only classified once.
+'''
+import math
+import random
+import operator
+import colorsys
+
+import history
+
+MAX_HIDDEN = 10 # hidden neurons embedded; genomes with more are truncated
+
+
+def embed(genome):
+    '''Return a fixed-length list of floats describing genome.
+
+    Weights are padded per neuron to MAX_HIDDEN neurons, so that the
+    weights of the same hidden neuron line up across genomes with
+    different hidden_neurons genes.
+    '''
+    inputs, outputs = genome._inputs, genome._outputs
+    hidden = genome.hidden_neurons
+    used = min(hidden, MAX_HIDDEN)
+    angle = genome.hue / 100. * 2 * math.pi
+    vector = [
+        genome.size / 10., math.cos(angle), math.sin(angle), genome.predator,
+        hidden / 5., len(genome.extra_layers)]
+    vector.extend(genome.hidden0_weights[:used * inputs])
+    vector.extend([0.0] * ((MAX_HIDDEN - used) * inputs))
+    weights = genome.output_weights
+    if genome.extra_layers:
+        # these connect to the last layer, not the first; leave them out
+        weights = ()
+    for k in range(outputs):
+        row = weights[k * hidden:k * hidden + used]
+        vector.extend(row)
+        vector.extend([0.0] * (MAX_HIDDEN - len(row)))
+    return vector
+
+
+class Species(object):
+    def __init__(self, id, founder, signatures, tick):
+        self.id = id
+        self.founder = founder # embedding of the first genome
+        self.signatures = signatures # LSH bucket in each table
+        self.founded = tick
+        self.count = 0 # living members
+        self.total = 0 # members ever
+
+    def __repr__(self):
+        return '<Species %d: %d alive>' % (self.id, self.count)
+
+
+class SpeciesTracker(object):
+    """Assigns every character a species id as it is born.
+
+    threshold -- the greatest distance from a species' founder, in embedding
+        space, of a genome that belongs to it. Mutations stay well inside
+        it; unrelated random genomes are several times further apart.
+    tables, bits -- number of LSH tables and hyperplanes per table. More
+        tables find near species more reliably; more bits make buckets
+        smaller.
+
+    Species with no living members are forgotten.
+    """
+
+    def __init__(self, threshold=3.0, tables=8, bits=6, seed=0):
+        self.threshold = threshold
+        self.tables = tables
+        self.bits = bits
+        # separate from the simulation's random state
+        self._random = random.Random(seed)
+        self._planes = None # created on first use, when the size is known
+        self._buckets = [{} for i in range(tables)] # signature -> [species]
+        self._by_key = {} # genome key -> [species, living characters]
+        self.species = {} # id -> Species, living species only
+        self.next_id = 0
+        self.extinct = 0
+        self.history = history.History() # number of living species
+
+    def born(self, character):
+        genome = character.genome
+        entry = self._by_key.get(genome.key)
+        if entry is None:
+            entry = self._by_key[genome.key] = [
+                self.classify(genome, character.created), 0]
+        entry[1] += 1
+        species = entry[0]
+        species.count += 1
+        species.total += 1
+        character.species = species.id
+
+    def died(self, character):
+        key = character.genome.key
+        entry = self._by_key[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._by_key[key]
+        species = entry[0]
+        species.count -= 1
+        if species.count == 0:
+            self._forget(species)
+
+    def tick(self, tick):
+        self.history.append(tick, len(self.species))
+
+    def _signatures(self, vector):
+        if self._planes is None:
+            gauss = self._random.gauss
+            self._planes = [
+                [[gauss(0, 1) for i in vector] for j in range(self.bits)]
+                for k in range(self.tables)]
+        mul = operator.mul
+        signatures = []
+        for planes in self._planes:
+            signature = 0
+            for plane in planes:
+                signature = signature << 1 | (sum(map(mul, plane, vector)) > 0)
+            signatures.append(signature)
+        return signatures
+
+    def classify(self, genome, tick=0):
+        '''Return the Species of a genome, founding a new one if none is near.'''
+        vector = embed(genome)
+        signatures = self._signatures(vector)
+        best = None
+        best_distance = self.threshold * self.threshold
+        sub = operator.sub
+        seen = set()
+        for buckets, signature in zip(self._buckets, signatures):
+            for species in buckets.get(signature, ()):
+                if species.id in seen:
+                    continue
+                seen.add(species.id)
+                distance = sum(d * d for d in map(sub, vector, species.founder))
+                if distance < best_distance:
+                    best, best_distance = species, distance
+        if best is not None:
+            return best
+
+        species = Species(self.next_id, vector, signatures, tick)
+        self.next_id += 1
+        self.species[species.id] = species
+        for buckets, signature in zip(self._buckets, signatures):
+            buckets.setdefault(signature, []).append(species)
+        return species
+
+    def _forget(self, species):
+        del self.species[species.id]
+        self.extinct += 1
+        for buckets, signature in zip(self._buckets, species.signatures):
+            bucket = buckets[signature]
+            bucket.remove(species)
+            if not bucket:
+                del buckets[signature]
+
+    def counts(self):
+        '''Return (species id, living members) pairs, largest first.'''
+        return sorted(
+            ((species.id, species.count) for species in self.species.values()),
+            key=lambda pair: (-pair[1], pair[0]))
+
+    def __len__(self):
+        return len(self.species)
+
+
+def colour(species_id):
+    '''A colour to tell species apart by.'''
+    # golden ratio steps spread consecutive ids around the hue circle
+    hue = (species_id * 0.618033988749895) % 1.0
+    return tuple(int(255 * c) for c in colorsys.hsv_to_rgb(hue, 0.8, 1.0))
+
@@ -0,0 +1,310 @@
+'''stream.py -- compact per-tick world deltas for a separate viewer process.
+
+Every tick the simulation encodes what changed since the last message it
+sent: moved creatures as quantized positions and angles, births (with a
+genome id, the genome itself sent only the first time it is used), deaths,
+and food that appeared or was eaten. Messages go into a bounded
+multiprocessing queue without ever waiting; if the viewer has fallen behind
+and the queue is full, the message is dropped and keyframes holding the
+whole world are sent until one gets through.
+
+All numbers are little-endian; see DeltaEncoder for the layout.
+'''
+import json
+import time
+import queue
+import struct
+
+KEYFRAME, DELTA = 0, 1
+
+HEADER = struct.Struct('<BIId') # kind, sequence number, tick, send time
+COUNT = struct.Struct('<I')
+MAP = struct.Struct('<HHHHd') # tiles x, tiles y, tile w, tile h, pos scale
+TREE = struct.Struct('<HHB') # x, y, r
+GENOME = struct.Struct('<II') # genome id, length of JSON that follows
+CREATURE = struct.Struct('<IIHHBBB') # id, genome id, x, y, angle, energy, parents
+MOVE = struct.Struct('<IHHBB') # id, x, y, angle, energy
+FOOD = struct.Struct('<IHH') # food id, x, y
+ID = struct.Struct('<I')
+
+ANGLE_SCALE = 256 / 6.283185307179586
+ENERGY_SCALE = 1 / 50. # energy is sent in units of 50J, capped at 255
+
+
+def _records(record, items):
+    return COUNT.pack(len(items)) + b''.join(record.pack(*item) for item in items)
+
+
+class DeltaEncoder(object):
+    """Encodes the state of a WorldView as keyframes and deltas."""
+
+    def __init__(self, world):
+        self.world = world
+        self.scale = 65535. / max(world.canvas_w, world.canvas_h)
+        self.seq = 0
+        self.resync = True # next message must be a keyframe
+        self._sent = {} # creature id -> last sent MOVE fields
+        self._genome_ids = {} # genome key -> genome id, of living genomes
+        self._next_genome_id = 0
+        self._food_ids = {} # Food -> food id
+        self._next_food_id = 0
+        self._births = []
+        self._deaths = []
+        world.birth_callbacks.append(self._births.append)
+        world.death_callbacks.append(self._deaths.append)
+
+    def _genome_id(self, genome, new_genomes):
+        gid = self._genome_ids.get(genome.key)
+        if gid is None:
+            gid = self._genome_ids[genome.key] = self._next_genome_id
+            self._next_genome_id += 1
+            new_genomes.append((gid, genome))
+        return gid
+
+    def _move(self, character):
+        # creatures can stray a little past the edge of the world
+        return (
+            character.id,
+            min(max(int(character.midx * self.scale), 0), 65535),
+            min(max(int(character.midy * self.scale), 0), 65535),
+            int(character.angle * ANGLE_SCALE) & 255,
+            min(int(character.energy * ENERGY_SCALE), 255) if character.energy > 0 else 0)
+
+    def _creature(self, character, new_genomes):
+        move = self._move(character)
+        self._sent[character.id] = move
+        return (move[0], self._genome_id(character.genome, new_genomes)) \
+            + move[1:] + (character.parents,)
+
+    def _genomes(self, new_genomes):
+        parts = [COUNT.pack(len(new_genomes))]
+        for gid, genome in new_genomes:
+            data = json.dumps(genome.dump()).encode('utf-8')
+            parts.append(GENOME.pack(gid, len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+    def _header(self, kind):
+        self.seq += 1
+        return HEADER.pack(kind, self.seq, int(self.world.age), time.time())
+
+    def keyframe(self):
+        """Encode the whole world."""
+        world = self.world
+        del self._births[:]
+        del self._deaths[:]
+        self._sent.clear()
+        self._genome_ids.clear()
+        self._food_ids.clear()
+
+        store = world.chunks
+        sizex, sizey = store.sizex, store.sizey
+        terrain = bytes(store.terrain)
+        trees = list(store.tree_positions())
+        new_genomes = []
+        creatures = [self._creature(c, new_genomes) for c in world.allcharacters]
+        foods = []
+        for f in world.allfood:
+            foods.append((self._food_id(f), f.rect.x, f.rect.y))
+        return b''.join((
+            self._header(KEYFRAME),
+            MAP.pack(sizex, sizey, world.tile_w, world.tile_h, self.scale),
+            terrain,
+            _records(TREE, trees),
+            self._genomes(new_genomes),
+            _records(CREATURE, creatures),
+            _records(FOOD, foods),
+        ))
+
+    def _food_id(self, f):
+        food_id = self._food_ids[f] = self._next_food_id
+        self._next_food_id += 1
+        return food_id
+
+    def delta(self):
+        """Encode the changes since the last message."""
+        world = self.world
+        sent = self._sent
+
+        new_genomes = []
+        births = []
+        for character in self._births:
+            if character.id not in sent:
+                births.append(self._creature(character, new_genomes))
+        del self._births[:]
+        deaths = []
+        for character in self._deaths:
+            if sent.pop(character.id, None) is not None:
+                deaths.append((character.id,))
+            if character.genome not in world.genomes:
+                # the viewer forgets it too, with its last creature
+                self._genome_ids.pop(character.genome.key, None)
+        del self._deaths[:]
+
+        moves = []
+        for character in world.allcharacters:
+            move = self._move(character)
+            if sent.get(character.id) != move:
+                sent[character.id] = move
+                moves.append(move)
+
+        current = world.allfood.spritedict.keys()
+        known = self._food_ids.keys()
+        food_added = [(self._food_id(f), f.rect.x, f.rect.y)
+                      for f in current - known]
+        food_removed = [(self._food_ids.pop(f),) for f in known - current]
+
+        return b''.join((
+            self._header(DELTA),
+            self._genomes(new_genomes),
+            _records(CREATURE, births),
+            _records(ID, deaths),
+            _records(MOVE, moves),
+            _records(FOOD, food_added),
+            _records(ID, food_removed),
+        ))
+
+
+class Streamer(object):
+    """Sends a world's deltas to a viewer through a bounded queue."""
+
+    def __init__(self, world, messages):
+        self.encoder = DeltaEncoder(world)
+        self.messages = messages
+        self.sent = 0
+        self.dropped = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self._started = time.perf_counter()
+
+    def send(self):
+        """Send this tick's message; never blocks."""
+        encoder = self.encoder
+        if self.messages.full():
+            # don't encode what there is no room for
+            self.dropped += 1
+            encoder.resync = True
+            return
+        if encoder.resync:
+            message = encoder.keyframe()
+        else:
+            message = encoder.delta()
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            encoder.resync = True
+            return
+        if encoder.resync:
+            self.keyframes += 1
+            encoder.resync = False
+        self.sent += 1
+        self.bytes += len(message)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started
+        return {
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'keyframes': self.keyframes,
+            'bytes_per_msg': self.bytes // (self.sent or 1),
+            'kbytes_per_sec': round(self.bytes / 1024. / (elapsed or 1), 2),
+        }
+
+
+class DeltaDecoder(object):
+    """Applies messages from a DeltaEncoder to a viewer.
+
+    The viewer is called back with:
+        reset(sizex, sizey, tile_w, tile_h, terrain, trees)
+        add_genome(gid, genome_dict)
+        add_creature(id, gid, x, y, angle, energy, parents)
+        move_creature(id, x, y, angle, energy)
+        remove_creature(id)
+        add_food(food_id, x, y)
+        remove_food(food_id)
+    with positions in world coordinates and angles in radians.
+    """
+
+    def __init__(self, viewer):
+        self.viewer = viewer
+        self.seq = None
+        self.scale = 1.0
+        self.skipped = 0
+        self.latency = 0.0
+        self.tick = 0
+
+    def apply(self, message):
+        """Apply a message; returns False if it was skipped."""
+        kind, seq, tick, sent_at = HEADER.unpack_from(message, 0)
+        offset = HEADER.size
+        if kind == DELTA and (self.seq is None or seq != self.seq + 1):
+            # missed a message, wait for the next keyframe
+            self.skipped += 1
+            self.seq = None
+            return False
+        self.seq = seq
+        self.tick = tick
+        self.latency = time.time() - sent_at
+        viewer = self.viewer
+
+        if kind == KEYFRAME:
+            sizex, sizey, tile_w, tile_h, self.scale = MAP.unpack_from(message, offset)
+            offset += MAP.size
+            terrain = message[offset:offset + sizex * sizey]
+            offset += sizex * sizey
+            trees, offset = self._read(TREE, message, offset)
+            viewer.reset(sizex, sizey, tile_w, tile_h, terrain, trees)
+            offset = self._read_genomes(message, offset)
+            creatures, offset = self._read(CREATURE, message, offset)
+            for c in creatures:
+                viewer.add_creature(*self._creature(c))
+            foods, offset = self._read(FOOD, message, offset)
+            for f in foods:
+                viewer.add_food(*f)
+            return True
+
+        offset = self._read_genomes(message, offset)
+        births, offset = self._read(CREATURE, message, offset)
+        for c in births:
+            viewer.add_creature(*self._creature(c))
+        deaths, offset = self._read(ID, message, offset)
+        for (character_id,) in deaths:
+            viewer.remove_creature(character_id)
+        moves, offset = self._read(MOVE, message, offset)
+        scale = self.scale
+        for character_id, x, y, angle, energy in moves:
+            viewer.move_creature(
+                character_id, x / scale, y / scale, angle / ANGLE_SCALE,
+                energy / ENERGY_SCALE)
+        food_added, offset = self._read(FOOD, message, offset)
+        for f in food_added:
+            viewer.add_food(*f)
+        food_removed, offset = self._read(ID, message, offset)
+        for (food_id,) in food_removed:
+            viewer.remove_food(food_id)
+        return True
+
+    def _creature(self, record):
+        character_id, gid, x, y, angle, energy, parents = record
+        scale = self.scale
+        return (character_id, gid, x / scale, y / scale, angle / ANGLE_SCALE,
+                energy / ENERGY_SCALE, parents)
+
+    def _read(self, record, message, offset):
+        count, = COUNT.unpack_from(message, offset)
+        offset += COUNT.size
+        items = [record.unpack_from(message, offset + i * record.size)
+                 for i in range(count)]
+        return items, offset + count * record.size
+
+    def _read_genomes(self, message, offset):
+        count, = COUNT.unpack_from(message, offset)
+        offset += COUNT.size
+        for i in range(count):
+            gid, length = GENOME.unpack_from(message, offset)
+            offset += GENOME.size
+            data = json.loads(message[offset:offset + length].decode('utf-8'))
+            offset += length
+            self.viewer.add_genome(gid, data)
+        return offset
@@ -0,0 +1,203 @@
+'''sweep.py -- headless parameter sweeps over a process pool.
+
+Runs the simulation once for every combination of the swept Config values
+and every seed, in parallel, stopping each run early once its population
+has collapsed or stabilized, and writes one CSV table of the results:
+
+    python evolutron --sweep mutation_rate=0.005,0.01,0.02 \\
+        --sweep base_cost=5:15:3 --sweep-seeds 4 --sweep-out results.csv
+
+The world keeps its population up with random newcomers, so the
+population that matters here is the creatures born to parents. A run has
+collapsed when, once breeding has started, none has been born for `window`
+ticks, and has stabilized when their number has stayed within `tolerance`
+of a mean above zero for `window` ticks. A run where nobody has bred yet
+goes on until it does or max_ticks is reached.
+'''
+import os
+import sys
+import csv
+import time
+import random
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+
+import headless
+import config as _config
+
+RESULT_FIELDS = (
+    'seed', 'ticks', 'stopped', 'population', 'bred', 'max_bred',
+    'offspring', 'avggen', 'max_gen', 'genomes', 'seconds')
+
+
+def parse_seeds(spec):
+    ''''4' means seeds 0-3; '1,5,9' means those seeds.'''
+    if ',' in spec:
+        return tuple(int(s) for s in spec.split(','))
+    return tuple(range(int(spec)))
+
+
+def build_jobs(base, sweeps, seeds):
+    '''Return a list of (settings, seed), settings being a dict of Config values.'''
+    names = [name for name, values in sweeps]
+    jobs = []
+    for combination in itertools.product(*(values for name, values in sweeps)):
+        settings = dict(base)
+        settings.update(zip(names, combination))
+        for seed in seeds:
+            jobs.append((settings, seed))
+    return jobs
+
+
+def run(settings, seed, max_ticks=5000, warmup=500, window=500,
+        tolerance=0.05, world_w=2000, world_h=2000):
+    '''Run one simulation until it stops; return a dict of RESULT_FIELDS.
+
+    Runs in a pool worker; settings is a dict of Config values.
+    '''
+    screen = headless.init()
+    import window as _window
+
+    t = time.perf_counter()
+    random.seed(seed)
+    win = _window.Window(
+        screen, world_w, world_h, _config.Config(**settings))
+    world = win.world
+
+    # counts of creatures born to parents: ever, and alive now
+    offspring = [0]
+    bred = [0]
+    max_gen = [0]
+    last_offspring = [0]
+    def born(character):
+        if character.parents:
+            offspring[0] += 1
+            bred[0] += 1
+            last_offspring[0] = world.age
+            max_gen[0] = max(max_gen[0], character.gen)
+    def died(character):
+        if character.parents:
+            bred[0] -= 1
+    world.birth_callbacks.append(born)
+    world.death_callbacks.append(died)
+
+    history = collections.deque(maxlen=window)
+    max_bred = 0
+    stopped = 'max_ticks'
+    for tick in range(1, max_ticks + 1):
+        win.update()
+        history.append(bred[0])
+        max_bred = max(max_bred, bred[0])
+        if tick < warmup:
+            continue
+        if offspring[0] and world.age - last_offspring[0] >= window:
+            stopped = 'collapsed'
+            break
+        if len(history) == window:
+            mean = sum(history) / float(window)
+            if mean and max(history) - min(history) <= tolerance * mean:
+                stopped = 'stable'
+                break
+
+    return {
+        'seed': seed,
+        'ticks': tick,
+        'stopped': stopped,
+        'population': world.stats.population,
+        'bred': bred[0],
+        'max_bred': max_bred,
+        'offspring': offspring[0],
+        'avggen': round(world.stats.avggen, 3),
+        'max_gen': max_gen[0],
+        'genomes': len(world.genomes),
+        'seconds': round(time.perf_counter() - t, 2),
+    }
+
+
+def run_all(jobs, workers=None, **options):
+    '''Run the jobs in a process pool; yield (index, result) as they finish.'''
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=headless.init) as pool:
+        futures = dict(
+            (pool.submit(run, settings, seed, **options), i)
+            for i, (settings, seed) in enumerate(jobs))
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+
+def write_table(f, names, jobs, results):
+    '''Write one CSV line per run.'''
+    writer = csv.writer(f)
+    writer.writerow(tuple(names) + RESULT_FIELDS)
+    for (settings, seed), result in zip(jobs, results):
+        writer.writerow(
+            tuple(settings[name] for name in names)
+            + tuple(result[field] for field in RESULT_FIELDS))
+
+
+def write_summary(f, names, jobs, results):
+    '''Write one CSV line per configuration, aggregated over its seeds.'''
+    groups = collections.OrderedDict()
+    for (settings, seed), result in zip(jobs, results):
+        key = tuple(settings[name] for name in names)
+        groups.setdefault(key, []).append(result)
+    writer = csv.writer(f)
+    writer.writerow(tuple(names) + (
+        'runs', 'collapsed', 'stable', 'ticks_mean', 'population_mean',
+        'bred_min', 'bred_mean', 'bred_max', 'offspring_mean', 'avggen_mean',
+        'max_gen'))
+    for key, runs in groups.items():
+        count = float(len(runs))
+        bred = [r['bred'] for r in runs]
+        writer.writerow(key + (
+            len(runs),
+            sum(1 for r in runs if r['stopped'] == 'collapsed'),
+            sum(1 for r in runs if r['stopped'] == 'stable'),
+            sum(r['ticks'] for r in runs) / count,
+            sum(r['population'] for r in runs) / count,
+            min(bred),
+            sum(bred) / count,
+            max(bred),
+            sum(r['offspring'] for r in runs) / count,
+            round(sum(r['avggen'] for r in runs) / count, 3),
+            max(r['max_gen'] for r in runs),
+        ))
+
+
+def main(args):
+    '''args -- parsed ArgumentParser Namespace from real main()'''
+    base = dict(args.set)
+    sweeps = args.sweep # parsed and checked by real main()
+    names = sorted(set(base) | set(name for name, values in sweeps))
+    jobs = build_jobs(base, sweeps, parse_seeds(args.sweep_seeds))
+    workers = args.sweep_jobs or os.cpu_count()
+    print('running %d simulations on %d processes' % (len(jobs), workers),
+          file=sys.stderr)
+
+    t = time.perf_counter()
+    results = [None] * len(jobs)
+    done = 0
+    for i, result in run_all(jobs, workers, max_ticks=args.sweep_ticks):
+        results[i] = result
+        done += 1
+        print('%d/%d seed %d %s after %d ticks' % (
+            done, len(jobs), result['seed'], result['stopped'],
+            result['ticks']), file=sys.stderr)
+    print('finished in %.1fs' % (time.perf_counter() - t), file=sys.stderr)
+
+    if args.sweep_out == '-':
+        out = sys.stdout
+    else:
+        out = open(args.sweep_out, 'w', newline='')
+    try:
+        if args.sweep_summary:
+            write_summary(out, names, jobs, results)
+        else:
+            write_table(out, names, jobs, results)
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -1,3 +1,4 @@
+import math
 import random
 
 import pygame
@@ -6,67 +7,92 @@ from pygame.locals import *
 import group
 import food
 import tree
+import mapgen
+
+# Fill colour of each terrain type, by mapgen terrain code
+COLOURS = {
+    mapgen.MEADOW: (80, 180, 80),
+    mapgen.LAKE: (0, 0, 215),
+    mapgen.FOREST: (0, 120, 0),
+}
+UNKNOWN_COLOUR = (255, 0, 0)
 
 class TileView(pygame.sprite.Sprite):
-    def __init__(self, world, x, y, w, h, tile):
+    def __init__(self, world, x, y, w, h, terrain_code, tree_spec=None):
+        """tree_spec -- (radius, x, y) of the tile's tree, if it has one."""
         pygame.sprite.Sprite.__init__(self)
         self.world = world
         self.x = x
         self.y = y
         self.w = w
         self.h = h
-        self.tile = tile
-        self.max_food = 10
-        self.fertility_mult = 0.5
-        self.colour = (255, 0, 0)
-        if self.tile.terrain == 'meadow':
-            self.fertility_mult = 0.0025
-            self.colour = (80, 180, 80)
-            self.max_food = 2
-        elif self.tile.terrain == 'lake':
-            self.fertility_mult = 0
-            self.colour = (0, 0, 215)
-            self.max_food = 0
-        elif self.tile.terrain == 'forest':
-            self.fertility_mult = 0.005
-            self.colour = (0, 120, 0)
-            self.max_food = 10
-        else:
-            print('unknown terrain type: %r' % self.tile)
-
-        self.image = pygame.Surface((self.w, self.h)).convert()
-        self.image.fill((0,0,255))
-        self.redraw = True
+        self.terrain_code = terrain_code
+        self.terrain = mapgen.TERRAIN_NAMES.get(terrain_code, 'unknown')
+        self.neighbourhood = [] # this and adjacent tiles, set by ChunkStore
+        self.colour = COLOURS.get(self.terrain_code, UNKNOWN_COLOUR)
+        self.fertility_mult, self.max_food = world.config.food(self.terrain_code)
+        self.grown_to = int(world.age) # last tick food has been grown for
 
-        self.rect = self.image.get_rect()
+        self.image = None # created when first drawn
+        self.redraw = True
 
-        self.rect.x = self.x * self.w
-        self.rect.y = self.y * self.h
+        self.rect = Rect(self.x * self.w, self.y * self.h, self.w, self.h)
 
         self.alltrees = group.Group()
         self.allfood = group.Group()
         self.allcharacters = group.Group()
 
-        if tile.terrain == 'forest':
-            t = tree.Tree(
-                self,
-                random.randint(4, 18), # radius
-                random.randint(0, w), # x
-                random.randint(0, h)) # y
+        if tree_spec is not None:
+            t = tree.Tree(self, *tree_spec)
             self.alltrees.add(t)
             world.alltrees.add(t)
 
+    def grow_food(self):
+        f = food.Food(
+            self, random.randint(0, self.w), random.randint(0, self.h))
+        self.allfood.add(f)
+        self.world.allfood.add(f)
+        self.world.density.grew(self)
 
-    def update(self):
-        # create some food
-        if len(self.allfood) < self.max_food:
-            if random.random() < self.fertility_mult:
-                f = food.Food(
-                    self, random.randint(0, self.w), random.randint(0, self.h))
-                self.allfood.add(f)
-                self.world.allfood.add(f)
+    def food_grown(self, ticks):
+        """Return how much food would grow in the given number of ticks.
+
+        Each tick grows one food with probability fertility_mult until the
+        tile is full, so this is a binomial draw capped at the room left,
+        made by skipping geometrically distributed gaps between growths.
+        """
+        room = self.max_food - len(self.allfood)
+        p = self.fertility_mult
+        if ticks <= 0 or room <= 0 or p <= 0:
+            return 0
+        if p >= 1:
+            return min(ticks, room)
+        log_q = math.log(1 - p)
+        grown = 0
+        tick = 0
+        while grown < room:
+            tick += int(math.log(1 - random.random()) / log_q) + 1
+            if tick > ticks:
+                break
+            grown += 1
+        return grown
+
+    def update(self, age):
+        """Grow food for every tick since the last update, up to age."""
+        ticks = age - self.grown_to
+        self.grown_to = age
+        if ticks == 1:
+            if len(self.allfood) < self.max_food:
+                if random.random() < self.fertility_mult:
+                    self.grow_food()
+            return
+        for n in range(self.food_grown(ticks)):
+            self.grow_food()
 
     def draw(self):
+        if self.image is None:
+            self.image = pygame.Surface((self.w, self.h)).convert()
+            self.redraw = True
         if not self.redraw:
             return
         self.redraw = False
@@ -81,6 +107,6 @@ class TileView(pygame.sprite.Sprite):
     def __str__(self):
         return '\n'.join([
             'Tile:',
-            'terrain: %s' % self.tile.terrain,
+            'terrain: %s' % self.terrain,
         ])
 
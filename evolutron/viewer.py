@@ -0,0 +1,183 @@
+'''viewer.py -- draws a simulation running in another process.
+
+Started by `python evolutron --stream-viewer`, which runs the simulation in this
+process's parent and streams its deltas here (see stream.py). The viewer
+reuses the simulation's Tree, Food and Character drawing code, and may fall
+behind: it applies whatever messages have arrived and then draws once.
+'''
+import time
+import queue
+
+import pygame
+from pygame.locals import *
+
+import viewport
+import characters
+import config
+import genome
+import genomestore
+import food
+import tree
+import tiles
+import stream
+
+
+class _Tile(object):
+    """Stands in for the TileView that Food and Tree are positioned in."""
+
+    def __init__(self, world):
+        self.world = world
+        self.rect = Rect(0, 0, 0, 0)
+
+
+class ViewerWorld(viewport.Viewport):
+    """A WorldView look-alike fed by a stream.DeltaDecoder."""
+
+    def __init__(self, parent, viewport_rect, canvas_w, canvas_h):
+        super(ViewerWorld, self).__init__(
+            parent, viewport_rect, canvas_w, canvas_h)
+        self.background = None
+        self.active_item = None
+        self.age = 0 # tick of the last message applied
+        self.config = config.Config() # read by Character.load_genome()
+        self.genomes = genomestore.GenomeStore()
+        self._genomes = {} # genome id -> Genome, of living creatures
+        self._creature_gids = {} # creature id -> genome id
+        self.characters = {} # id -> Character
+        self.foods = {} # food id -> Food
+        self.trees = []
+        self._tile = _Tile(self)
+
+    # DeltaDecoder callbacks:
+
+    def reset(self, sizex, sizey, tile_w, tile_h, terrain, trees):
+        self.background = pygame.Surface(
+            (sizex * tile_w, sizey * tile_h)).convert()
+        for i in range(sizex):
+            for j in range(sizey):
+                colour = tiles.COLOURS.get(terrain[i * sizey + j],
+                                           tiles.UNKNOWN_COLOUR)
+                self.background.fill(
+                    colour, (i * tile_w, j * tile_h, tile_w, tile_h))
+        self.trees = [tree.Tree(self._tile, r, x, y) for x, y, r in trees]
+        for character in self.characters.values():
+            self.genomes.release(character.genome)
+        self.characters.clear()
+        self.foods.clear()
+        self._genomes.clear()
+        self._creature_gids.clear()
+
+    def add_genome(self, gid, obj):
+        self._genomes[gid] = genome.Genome.load(
+            obj, characters.Character.brain_inputs,
+            characters.Character.brain_outputs)
+
+    def add_creature(self, character_id, gid, x, y, angle, energy, parents):
+        character = characters.Character.from_genome(self, self._genomes[gid])
+        character.id = character_id
+        character.parents = parents
+        self.characters[character_id] = character
+        self._creature_gids[character_id] = gid
+        self.move_creature(character_id, x, y, angle, energy)
+
+    def move_creature(self, character_id, x, y, angle, energy):
+        character = self.characters[character_id]
+        character.set_midpoint_x(x)
+        character.set_midpoint_y(y)
+        character.angle = angle
+        character.energy = energy
+
+    def remove_creature(self, character_id):
+        character = self.characters.pop(character_id)
+        gid = self._creature_gids.pop(character_id)
+        self.genomes.release(character.genome)
+        if character.genome not in self.genomes:
+            del self._genomes[gid]
+
+    def add_food(self, food_id, x, y):
+        self.foods[food_id] = food.Food(self._tile, x, y)
+
+    def remove_food(self, food_id):
+        del self.foods[food_id]
+
+    def draw(self):
+        if self.background is None:
+            return
+        canvas = self.canvas
+        canvas.blit(self.background, (0, 0))
+        for group in (self.foods.values(), self.characters.values(), self.trees):
+            for sprite in group:
+                sprite.draw()
+                canvas.blit(sprite.image, sprite.rect)
+        self.image.blit(canvas, self.drag_offset)
+
+
+def main(messages, screen_size=(1280, 720), framerate=1/60.):
+    '''Run the viewer, reading stream messages from the messages queue.'''
+    pygame.init()
+    screen = pygame.display.set_mode(screen_size, RESIZABLE)
+    pygame.display.set_caption('Evolutron viewer')
+    font = pygame.font.Font(None, 18)
+
+    world = None
+    decoder = None
+    received = 0 # bytes in the last second, for the bandwidth figure
+    bandwidth = 0
+    second = time.perf_counter()
+    mousedown_pos = None
+    while 1:
+        frame_start = time.perf_counter()
+
+        # apply everything that has arrived, then draw once
+        while True:
+            try:
+                message = messages.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                return
+            received += len(message)
+            if world is None:
+                # the first message is always a keyframe
+                sizex, sizey, tile_w, tile_h, scale = stream.MAP.unpack_from(
+                    message, stream.HEADER.size)
+                world = ViewerWorld(None, Rect((0, 0), screen.get_size()),
+                                    sizex * tile_w, sizey * tile_h)
+                decoder = stream.DeltaDecoder(world)
+            decoder.apply(message)
+            world.age = decoder.tick
+
+        now = time.perf_counter()
+        if now - second >= 1:
+            bandwidth = received / (now - second)
+            received = 0
+            second = now
+
+        screen.fill((128, 128, 128))
+        if world is not None:
+            world.draw()
+            screen.blit(world.image, (0, 0))
+            status = 'tick %d  latency %.1fms  %.1fKB/s  skipped %d' % (
+                decoder.tick, decoder.latency * 1000, bandwidth / 1024.,
+                decoder.skipped)
+            screen.blit(font.render(status, True, (255, 255, 255)), (5, 5))
+        pygame.display.flip()
+
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                return
+            elif event.type == KEYDOWN:
+                if event.key == K_ESCAPE or event.key == K_q:
+                    return
+            elif event.type == VIDEORESIZE and world is not None:
+                screen = pygame.display.set_mode(event.dict['size'], RESIZABLE)
+                world.resize(Rect((0, 0), event.dict['size']))
+            elif event.type == MOUSEBUTTONDOWN:
+                mousedown_pos = event.dict['pos']
+            elif event.type == MOUSEBUTTONUP:
+                mousedown_pos = None
+            elif event.type == MOUSEMOTION and mousedown_pos is not None \
+            and world is not None:
+                world.ondrag(event.dict['rel'])
+
+        time.sleep(max(0, framerate - (time.perf_counter() - frame_start)))
@@ -7,11 +7,16 @@ import worldview
 import infopane
 import brainview
 import popview
+import minimap
+
+MINIMAP_HEIGHT = 150
+MIN_MINIMAP_HEIGHT = 50
+MIN_BRAINVIEW_HEIGHT = 200
 
 class Window(object):
     """Logical representation of the application window."""
 
-    def __init__(self, screen, world_w, world_h):
+    def __init__(self, screen, world_w, world_h, config=None):
 
         self.screen = screen
         screen_w, screen_h = screen.get_size()
@@ -20,17 +25,22 @@ class Window(object):
         self.allsprites = group.Group()
 
         self.world = worldview.WorldView(
-            self, Rect(200, 0, screen_w - 200, screen_h), world_w, world_h)
+            self, Rect(200, 0, screen_w - 200, screen_h), world_w, world_h,
+            config)
         self.allsprites.add(self.world)
 
         self.infopane = infopane.InfoPane(self, Rect(0, 0, 200, 50))
         self.allsprites.add(self.infopane)
 
-        brainview_height = screen_h - 50 - 300 - 50
+        brainview_height, minimap_height = self._split(screen_h - 50 - 300 - 50)
         self.brainview = brainview.BrainView(
             self, Rect(0, 50, 200, brainview_height))
         self.allsprites.add(self.brainview)
 
+        self.minimap = minimap.MiniMap(
+            self, Rect(0, 50 + brainview_height, 200, minimap_height))
+        self._show_minimap(minimap_height)
+
         self.genesview = popview.GenePopView(
             self, Rect(0, screen_h - 350, 200, 300))
         self.allsprites.add(self.genesview)
@@ -43,10 +53,30 @@ class Window(object):
         self.background = pygame.Surface(self.screen.get_size()).convert()
         if hasattr(self, 'world'):
             self.world.resize(Rect(200, 0, window_w - 200, window_h))
-            self.brainview.resize(Rect(0, 150, 200, window_h - 150 - 200 - 100))
+            brainview_h, minimap_h = self._split(window_h - 150 - 200 - 100)
+            self.brainview.resize(Rect(0, 150, 200, brainview_h))
+            self.minimap.resize(Rect(0, 150 + brainview_h, 200, minimap_h))
+            self._show_minimap(minimap_h)
             self.genesview.resize(Rect(0, window_h - 300, 200, 200))
             self.popview.resize(Rect(0, window_h - 100, 200, 100))
 
+    def _split(self, height):
+        '''Share height between the brain view and the minimap below it.
+
+        The minimap only gets what the brain view can spare, and is hidden
+        (given no height) when that is too little to be of use.
+        '''
+        minimap_h = min(MINIMAP_HEIGHT, height - MIN_BRAINVIEW_HEIGHT)
+        if minimap_h < MIN_MINIMAP_HEIGHT:
+            minimap_h = 0
+        return max(1, height - minimap_h), minimap_h
+
+    def _show_minimap(self, height):
+        if height:
+            self.allsprites.add(self.minimap)
+        else:
+            self.allsprites.remove(self.minimap)
+
     def update(self):
         self.world.update()
 
@@ -1,3 +1,4 @@
+import time
 import random
 
 import pygame
@@ -8,36 +9,73 @@ import tiles
 import characters
 import group
 import tree
-import mapgen
-
-MIN_CHARACTERS = 150
+import chunks
+import density
+import events
+import genomestore
+import history
+import species
+import config as _config
 
 class WorldView(viewport.Viewport):
-    def __init__(self, parent, viewport_rect, canvas_w, canvas_h):
-        super(WorldView, self).__init__(parent, viewport_rect, canvas_w, canvas_h)
+    def __init__(self, parent, viewport_rect, canvas_w, canvas_h, config=None):
+        super(WorldView, self).__init__(
+            parent, viewport_rect, viewport_rect.w, viewport_rect.h)
+        self.config = config if config is not None else _config.Config()
 
+        self.world_w = canvas_w
+        self.world_h = canvas_h
         self.tile_w = 50
         self.tile_h = 50
-        self.map = mapgen.Map.from_random(canvas_w//self.tile_w, canvas_h//self.tile_h)
 
-        self.alltiles = group.Group(self)
+        self.alltiles = group.Group(self) # loaded tiles only
         self.alltiles_coords = {}
 
         self.alltrees = group.Group(self)
         self.allfood = group.Group(self)
 
-        # Generate tiles and trees
-        for i, row in enumerate(self.map):
-            for j, tile in enumerate(row):
-
-                block = tiles.TileView(
-                    self, i, j, self.tile_w, self.tile_h, tile)
-                self.alltiles.add(block)
-                self.alltiles_coords[i, j] = block
+        self.chunks = chunks.ChunkStore(
+            self, canvas_w // self.tile_w, canvas_h // self.tile_h,
+            self.config.chunk_tiles, self.config.max_chunks)
+        self.chunks.generate()
 
         self.allcharacters = group.Group(self)
+        self.genomes = genomestore.GenomeStore()
+        # called with each character as it is added to or removed from
+        # allcharacters, for views that keep incremental state
+        self.birth_callbacks = []
+        self.death_callbacks = []
+        self.stats = history.PopulationStats()
+        self.birth_callbacks.append(self.stats.born)
+        self.death_callbacks.append(self.stats.died)
+        self.species = species.SpeciesTracker()
+        self.birth_callbacks.append(self.species.born)
+        self.death_callbacks.append(self.species.died)
+        self.density = density.DensityGrid(self) # for the minimap
         self.active_item = None
+        self._info_key = None
         self.age = 0.0
+        self.next_id = 0
+        # seconds spent in each part of the last update()
+        self.phase_times = {}
+        # tiles updated and characters that were idle in the last update()
+        self.lod_counts = {}
+        self.events = events.TickEvents() # applied by commit()
+        self.event_counts = {} # what the last commit() applied
+
+    # The canvas only covers the viewport; the world is drawn onto it offset
+    # by drag_offset.
+    @property
+    def canvas_w(self):
+        return self.world_w
+
+    @property
+    def canvas_h(self):
+        return self.world_h
+
+    def resize(self, viewport_rect):
+        super(WorldView, self).resize(viewport_rect)
+        self.canvas = pygame.Surface(viewport_rect.size).convert()
 
     def _create_character(self):
         character = characters.Character.from_random(self)
@@ -48,23 +86,131 @@ class WorldView(viewport.Viewport):
             y = random.randint(character.r, self.canvas_h - character.r)
             character.set_midpoint_x(x)
             character.set_midpoint_y(y)
-        self.allcharacters.add(character)
+            self.chunks.require_around(x, y)
+        self.add_character(character)
         # debugging:
         if self.active_item is None:
             self.active_item = character
             self.parent.brainview.brain = character.brain
 
+    def add_character(self, character):
+        character.id = self.next_id
+        self.next_id += 1
+        self.allcharacters.add(character)
+        for callback in self.birth_callbacks:
+            callback(character)
+
+    def remove_character(self, character):
+        self.allcharacters.remove(character)
+        for callback in self.death_callbacks:
+            callback(character)
+
+    def commit(self):
+        """Apply the food eaten, deaths and births recorded in self.events,
+        in that order."""
+        events = self.events
+        for food in events.food:
+            food.eaten()
+        for character in events.deaths:
+            self.genomes.release(character.genome)
+            self.remove_character(character)
+            if self.active_item is character:
+                self.active_item = None
+            if character.tile:
+                character.tile.allcharacters.remove(character)
+        for character in events.births:
+            self.add_character(character)
+        self.event_counts = events.counts()
+        events.clear()
+
     def update(self):
+        t0 = time.perf_counter()
+        self.prepare()
+        self.phase_times['tiles'] = time.perf_counter() - t0
+        self.step()
+
+    def prepare(self):
+        """Start a tick: top up the population, page chunks in and out, and
+        grow food.
+
+        Everything random about a tick happens here, apart from the genomes
+        of offspring; what step() does with the result is specified by
+        reference.py.
+        """
         self.age += 1
-        while len(self.allcharacters) < MIN_CHARACTERS:
+        while len(self.allcharacters) < self.config.min_characters:
             self._create_character()
-        self.alltiles.update()
+        # page in the tiles every character can sense, page out the rest
+        coords = self.alltiles_coords
+        tile_w, tile_h = self.tile_w, self.tile_h
+        near = []
+        if self.chunks.resident:
+            for character in self.allcharacters.spritedict:
+                near.append((int(character.midx // tile_w),
+                             int(character.midy // tile_h)))
+        else:
+            require_around = self.chunks.require_around
+            for character in self.allcharacters:
+                x, y = character.midx, character.midy
+                require_around(x, y)
+                near.append((int(x // tile_w), int(y // tile_h)))
+            self.chunks.evict()
+
+        # tiles a character can sense grow food every tick; quiet tiles only
+        # every tile_lod_interval ticks, catching up on the ticks in between
+        age = int(self.age)
+        active = {} # ordered, to keep runs repeatable
+        for coord in near:
+            tile = coords.get(coord)
+            if tile is not None:
+                for neighbour in tile.neighbourhood:
+                    active[neighbour] = None
+        for tile in active:
+            tile.update(age)
+        interval = self.config.tile_lod_interval
+        quiet = 0
+        loaded = self.chunks.loaded
+        # in position order, so that paging doesn't change what food grows
+        for key in sorted(loaded):
+            chunk = loaded[key]
+            if (age - chunk.phase) % interval == 0:
+                for tile in chunk.tiles:
+                    if tile not in active:
+                        tile.update(age)
+                        quiet += 1
+        self.lod_counts['active_tiles'] = len(active)
+        self.lod_counts['quiet_tiles'] = quiet
+
+    def step(self):
+        """Finish a tick: every character senses, then acts, then collides,
+        and then the births and deaths are committed."""
+        phase_times = self.phase_times
+        t1 = time.perf_counter()
+        idle = self.allcharacters.sense()
+        t2 = time.perf_counter()
+        aged = len(self.allcharacters)
         self.allcharacters.update()
+        t3 = time.perf_counter()
         self.allcharacters.collisions()
+        t4 = time.perf_counter()
+        self.commit()
+        self.stats.tick(int(self.age), aged)
+        self.species.tick(int(self.age))
+        t5 = time.perf_counter()
+        phase_times['sense'] = t2 - t1
+        phase_times['characters'] = t3 - t2
+        phase_times['collisions'] = t4 - t3
+        phase_times['commit'] = t5 - t4
+        self.lod_counts['idle_characters'] = idle
 
     def jump_to(self, item):
-        x = item.rect.x - self.rect.w // 2
-        y = item.rect.y - self.rect.h // 2
+        """Centre the view on item, a sprite or a world position (x, y)."""
+        if isinstance(item, tuple):
+            x, y = item
+        else:
+            x, y = item.rect.x, item.rect.y
+        x = int(x) - self.rect.w // 2
+        y = int(y) - self.rect.h // 2
         if x < 0:
             x = 0
         if y < 0:
@@ -77,32 +223,47 @@ class WorldView(viewport.Viewport):
         self.drag_offset[1] = -y
 
     def draw(self):
-        for group in (self.alltiles, self.allfood, self.allcharacters, self.alltrees):
-            group.draw(self.canvas)
+        canvas = self.canvas
+        canvas.fill((0, 0, 0))
+        view = Rect((-self.drag_offset[0], -self.drag_offset[1]), self.rect.size)
+        offset = self.drag_offset
+        # trees and food can overhang the edge of their tile
+        visible = [tile for chunk in self.chunks.require_rect(
+                       view.inflate(2 * self.tile_w, 2 * self.tile_h))
+                   for tile in chunk.tiles]
+        sprites = (
+            visible,
+            [f for tile in visible for f in tile.allfood],
+            self.allcharacters,
+            [t for tile in visible for t in tile.alltrees])
+        for group in sprites:
+            for sprite in group:
+                if sprite.rect.colliderect(view):
+                    sprite.draw()
+                    canvas.blit(sprite.image, sprite.rect.move(offset))
 
-        if self.active_item:
-            self.parent.infopane.text = str(self.active_item)
-        else:
-            self.parent.infopane.text = ''
+        # only rebuild the info text when what it shows has changed
+        item = self.active_item
+        info_key = getattr(item, 'info_key', None)
+        info_key = item, info_key and info_key()
+        if info_key != self._info_key:
+            self._info_key = info_key
+            self.parent.infopane.text = str(item) if item else ''
 
-        self.image.blit(self.canvas, self.drag_offset)
+        self.image.blit(canvas, (0, 0))
 
     def onclick(self, relpos, button):
         if button == 1:
-            canvas_pos = [relpos[i] - self.drag_offset[i] for i in (0, 1)]
-            clicked_sprites = []
-            if not clicked_sprites:
-                clicked_sprites = [s for s in self.allcharacters.spritedict
-                                   if s.rect.collidepoint(canvas_pos)]
-            if not clicked_sprites:
-                clicked_sprites = [s for s in self.alltiles.spritedict
-                                   if s.rect.collidepoint(canvas_pos)]
-
-            if clicked_sprites:
+            x, y = [relpos[i] - self.drag_offset[i] for i in (0, 1)]
+            clicked = self.character_at(x, y)
+            if clicked is None:
+                clicked = self.tile_at(x, y)
+
+            if clicked is not None:
                 if self.active_item is not None \
-                and self.active_item is not clicked_sprites[0]:
+                and self.active_item is not clicked:
                     self.active_item.redraw = True
-                self.active_item = clicked_sprites[0]
+                self.active_item = clicked
                 self.active_item.redraw = True
                 if hasattr(self.active_item, 'brain'):
                     self.parent.brainview.brain = self.active_item.brain
@@ -110,6 +271,36 @@ class WorldView(viewport.Viewport):
                     self.parent.brainview.brain = None
                 return
 
+        self.deselect()
+
+    def tile_at(self, x, y):
+        """Return the loaded tile at world position (x, y), or None."""
+        return self.alltiles_coords.get(
+            (int(x // self.tile_w), int(y // self.tile_h)))
+
+    def character_at(self, x, y):
+        """Return the creature at world position (x, y), or None.
+
+        Only the creatures in the tiles around (x, y) are looked at, so this
+        takes as long with a million creatures as with a hundred. If several
+        overlap there, the one whose middle is nearest wins.
+        """
+        tile = self.tile_at(x, y)
+        if tile is None:
+            return None
+        found = None
+        nearest = None
+        for neighbour in tile.neighbourhood:
+            for character in neighbour.allcharacters.spritedict:
+                if character.rect.collidepoint(x, y):
+                    distance = ((character.midx - x) ** 2
+                                + (character.midy - y) ** 2)
+                    if nearest is None or distance < nearest:
+                        found = character
+                        nearest = distance
+        return found
+
+    def deselect(self):
         self.parent.brainview.brain = None
         if self.active_item:
             self.active_item.redraw = True
@@ -100,31 +100,31 @@ class Window():
         self.B = random.randint(0, self.w), random.randint(0, self.h)
         self.C = random.randint(0, self.w), random.randint(0, self.h)
 
-flags = RESIZABLE
-pygame.init()
-screen = pygame.display.set_mode((1280, 720), flags, 32)
-window = Window(screen)
-
-while 1:
-    time.sleep(0.1)
+if __name__ == '__main__':
+    flags = RESIZABLE
+    pygame.init()
+    screen = pygame.display.set_mode((1280, 720), flags, 32)
+    window = Window(screen)
+
+    while 1:
+        time.sleep(0.1)
     
-    window.update()
-    window.frame()
-
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            sys.exit()
-        elif event.type == MOUSEBUTTONDOWN:
-            mousedown_pos = event.dict['pos']
-            button = event.dict['button'] #1/2/3=left/middle/right, 4/5=wheel
-            window.onmousedown(mousedown_pos, button)
-        elif event.type == MOUSEBUTTONUP:
-            pos = event.dict['pos']
-            button = event.dict['button'] #1/2/3=left/middle/right, 4/5=wheel
-            window.onmouseup(pos, button)
-        elif event.type == KEYDOWN:
-            if event.key == K_ESCAPE or event.key == K_q:
-                sys.exit()
-            elif event.key  == K_r:
-                window.triangle()
+        window.update()
+        window.frame()
 
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                sys.exit()
+            elif event.type == MOUSEBUTTONDOWN:
+                mousedown_pos = event.dict['pos']
+                button = event.dict['button'] #1/2/3=left/middle/right, 4/5=wheel
+                window.onmousedown(mousedown_pos, button)
+            elif event.type == MOUSEBUTTONUP:
+                pos = event.dict['pos']
+                button = event.dict['button'] #1/2/3=left/middle/right, 4/5=wheel
+                window.onmouseup(pos, button)
+            elif event.type == KEYDOWN:
+                if event.key == K_ESCAPE or event.key == K_q:
+                    sys.exit()
+                elif event.key  == K_r:
+                    window.triangle()
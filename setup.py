@@ -0,0 +1,44 @@
+"""Build the Cython extensions in place:
+
+    python setup.py build_ext --inplace
+
+Set EVOLUTRON_PROFILE=1 to build with profiling hooks for cProfile.
+"""
+import os
+import sys
+
+from setuptools import setup, Extension
+from Cython.Build import cythonize
+
+EXTENSIONS = ('sprite', 'geometry', 'neuron', 'characters', 'group')
+
+profile = bool(os.environ.get('EVOLUTRON_PROFILE'))
+
+extra_compile_args = []
+if sys.platform != 'win32':
+    extra_compile_args = ['-O3']
+
+extensions = [
+    Extension(name, ['evolutron/%s.pyx' % name],
+              extra_compile_args=extra_compile_args)
+    for name in EXTENSIONS
+]
+
+setup(
+    name='evolutron',
+    description='An evolution simulator featuring neural networks',
+    license='MIT',
+    python_requires='>=3.3',
+    install_requires=['pygame'],
+    # The modules import each other as top-level modules, so the extensions
+    # are built next to them in evolutron/.
+    package_dir={'': 'evolutron'},
+    ext_modules=cythonize(
+        extensions,
+        include_path=['evolutron'],
+        compiler_directives={
+            'profile': profile,
+            'linetrace': False,
+        },
+    ),
+)